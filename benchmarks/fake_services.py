@@ -0,0 +1,335 @@
+"""
+Local Stand-ins for Gemini, Apify and Twitter
+
+Small HTTP servers that answer the calls the pipeline makes, so it can be
+benchmarked without paid API traffic:
+- Gemini:  POST /v1beta/models/{model}:generateContent (structured analysis output)
+- Apify:   POST /v2/acts/{actor}/runs, GET /v2/actor-runs/{id}, GET /v2/datasets/{id}/items
+- Twitter: GET /2/tweets/search/recent
+
+Every service takes a latency distribution and an error rate. Latencies are
+given in milliseconds:
+    fixed:50            always 50ms
+    uniform:20:200      uniform between 20 and 200ms
+    lognormal:300:2000  median 300ms, p99 2000ms (the usual LLM shape)
+
+Generated posts mention the configured product and are drawn from a small set
+of templates, so the relevance filter keeps most of them and similar-ticket
+matching finds real duplicates. A NOISE_RATE share is off-topic.
+
+Usage:
+    python3 benchmarks/fake_services.py --gemini-latency lognormal:300:2000 --gemini-errors 0.02
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PRODUCT_NAME = "Acme"
+NOISE_RATE = 0.1
+
+TEMPLATES = [
+    "{p} crashes every time I try to log in on Android",
+    "{p} sync has been broken since the last update, my files are gone",
+    "Is there a way to export {p} reports to CSV?",
+    "How do I reset my password in {p}? Can't find it in settings",
+    "Would love dark mode in {p}, my eyes hurt at night",
+    "{p} billing charged me twice this month, need a refund",
+    "Honestly {p} support answered in 5 minutes, great job",
+    "Oh great, another {p} update that broke notifications. Quality work as always",
+    "{p} is so slow loading the dashboard today, takes a minute",
+    "Can you add a Zapier integration to {p}? Would save us hours",
+]
+NOISE = [
+    "Anyone watching the game tonight?",
+    "Best pizza place downtown, go.",
+    "My cat knocked the plant over again",
+]
+USERS = ["alex", "sam", "jordan", "riley", "casey", "morgan", "taylor", "jamie"]
+
+_ids = itertools.count(1)
+
+
+class Latency:
+    """A latency distribution parsed from 'fixed:MS', 'uniform:LO:HI' or 'lognormal:P50:P99'."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, *values = spec.split(":")
+        values = [float(v) / 1000 for v in values]
+        if kind == "fixed" and len(values) == 1:
+            self.sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self.sample = lambda: random.uniform(*values)
+        elif kind == "lognormal" and len(values) == 2:
+            # p99 of a lognormal is exp(mu + 2.326 sigma)
+            mu = math.log(values[0])
+            sigma = max(math.log(values[1] / values[0]) / 2.326, 0.0)
+            self.sample = lambda: random.lognormvariate(mu, sigma)
+        else:
+            raise ValueError(f"Invalid latency spec: {spec}")
+
+    def __repr__(self):
+        return self.spec
+
+
+def make_post_text(rng: random.Random, product_name: str = PRODUCT_NAME) -> str:
+    if rng.random() < NOISE_RATE:
+        return rng.choice(NOISE)
+    return rng.choice(TEMPLATES).format(p=product_name)
+
+
+class FakeService:
+    """One threaded HTTP server with a shared latency/error model and request counters."""
+
+    name = "service"
+
+    def __init__(self, latency: str = "fixed:0", error_rate: float = 0.0, error_status: int = 503):
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                service._dispatch(self, "GET")
+
+            def do_POST(self):
+                service._dispatch(self, "POST")
+
+            def do_PATCH(self):
+                service._dispatch(self, "PATCH")
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "latency": repr(self.latency), "error_rate": self.error_rate}
+
+    def _dispatch(self, handler, method: str):
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        url = urlparse(handler.path)
+
+        time.sleep(self.latency.sample())
+        with self.lock:
+            self.requests += 1
+            failed = random.random() < self.error_rate
+            self.errors += failed
+
+        if failed:
+            self._send(handler, self.error_status, {"error": {"code": self.error_status, "message": "injected failure"}})
+            return
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = {}
+        status, data = self.handle(method, url.path, parse_qs(url.query), payload)
+        self._send(handler, status, data)
+
+    def _send(self, handler, status: int, data):
+        encoded = json.dumps(data).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(encoded)))
+        handler.end_headers()
+        handler.wfile.write(encoded)
+
+    def handle(self, method: str, path: str, query: dict, payload: dict):
+        raise NotImplementedError
+
+
+class FakeGemini(FakeService):
+    """generateContent returning the compact structured analysis llm_classifier asks for."""
+
+    name = "gemini"
+
+    def handle(self, method, path, query, payload):
+        if method != "POST" or not path.endswith(":generateContent"):
+            return 404, {"error": {"code": 404, "message": f"{path} not found"}}
+
+        text = "".join(
+            part.get("text", "")
+            for content in payload.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        post = text.split('Content: "', 1)[-1].rstrip('"')
+        # Same post, same labels
+        rng = random.Random(hashlib.sha1(post.encode()).hexdigest())
+        relevant = post not in NOISE
+        compact = {
+            "s": rng.choice("pnnu"),
+            "x": rng.random() < 0.1,
+            "i": rng.choice("cqpfg"),
+            "u": rng.choice("hmml"),
+            "t": rng.choice("BFQ") if relevant else "X",
+            "m": " ".join(post.split()[:20]) or "Empty post",
+            "c": round(rng.uniform(0.5, 1.0), 2),
+        }
+        prompt_tokens = len(text) // 4
+        return 200, {
+            "candidates": [{"content": {"parts": [{"text": json.dumps(compact)}]}}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": 40, "totalTokenCount": prompt_tokens + 40},
+        }
+
+
+class FakeApify(FakeService):
+    """Actor runs that succeed immediately, with generated Reddit items as the dataset."""
+
+    name = "apify"
+
+    def __init__(self, *args, product_name: str = PRODUCT_NAME, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.product_name = product_name
+        self.datasets = {}
+
+    def handle(self, method, path, query, payload):
+        parts = path.strip("/").split("/")
+        if method == "POST" and parts[-1] == "runs" and "acts" in parts:
+            run_id = f"run{next(_ids)}"
+            with self.lock:
+                self.datasets[f"ds-{run_id}"] = int(payload.get("maxItems", 10))
+            return 201, {"data": {"id": run_id, "status": "RUNNING", "defaultDatasetId": f"ds-{run_id}"}}
+        if method == "GET" and "actor-runs" in parts:
+            return 200, {"data": {"id": parts[-1], "status": "SUCCEEDED", "defaultDatasetId": f"ds-{parts[-1]}"}}
+        if method == "GET" and parts[-1] == "items" and "datasets" in parts:
+            with self.lock:
+                count = self.datasets.pop(parts[-2], 0)
+            return 200, [self._item() for _ in range(count)]
+        return 404, {"error": {"type": "record-not-found"}}
+
+    def _item(self) -> dict:
+        post_id = next(_ids)
+        rng = random.Random(post_id)
+        created = datetime.now(timezone.utc) - timedelta(minutes=rng.randint(1, 120))
+        return {
+            "id": f"bench{post_id}",
+            "title": make_post_text(rng, self.product_name),
+            "body": "",
+            "author": rng.choice(USERS),
+            "url": f"https://reddit.com/r/bench/{post_id}",
+            "createdAt": created.isoformat(),
+        }
+
+
+class FakeTwitter(FakeService):
+    """Recent search returning max_results generated tweets."""
+
+    name = "twitter"
+
+    def __init__(self, *args, product_name: str = PRODUCT_NAME, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.product_name = product_name
+
+    def handle(self, method, path, query, payload):
+        if method != "GET" or not path.endswith("/tweets/search/recent"):
+            return 404, {"title": "Not Found"}
+        count = int(query.get("max_results", ["10"])[0])
+        tweets, users = [], {}
+        for _ in range(count):
+            tweet_id = next(_ids)
+            rng = random.Random(tweet_id)
+            author = rng.choice(USERS)
+            users[author] = {"id": author, "username": author, "name": author.title()}
+            tweets.append({
+                "id": str(tweet_id),
+                "text": make_post_text(rng, self.product_name),
+                "author_id": author,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "lang": "en",
+            })
+        return 200, {"data": tweets, "includes": {"users": list(users.values())}, "meta": {"result_count": count}}
+
+
+def start_all(gemini_latency="lognormal:300:2000", gemini_errors=0.0,
+              apify_latency="uniform:200:800", apify_errors=0.0,
+              twitter_latency="uniform:100:400", twitter_errors=0.0,
+              product_name: str = PRODUCT_NAME) -> dict:
+    """
+    Start all three stand-ins on free ports.
+
+    Returns:
+        {"gemini": FakeGemini, "apify": FakeApify, "twitter": FakeTwitter}, started
+    """
+    services = {
+        "gemini": FakeGemini(gemini_latency, gemini_errors),
+        "apify": FakeApify(apify_latency, apify_errors, product_name=product_name),
+        "twitter": FakeTwitter(twitter_latency, twitter_errors, error_status=429, product_name=product_name),
+    }
+    for service in services.values():
+        service.start()
+    return services
+
+
+def service_env(services: dict) -> dict:
+    """Environment that points the pipeline's API clients at the stand-ins."""
+    return {
+        "GEMINI_API_BASE": f"{services['gemini'].url}/v1beta",
+        "APIFY_API_URL": f"{services['apify'].url}/v2",
+        "TWITTER_API_URL": f"{services['twitter'].url}/2",
+    }
+
+
+def add_service_args(parser):
+    parser.add_argument("--gemini-latency", default="lognormal:300:2000", help="Gemini latency spec in ms (default: lognormal:300:2000)")
+    parser.add_argument("--gemini-errors", type=float, default=0.0, help="Share of Gemini calls answered with 503")
+    parser.add_argument("--apify-latency", default="uniform:200:800", help="Apify latency spec in ms (default: uniform:200:800)")
+    parser.add_argument("--apify-errors", type=float, default=0.0, help="Share of Apify calls answered with 503")
+    parser.add_argument("--twitter-latency", default="uniform:100:400", help="Twitter latency spec in ms (default: uniform:100:400)")
+    parser.add_argument("--twitter-errors", type=float, default=0.0, help="Share of Twitter calls answered with 429")
+
+
+def start_from_args(args, product_name: str = PRODUCT_NAME) -> dict:
+    return start_all(
+        args.gemini_latency, args.gemini_errors,
+        args.apify_latency, args.apify_errors,
+        args.twitter_latency, args.twitter_errors,
+        product_name=product_name,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local Gemini/Apify/Twitter stand-ins")
+    add_service_args(parser)
+    args = parser.parse_args()
+
+    services = start_from_args(args)
+    for name, value in service_env(services).items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -11,6 +11,7 @@ export default function DashboardPage() {
     const [stats, setStats] = useState({ total: 0, open: 0, done: 0 });
     const [loading, setLoading] = useState(true);
     const [brandVoice, setBrandVoice] = useState("");
+    const [filters, setFilters] = useState({ status: "", urgency: "", sentiment: "" });
     const { data: session } = useSession();
     const router = useRouter();
 
@@ -18,8 +19,12 @@ export default function DashboardPage() {
         if (!session?.user?.email) return;
 
         try {
+            // Filtering and sorting happen server-side on the indexed ticket columns
+            const params = new URLSearchParams({ email: session.user.email, sort: "urgency" });
+            Object.entries(filters).forEach(([key, value]) => value && params.set(key, value));
+
             const [ticketsRes, statsRes] = await Promise.all([
-                fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/tickets?email=${session.user.email}`),
+                fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/tickets?${params}`),
                 fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/stats?email=${session.user.email}`)
             ]);
 
@@ -50,8 +55,6 @@ export default function DashboardPage() {
 
     useEffect(() => {
         if (session?.user?.email) {
-            fetchData();
-
             // Fire Google Ads Conversion Event
             if (typeof window !== "undefined" && (window as any).gtag) {
                 (window as any).gtag("event", "conversion", {
@@ -63,6 +66,10 @@ export default function DashboardPage() {
         }
     }, [session]);
 
+    useEffect(() => {
+        if (session?.user?.email) fetchData();
+    }, [session, filters]);
+
     return (
         <div className="flex flex-col md:flex-row h-screen bg-background text-foreground overflow-hidden">
             <Sidebar />
@@ -95,6 +102,27 @@ export default function DashboardPage() {
                         ))}
                     </div>
 
+                    {/* Filters */}
+                    <div className="flex flex-wrap gap-3 mb-4">
+                        {[
+                            { key: "status", label: "All statuses", options: ["OPEN", "IN_PROGRESS", "DONE"] },
+                            { key: "urgency", label: "All urgencies", options: ["high", "medium", "low"] },
+                            { key: "sentiment", label: "All sentiments", options: ["negative", "neutral", "positive"] },
+                        ].map((filter) => (
+                            <select
+                                key={filter.key}
+                                value={filters[filter.key as keyof typeof filters]}
+                                onChange={(e) => setFilters(prev => ({ ...prev, [filter.key]: e.target.value }))}
+                                className="px-3 py-2 bg-secondary border border-border rounded-lg text-sm"
+                            >
+                                <option value="">{filter.label}</option>
+                                {filter.options.map((option) => (
+                                    <option key={option} value={option}>{option}</option>
+                                ))}
+                            </select>
+                        ))}
+                    </div>
+
                     {/* Tickets Table */}
                     <div className="glass-card overflow-hidden border-primary/10">
                         {loading ? (
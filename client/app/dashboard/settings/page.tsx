@@ -508,12 +508,18 @@ function SettingsContent() {
                                             }
 
                                             try {
-                                                await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/pipeline/trigger`, {
+                                                const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/pipeline/trigger`, {
                                                     method: "POST",
                                                     headers: { "Content-Type": "application/json" },
                                                     body: JSON.stringify({ email: session.user.email })
                                                 });
-                                                setNotification({ type: "success", message: "Scan started! Check dashboard in a few moments." });
+                                                const data = await res.json();
+                                                setNotification({
+                                                    type: "success",
+                                                    message: data.job_status === "running" || data.message === "Scan already in progress"
+                                                        ? "A scan is already in progress. Check dashboard in a few moments."
+                                                        : "Scan started! Check dashboard in a few moments."
+                                                });
                                             } catch (e) {
                                                 setNotification({ type: "error", message: "Failed to start scan" });
                                             } finally {
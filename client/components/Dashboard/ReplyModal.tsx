@@ -1,5 +1,7 @@
 import { useState } from "react";
 
+const TONES = ["Professional", "Empathetic", "Direct", "Noir", "Vibrant", "Soft"];
+
 interface ReplyModalProps {
     isOpen: boolean;
     onClose: () => void;
@@ -13,22 +15,53 @@ export default function ReplyModal({ isOpen, onClose, ticketContent, ticketId, b
     const [loading, setLoading] = useState(false);
     const [context, setContext] = useState("");
     const [generatedOnce, setGeneratedOnce] = useState(false);
+    const [lastTone, setLastTone] = useState("");
+    const [variants, setVariants] = useState<Record<string, string>>({});
 
     if (!isOpen) return null;
 
     const generateReply = async (tone: string) => {
         setLoading(true);
+        setReply("");
+        // The draft for each tone is stored on the ticket; picking the shown tone again regenerates it
+        const refresh = tone === lastTone;
+        setLastTone(tone);
         try {
-            const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/generate-reply`, {
+            // Stream tokens over SSE so the first words show up while Gemini is still generating
+            const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/generate-reply/stream`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ content: ticketContent, tone, context })
+                body: JSON.stringify({ content: ticketContent, tone, context, ticket_id: ticketId, refresh })
             });
-            const data = await res.json();
-            if (data.reply) {
-                setReply(data.reply);
-                setGeneratedOnce(true);
+            if (!res.ok || !res.body) throw new Error(`Stream failed: ${res.status}`);
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            let text = "";
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // SSE events are separated by a blank line
+                const events = buffer.split("\n\n");
+                buffer = events.pop() || "";
+                for (const event of events) {
+                    const lines = event.split("\n");
+                    const type = lines.find((l) => l.startsWith("event:"))?.slice(6).trim() || "message";
+                    const data = lines.filter((l) => l.startsWith("data:")).map((l) => l.slice(5).trim()).join("");
+                    if (type === "error") throw new Error(JSON.parse(data).error);
+                    if (type === "message" && data) {
+                        // Stays loading until the stream ends, so another tone can't start an overlapping stream
+                        text += JSON.parse(data).text;
+                        setReply(text);
+                    }
+                }
             }
+            setReply(text.trim());
+            if (!context) setVariants(prev => ({ ...prev, [tone]: text.trim() }));
+            setGeneratedOnce(true);
         } catch (error) {
             console.error("Error generating reply:", error);
         } finally {
@@ -36,10 +69,21 @@ export default function ReplyModal({ isOpen, onClose, ticketContent, ticketId, b
         }
     };
 
-    // Auto-generate on open if brandVoice is available and haven't generated yet
-    if (!generatedOnce && !loading && !reply && brandVoice) {
+    // Tones are generated when picked; drafts already made in this session are reused
+    const selectTone = (tone: string) => {
+        // Custom context or re-picking the shown tone needs a fresh generation
+        if (!context && tone !== lastTone && variants[tone]) {
+            setReply(variants[tone]);
+            setLastTone(tone);
+            return;
+        }
+        generateReply(tone);
+    };
+
+    // Draft in the brand voice once on open (served from the ticket if already drafted); without one, wait for a tone
+    if (!generatedOnce && !loading && !reply) {
         // Using a timeout to avoid strict mode double-invoke issues in dev
-        setTimeout(() => generateReply(brandVoice), 100);
+        if (brandVoice) setTimeout(() => generateReply(brandVoice), 100);
         setGeneratedOnce(true);
     }
 
@@ -121,10 +165,10 @@ export default function ReplyModal({ isOpen, onClose, ticketContent, ticketId, b
                             {brandVoice ? "Target Brand Voice" : "Response Tone & Vibe"}
                         </label>
                         <div className="flex flex-wrap gap-2">
-                            {["Professional", "Empathetic", "Direct", "Noir", "Vibrant", "Soft"].map((tone) => (
+                            {TONES.map((tone) => (
                                 <button
                                     key={tone}
-                                    onClick={() => generateReply(tone)}
+                                    onClick={() => selectTone(tone)}
                                     disabled={loading}
                                     className={`px-4 py-2 rounded-xl text-sm transition-all border ${brandVoice === tone
                                         ? 'bg-primary/20 border-primary text-primary font-medium'
@@ -167,7 +211,7 @@ export default function ReplyModal({ isOpen, onClose, ticketContent, ticketId, b
                                 className="w-full h-full min-h-[300px] bg-secondary/10 border border-border rounded-2xl p-6 text-sm leading-relaxed focus:ring-2 focus:ring-primary/20 focus:border-primary/30 transition-all resize-none font-sans"
                                 placeholder={brandVoice ? "Synthesizing response with your brand voice..." : "Select a tone above to generate a draft..."}
                             />
-                            {loading && (
+                            {loading && !reply && (
                                 <div className="absolute inset-0 flex flex-col items-center justify-center bg-background/40 backdrop-blur-[2px] rounded-2xl border border-primary/20 shadow-inner">
                                     <div className="w-8 h-8 border-3 border-primary/30 border-t-primary rounded-full animate-spin mb-3" />
                                     <div className="text-[10px] font-bold uppercase tracking-[0.2em] text-primary animate-pulse">
@@ -10,6 +10,8 @@ interface Ticket {
     status: "OPEN" | "IN_PROGRESS" | "DONE";
     type?: "BUG" | "FEATURE" | "QUESTION";
     urgency?: "high" | "medium" | "low";
+    sentiment?: "positive" | "negative" | "neutral";
+    confidence?: number;
     linked_users: string[];
     created_at: number;
 }
@@ -55,15 +57,6 @@ export default function TicketTable({ tickets, refresh, brandVoice }: { tickets:
         return <div className="p-12 text-center text-muted">No social tickets found yet.</div>;
     }
 
-    // Sort by urgency (high first) then by created_at
-    const sortedTickets = [...tickets].sort((a, b) => {
-        const urgencyOrder = { high: 0, medium: 1, low: 2 };
-        const aUrgency = urgencyOrder[a.urgency as keyof typeof urgencyOrder] ?? 2;
-        const bUrgency = urgencyOrder[b.urgency as keyof typeof urgencyOrder] ?? 2;
-        if (aUrgency !== bUrgency) return aUrgency - bUrgency;
-        return b.created_at - a.created_at;
-    });
-
     return (
         <div className="overflow-x-auto">
             <table className="w-full text-left">
@@ -79,7 +72,7 @@ export default function TicketTable({ tickets, refresh, brandVoice }: { tickets:
                     </tr>
                 </thead>
                 <tbody className="divide-y divide-border">
-                    {sortedTickets.map((ticket) => (
+                    {tickets.map((ticket) => (
                         <tr key={ticket.id} className={`hover:bg-secondary/20 transition-colors group ${ticket.urgency === 'high' ? 'bg-red-500/5' : ''}`}>
                             <td className="px-6 py-4 font-mono text-xs text-primary">{ticket.id}</td>
                             <td className="px-6 py-4 max-w-md">
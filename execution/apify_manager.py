@@ -1,10 +1,15 @@
 import os
+import logging
 import requests
 import time
 import json
 
+import metrics
+
+logger = logging.getLogger("apify")
+
 # Using standard HTTP instead of apify-client to avoid dependency issues
-BASE_URL = "https://api.apify.com/v2"
+BASE_URL = os.environ.get("APIFY_API_URL", "https://api.apify.com/v2")
 
 def get_token():
     # Load from .env manually since we don't have python-dotenv
@@ -29,15 +34,14 @@ def run_actor(actor_id, run_input):
     url = f"{BASE_URL}/acts/{actor_id}/runs?token={token}"
     headers = {"Content-Type": "application/json"}
     
-    print(f"Starting Apify Actor: {actor_id}...")
-    response = requests.post(url, json=run_input, headers=headers)
+    response = metrics.timed_request(metrics.APIFY, requests.post, url, json=run_input, headers=headers)
     
     if response.status_code != 201:
         raise Exception(f"Failed to start actor: {response.text}")
     
     run_data = response.json()["data"]
     run_id = run_data["id"]
-    print(f"Actor started. Run ID: {run_id}")
+    logger.debug("Actor started", extra={"actor": actor_id, "run_id": run_id})
     return run_id
 
 def wait_for_run(run_id):
@@ -45,23 +49,22 @@ def wait_for_run(run_id):
     url = f"{BASE_URL}/actor-runs/{run_id}?token={token}"
     
     while True:
-        response = requests.get(url)
+        response = metrics.timed_request(metrics.APIFY, requests.get, url)
         data = response.json()["data"]
         status = data["status"]
         
         if status == "SUCCEEDED":
-            print("Run succeeded!")
             return data["defaultDatasetId"]
         elif status in ["FAILED", "ABORTED"]:
             raise Exception(f"Run failed with status: {status}")
         
-        print(f"Run status: {status}. Waiting 5s...")
+        logger.debug("Actor run in progress; waiting 5s", extra={"run_id": run_id, "state": status})
         time.sleep(5)
 
 def get_dataset_items(dataset_id):
     token = get_token()
     url = f"{BASE_URL}/datasets/{dataset_id}/items?token={token}"
-    response = requests.get(url)
+    response = metrics.timed_request(metrics.APIFY, requests.get, url)
     return response.json()
 
 def scrape_instagram(query, max_items=5):
@@ -110,7 +113,9 @@ def scrape_instagram(query, max_items=5):
         return results
         
     except Exception as e:
-        print(f"Apify Error: {e}")
+        logger.warning(f"Apify Instagram scrape failed: {e}")
+        return []
+
 def scrape_facebook(query, max_items=2):
     """
     Scrapes Facebook using 'apify/facebook-posts-scraper'.
@@ -151,7 +156,7 @@ def scrape_facebook(query, max_items=2):
             })
         return results
     except Exception as e:
-        print(f"Apify FB Error: {e}")
+        logger.warning(f"Apify Facebook scrape failed: {e}")
         return []
 
 def scrape_reddit(query, max_items=5):
@@ -186,11 +191,11 @@ def scrape_reddit(query, max_items=5):
                 "user_handle": f"u/{user}",
                 "content": text,
                 "url": url,
-                "timestamp": time.time()
+                "timestamp": item.get("createdAt") or time.time()
             })
         return results
     except Exception as e:
-        print(f"Apify Reddit Error: {e}")
+        logger.warning(f"Apify Reddit scrape failed: {e}", extra={"query": query})
         return []
 
 # Unified scraper entry point
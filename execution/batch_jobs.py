@@ -0,0 +1,125 @@
+"""
+Gemini Batch Jobs
+
+Routing between the interactive and batch classification lanes, plus the
+registry of submitted batch jobs (batch_jobs.json next to this file) that the
+pipeline polls and applies on later runs.
+
+A post goes to the batch lane when batch mode is on (GEMINI_BATCH_ENABLED),
+it is older than BATCH_MIN_AGE_HOURS and it doesn't look urgent. Batches
+smaller than BATCH_MIN_SIZE aren't worth a job and are classified
+interactively instead.
+
+A job that can't be polled BATCH_MAX_POLL_FAILURES times (e.g. a 404 once it
+has expired on Gemini's side) or is still unfinished after
+BATCH_MAX_AGE_HOURS is given up; its posts are re-classified interactively.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from llm_classifier import get_fallback_analysis
+
+BATCH_JOBS_FILE = os.path.join(os.path.dirname(__file__), "batch_jobs.json")
+
+BATCH_ENABLED = os.environ.get("GEMINI_BATCH_ENABLED", "").lower() in ("1", "true", "yes")
+BATCH_MIN_AGE_HOURS = float(os.environ.get("GEMINI_BATCH_MIN_AGE_HOURS", "6"))
+BATCH_MIN_SIZE = int(os.environ.get("GEMINI_BATCH_MIN_SIZE", "20"))
+# Gemini targets 24h for a batch and expires jobs after 48h
+BATCH_MAX_AGE_HOURS = float(os.environ.get("GEMINI_BATCH_MAX_AGE_HOURS", "48"))
+BATCH_MAX_POLL_FAILURES = int(os.environ.get("GEMINI_BATCH_MAX_POLL_FAILURES", "5"))
+
+_file_lock = threading.Lock()
+
+
+def post_age_seconds(post: Dict, now: float = None) -> float:
+    """Age from the post's timestamp (unix seconds or ISO 8601). None if unknown."""
+    value = post.get("timestamp")
+    now = now or time.time()
+    if isinstance(value, (int, float)):
+        return now - value
+    if isinstance(value, str):
+        try:
+            return now - datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def route_posts(posts: List[Dict], now: float = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Split posts into (interactive, batch).
+    """
+    if not BATCH_ENABLED:
+        return posts, []
+
+    interactive, batch = [], []
+    for post in posts:
+        age = post_age_seconds(post, now)
+        # Keyword urgency is a cheap stand-in until the real classification arrives
+        urgent = get_fallback_analysis(post.get("content", ""))["urgency"] == "high"
+        if age is not None and age >= BATCH_MIN_AGE_HOURS * 3600 and not urgent:
+            batch.append(post)
+        else:
+            interactive.append(post)
+
+    if len(batch) < BATCH_MIN_SIZE:
+        return posts, []
+    return interactive, batch
+
+
+def _load() -> Dict[str, Dict]:
+    try:
+        with open(BATCH_JOBS_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update(fn):
+    with _file_lock, open(BATCH_JOBS_FILE + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        jobs = _load()
+        fn(jobs)
+        tmp_path = BATCH_JOBS_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(jobs, f, indent=2)
+        os.replace(tmp_path, BATCH_JOBS_FILE)
+
+
+def add_job(name: str, email: str, post_ids: List[str]):
+    def add(jobs):
+        jobs[name] = {"email": email, "submitted_at": time.time(), "post_ids": post_ids}
+    _update(add)
+
+
+def remove_job(name: str):
+    _update(lambda jobs: jobs.pop(name, None))
+
+
+def record_poll_failure(name: str) -> int:
+    """Count a failed status check for the job; returns its failures so far."""
+    failures = 0
+
+    def bump(jobs):
+        nonlocal failures
+        job = jobs.get(name)
+        if job is not None:
+            job["poll_failures"] = failures = job.get("poll_failures", 0) + 1
+    _update(bump)
+    return failures
+
+
+def should_give_up(job: Dict, failures: int = 0, now: float = None) -> bool:
+    """True once the job has failed too many status checks or outlived BATCH_MAX_AGE_HOURS."""
+    age = (now or time.time()) - job["submitted_at"]
+    return failures >= BATCH_MAX_POLL_FAILURES or age > BATCH_MAX_AGE_HOURS * 3600
+
+
+def jobs_for(email: str) -> Dict[str, Dict]:
+    return {name: job for name, job in _load().items() if job["email"] == email}
@@ -0,0 +1,305 @@
+"""
+Distilled Local Classifier
+
+Every analysis Gemini returns is a labeled example. This module trains a small
+pure-NumPy model on those stored analyses (hashed word/char n-gram features and
+one softmax logistic regression per label) and serves it in-process:
+- When every label's confidence is above the threshold, the local answer is used
+  (microseconds, no API call)
+- Otherwise it defers to Gemini
+
+Usage:
+    python3 execution/distilled_classifier.py train
+    python3 execution/distilled_classifier.py train --posts analyzed_posts.json --threshold 0.9
+    python3 execution/distilled_classifier.py predict --content "App crashes on login"
+"""
+
+import argparse
+import json
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MODEL_PATH = os.environ.get("DISTILLED_MODEL_PATH", os.path.join(os.path.dirname(__file__), "distilled_model.npz"))
+CONFIDENCE_THRESHOLD = float(os.environ.get("DISTILLED_THRESHOLD", "0.9"))
+ANALYZED_POSTS_FILE = os.path.join(os.path.dirname(__file__), "analyzed_posts.json")
+USERS_DB_PATH = os.path.join(os.path.dirname(__file__), "../server/users_db.json")
+
+N_FEATURES = 2 ** 16
+HEADS = {
+    "sentiment": ["positive", "negative", "neutral"],
+    "sarcasm": ["false", "true"],
+    "intent": ["complaint", "question", "praise", "feature_request", "general"],
+    "urgency": ["high", "medium", "low"],
+    "ticket_type": ["BUG", "FEATURE", "QUESTION", "IRRELEVANT"],
+}
+PRODUCT_TOKEN = "__product_mentioned__"
+NO_PRODUCT_TOKEN = "__no_product_mentioned__"
+
+WORD_RE = re.compile(r"\w+|[?!]", re.UNICODE)
+
+# Runtime counters for the current process
+stats = {"calls": 0, "answered": 0}
+
+
+# --- Features ---
+
+def tokenize(text: str, product_name: Optional[str] = None) -> List[str]:
+    """Word unigrams and bigrams, char trigrams within words, and a product-mention flag."""
+    text = text.lower()
+    words = WORD_RE.findall(text)
+    tokens = [f"w:{w}" for w in words]
+    tokens += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"<{w}>"
+        tokens += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    if product_name:
+        tokens.append(PRODUCT_TOKEN if product_name.lower() in text else NO_PRODUCT_TOKEN)
+    return tokens
+
+
+def featurize(text: str, product_name: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed, L2-normalized term counts as (indices, values)."""
+    counts: Dict[int, float] = {}
+    for token in tokenize(text, product_name):
+        index = zlib.crc32(token.encode("utf-8")) % N_FEATURES
+        counts[index] = counts.get(index, 0.0) + 1.0
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    return indices, values / np.linalg.norm(values)
+
+
+def pack(rows: List[Tuple[np.ndarray, np.ndarray]]):
+    """Flatten a batch of sparse rows into (row_ids, indices, values)."""
+    row_ids = np.concatenate([np.full(len(idx), r, dtype=np.int64) for r, (idx, _) in enumerate(rows)])
+    indices = np.concatenate([idx for idx, _ in rows])
+    values = np.concatenate([val for _, val in rows])
+    return row_ids, indices, values
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+# --- Model ---
+
+class DistilledClassifier:
+    def __init__(self, weights: Dict[str, np.ndarray], biases: Dict[str, np.ndarray], threshold: float = CONFIDENCE_THRESHOLD):
+        self.weights = weights
+        self.biases = biases
+        self.threshold = threshold
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH, threshold: float = CONFIDENCE_THRESHOLD) -> "DistilledClassifier":
+        data = np.load(path)
+        weights = {head: data[f"W_{head}"] for head in HEADS}
+        biases = {head: data[f"b_{head}"] for head in HEADS}
+        return cls(weights, biases, threshold)
+
+    def save(self, path: str = MODEL_PATH):
+        arrays = {}
+        for head in HEADS:
+            arrays[f"W_{head}"] = self.weights[head]
+            arrays[f"b_{head}"] = self.biases[head]
+        np.savez_compressed(path, **arrays)
+
+    def predict_proba(self, rows: List[Tuple[np.ndarray, np.ndarray]]) -> Dict[str, np.ndarray]:
+        row_ids, indices, values = pack(rows)
+        probs = {}
+        for head, W in self.weights.items():
+            logits = np.tile(self.biases[head], (len(rows), 1))
+            np.add.at(logits, row_ids, W[indices] * values[:, None])
+            probs[head] = softmax(logits)
+        return probs
+
+    def predict(self, content: str, product_name: Optional[str] = None) -> Tuple[Dict, float]:
+        """
+        Returns:
+            (analysis dict in `analyze_post` shape, confidence = lowest per-label probability)
+        """
+        probs = self.predict_proba([featurize(content, product_name)])
+        labels = {}
+        confidence = 1.0
+        for head, classes in HEADS.items():
+            p = probs[head][0]
+            best = int(p.argmax())
+            labels[head] = classes[best]
+            confidence = min(confidence, float(p[best]))
+
+        analysis = {
+            "sentiment": labels["sentiment"],
+            "sarcasm": labels["sarcasm"] == "true",
+            "intent": labels["intent"],
+            "urgency": labels["urgency"],
+            "ticket_type": labels["ticket_type"],
+            "summary": content[:100] + "..." if len(content) > 100 else content,
+            "confidence": round(confidence, 3),
+            "distilled": True,
+        }
+        return analysis, confidence
+
+    def classify(self, content: str, product_name: Optional[str] = None) -> Optional[Dict]:
+        """Local analysis if confident enough, else None (caller defers to Gemini)."""
+        stats["calls"] += 1
+        analysis, confidence = self.predict(content, product_name)
+        if confidence < self.threshold:
+            return None
+        stats["answered"] += 1
+        return analysis
+
+
+def load_default_classifier() -> Optional[DistilledClassifier]:
+    """The trained model at MODEL_PATH, or None if none has been trained yet."""
+    if not os.path.exists(MODEL_PATH):
+        return None
+    return DistilledClassifier.load(MODEL_PATH)
+
+
+# --- Training ---
+
+def label_index(head: str, analysis: Dict) -> Optional[int]:
+    value = analysis.get(head)
+    if head == "sarcasm":
+        value = "true" if value is True else "false"
+    elif isinstance(value, str):
+        value = value if head == "ticket_type" else value.lower()
+    classes = HEADS[head]
+    return classes.index(value) if value in classes else None
+
+
+def load_examples(posts_path: str = ANALYZED_POSTS_FILE) -> List[Tuple[str, Optional[str], Dict[str, int]]]:
+    """
+    Gemini-labeled examples from the analyzed posts store.
+
+    Skips fallback, pre-filtered and distilled analyses, which are not Gemini labels.
+    """
+    with open(posts_path, "r") as f:
+        posts = json.load(f).get("posts", [])
+
+    product_names = {}
+    if os.path.exists(USERS_DB_PATH):
+        with open(USERS_DB_PATH, "r") as f:
+            for user in json.load(f).get("users", []):
+                product_names[user["email"]] = (user.get("config") or {}).get("product_name") or None
+
+    examples = []
+    for post in posts:
+        analysis = post.get("analysis") or {}
+        if analysis.get("fallback") or analysis.get("prefiltered") or analysis.get("distilled"):
+            continue
+        labels = {head: label_index(head, analysis) for head in HEADS}
+        if any(v is None for v in labels.values()) or not post.get("content"):
+            continue
+        examples.append((post["content"], product_names.get(post.get("for_user")), labels))
+    return examples
+
+
+def train(examples, epochs: int = 15, learning_rate: float = 0.5, l2: float = 1e-5, batch_size: int = 32, seed: int = 0) -> DistilledClassifier:
+    """Mini-batch SGD on softmax cross-entropy, one head per label."""
+    rng = np.random.default_rng(seed)
+    rows = [featurize(content, product) for content, product, _ in examples]
+    targets = {head: np.array([labels[head] for _, _, labels in examples]) for head in HEADS}
+    weights = {head: np.zeros((N_FEATURES, len(classes)), dtype=np.float32) for head, classes in HEADS.items()}
+    biases = {head: np.zeros(len(classes), dtype=np.float32) for head, classes in HEADS.items()}
+    model = DistilledClassifier(weights, biases)
+
+    for _ in range(epochs):
+        order = rng.permutation(len(rows))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            batch_rows = [rows[i] for i in batch]
+            row_ids, indices, values = pack(batch_rows)
+            probs = model.predict_proba(batch_rows)
+            for head in HEADS:
+                grad = probs[head]
+                grad[np.arange(len(batch)), targets[head][batch]] -= 1.0
+                grad /= len(batch)
+                W = weights[head]
+                np.add.at(W, indices, -learning_rate * (values[:, None] * grad[row_ids] + l2 * W[indices]))
+                biases[head] -= learning_rate * grad.sum(axis=0)
+    return model
+
+
+def evaluate(model: DistilledClassifier, examples) -> Dict:
+    """Agreement with Gemini per label, and the share of posts the model would answer alone."""
+    if not examples:
+        return {}
+    rows = [featurize(content, product) for content, product, _ in examples]
+    probs = model.predict_proba(rows)
+    n = len(examples)
+
+    agree_all = np.ones(n, dtype=bool)
+    confidence = np.ones(n)
+    per_head = {}
+    for head in HEADS:
+        truth = np.array([labels[head] for _, _, labels in examples])
+        predicted = probs[head].argmax(axis=1)
+        agree = predicted == truth
+        per_head[head] = round(float(agree.mean()), 3)
+        agree_all &= agree
+        confidence = np.minimum(confidence, probs[head].max(axis=1))
+
+    covered = confidence >= model.threshold
+    return {
+        "examples": n,
+        "agreement": per_head,
+        "agreement_all_labels": round(float(agree_all.mean()), 3),
+        "threshold": model.threshold,
+        "llm_calls_saved": round(float(covered.mean()), 3),
+        "agreement_when_answered": round(float(agree_all[covered].mean()), 3) if covered.any() else None,
+    }
+
+
+def train_and_report(posts_path: str = ANALYZED_POSTS_FILE, out_path: str = MODEL_PATH, threshold: float = CONFIDENCE_THRESHOLD, holdout: float = 0.2) -> Dict:
+    examples = load_examples(posts_path)
+    if len(examples) < 20:
+        raise ValueError(f"Need at least 20 Gemini-labeled posts to train, found {len(examples)}")
+
+    order = np.random.default_rng(42).permutation(len(examples))
+    cut = int(len(examples) * (1 - holdout))
+    train_set = [examples[i] for i in order[:cut]]
+    eval_set = [examples[i] for i in order[cut:]]
+
+    model = train(train_set)
+    model.threshold = threshold
+    report = evaluate(model, eval_set)
+
+    # Ship a model trained on everything; the report reflects held-out performance
+    final = train(examples)
+    final.threshold = threshold
+    final.save(out_path)
+    report["model_path"] = out_path
+    report["trained_on"] = len(examples)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or query the distilled local classifier")
+    subparsers = parser.add_subparsers(dest="command")
+
+    p_train = subparsers.add_parser("train")
+    p_train.add_argument("--posts", default=ANALYZED_POSTS_FILE, help="Analyzed posts JSON file")
+    p_train.add_argument("--out", default=MODEL_PATH, help="Where to write the model (.npz)")
+    p_train.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD, help="Confidence needed to skip Gemini")
+
+    p_predict = subparsers.add_parser("predict")
+    p_predict.add_argument("--content", required=True)
+    p_predict.add_argument("--product", default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "train":
+        print(json.dumps(train_and_report(args.posts, args.out, args.threshold), indent=2))
+    elif args.command == "predict":
+        model = DistilledClassifier.load()
+        analysis, confidence = model.predict(args.content, args.product)
+        print(json.dumps({**analysis, "answered_locally": confidence >= model.threshold}, indent=2))
+    else:
+        parser.print_help()
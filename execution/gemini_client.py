@@ -0,0 +1,373 @@
+"""
+Gemini HTTP Client
+
+Shared transport for every Gemini call:
+- Connect/read timeouts on every request
+- The shared requests/min + tokens/min limiter (rate_limiter.py), with reply
+  generation in the interactive lane and classification in the batch lane
+- Retries on 429/5xx/network errors, honoring Retry-After on 429 and using
+  jittered exponential backoff otherwise
+- A process-wide circuit breaker: after FAILURE_THRESHOLD consecutive failed
+  calls it opens and calls fail fast with GeminiUnavailable. After
+  RECOVERY_TIMEOUT it half-opens and lets a single probe through; a successful
+  probe closes it again.
+- Optional hedging for interactive calls (post_hedged): if the first request
+  hasn't answered by the observed p90, an identical second one is sent and
+  whichever answers first wins. Hedges are capped at HEDGE_MAX_RATE of calls.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import metrics
+from rate_limiter import BATCH, RateLimitTimeout, limiter
+
+logger = logging.getLogger("llm")
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = int(os.environ.get("GEMINI_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "3"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 20.0
+# A Retry-After longer than this is treated as an outage rather than waited out
+MAX_RETRY_AFTER = 60
+
+FAILURE_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_FAILURES", "5"))
+RECOVERY_TIMEOUT = int(os.environ.get("GEMINI_BREAKER_RECOVERY", "60"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Rough token estimate for English text
+CHARS_PER_TOKEN = 4
+DEFAULT_MAX_OUTPUT_TOKENS = 256
+
+# Hedging
+HEDGE_MAX_RATE = float(os.environ.get("GEMINI_HEDGE_MAX_RATE", "0.15"))  # 0 disables hedging; a p90 trigger alone fires ~10% of calls
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 500
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class GeminiUnavailable(Exception):
+    """Gemini is unhealthy (breaker open or retries exhausted); callers should fall back or defer."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, recovery_timeout: float = RECOVERY_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. In half-open state only one probe is let through."""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.opened_at >= self.recovery_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def is_available(self) -> bool:
+        """Non-consuming check: closed, or open long enough that a probe would be allowed."""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN:
+                return not self.probing
+            return time.time() - self.opened_at >= self.recovery_timeout
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info("Gemini circuit closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"Gemini circuit open after {self.failures} failures; retrying in {self.recovery_timeout}s")
+                self.state = OPEN
+                self.opened_at = time.time()
+
+
+breaker = CircuitBreaker()
+
+
+def retry_after_seconds(response) -> float:
+    """Parse Retry-After (delta-seconds or HTTP-date). None if absent or invalid."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_request_tokens(payload: dict) -> int:
+    """Prompt tokens plus the output cap; what a generateContent call can cost at most."""
+    prompt = "".join(
+        part.get("text", "")
+        for content in payload.get("contents", [])
+        for part in content.get("parts", [])
+    )
+    max_output = payload.get("generationConfig", {}).get("maxOutputTokens", DEFAULT_MAX_OUTPUT_TOKENS)
+    return estimate_tokens(prompt) + max_output
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def post(url: str, payload: dict, max_retries: int = MAX_RETRIES, stream: bool = False, timeout=None, lane: str = BATCH):
+    """
+    POST to Gemini through the rate limiter and circuit breaker.
+
+    Args:
+        lane: rate_limiter.INTERACTIVE for user-facing calls, BATCH otherwise
+
+    Returns:
+        The response. Non-retryable errors (e.g. 400) are returned as-is for the
+        caller to handle; they don't count against the breaker.
+
+    Raises:
+        GeminiUnavailable: The breaker is open, no quota freed up in time, or
+            retryable failures persisted
+    """
+    if not breaker.is_available():
+        raise GeminiUnavailable("Gemini circuit open")
+
+    estimated = estimate_request_tokens(payload)
+    try:
+        limiter.acquire(estimated, lane)
+    except RateLimitTimeout as e:
+        raise GeminiUnavailable(str(e))
+
+    if not breaker.allow():
+        raise GeminiUnavailable("Gemini circuit open")
+
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    last_error = None
+    for attempt in range(max_retries + 1):
+        delay = backoff_delay(attempt)
+        try:
+            if attempt:
+                limiter.acquire(estimated, lane)
+            response = metrics.timed_request(metrics.GEMINI, requests.post, url, json=payload, headers={"Content-Type": "application/json"}, stream=stream, timeout=timeout)
+        except RateLimitTimeout as e:
+            # Our own quota ran out, not Gemini: give up without counting against the breaker
+            raise GeminiUnavailable(str(e))
+        except requests.RequestException as e:
+            last_error = str(e)
+        else:
+            if response.status_code not in RETRYABLE_STATUS:
+                breaker.record_success()
+                if response.status_code == 200 and not stream:
+                    settle_usage(response, estimated)
+                return response
+            last_error = f"{response.status_code} - {response.text[:200]}"
+            if response.status_code == 429:
+                retry_after = retry_after_seconds(response)
+                if retry_after is not None:
+                    if retry_after > MAX_RETRY_AFTER:
+                        response.close()
+                        break
+                    # Jitter on top so throttled workers don't retry in lockstep
+                    delay = retry_after + random.uniform(0, BACKOFF_BASE)
+            response.close()
+
+        if attempt < max_retries:
+            logger.info(f"Gemini call failed ({last_error}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    breaker.record_failure()
+    raise GeminiUnavailable(f"Gemini unavailable: {last_error}")
+
+
+def settle_usage(response, estimated: int):
+    """Give back the part of the token estimate the call didn't use."""
+    try:
+        actual = response.json().get("usageMetadata", {}).get("totalTokenCount")
+    except ValueError:
+        return
+    limiter.settle(estimated, actual)
+
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class HedgeStats:
+    """
+    Latency bookkeeping for hedged calls.
+
+    `unhedged` holds the latency each primary request took (measured even when
+    a hedge beat it), i.e. what callers would have seen without hedging;
+    `served` holds what they actually saw.
+    """
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.lock = threading.Lock()
+        self.unhedged = deque(maxlen=window)
+        self.served = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True where a hedge was sent
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> float:
+        """Observed p90 of primary latency; None until there are enough samples."""
+        with self.lock:
+            if len(self.unhedged) < HEDGE_MIN_SAMPLES:
+                return None
+            return percentile(self.unhedged, 0.9)
+
+    def may_hedge(self) -> bool:
+        """Budget check: recent hedge rate stays under HEDGE_MAX_RATE."""
+        with self.lock:
+            recent = len(self.outcomes) or 1
+            return (sum(self.outcomes) + 1) / recent <= HEDGE_MAX_RATE
+
+    def record_primary(self, seconds: float):
+        with self.lock:
+            self.unhedged.append(seconds)
+
+    def record_call(self, seconds: float, hedged: bool, hedge_won: bool):
+        with self.lock:
+            self.served.append(seconds)
+            self.outcomes.append(hedged)
+            self.calls += 1
+            self.hedges += hedged
+            self.hedge_wins += hedge_won
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            unhedged, served = list(self.unhedged), list(self.served)
+            return {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "extra_call_rate": round(self.hedges / self.calls, 3) if self.calls else 0.0,
+                "p50": percentile(served, 0.5),
+                "p90": percentile(served, 0.9),
+                "p99": percentile(served, 0.99),
+                "p99_unhedged": percentile(unhedged, 0.99),
+            }
+
+
+hedge_stats = HedgeStats()
+# Only hedges run here; primaries never queue behind them
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gemini-hedge")
+
+
+def _timed_post(url: str, payload: dict, max_retries: int, lane: str, primary: bool):
+    started = time.time()
+    response = post(url, payload, max_retries=max_retries, lane=lane)
+    if primary:
+        # Completed HTTP calls only: instant GeminiUnavailable (breaker open, no quota) would drag the p90 down
+        hedge_stats.record_primary(time.time() - started)
+    return response
+
+
+def _start_thread(fn, *args) -> Future:
+    """Run fn on a thread of its own, so concurrent primaries aren't capped by the hedge pool."""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="gemini-primary", daemon=True).start()
+    return future
+
+
+def _discard(future):
+    """Close the losing request's response once it lands."""
+    if not future.cancel():
+        future.add_done_callback(lambda f: f.exception() is None and f.result().close())
+
+
+def post_hedged(url: str, payload: dict, max_retries: int = 1, lane: str = BATCH):
+    """
+    Like `post`, but sends a second identical request if the first hasn't
+    answered by the observed p90, and returns whichever answers first.
+
+    The loser can't be interrupted mid-flight; it is abandoned and its response
+    closed when it arrives.
+    """
+    if HEDGE_MAX_RATE <= 0:
+        return post(url, payload, max_retries=max_retries, lane=lane)
+
+    started = time.time()
+    delay = hedge_stats.hedge_delay()
+    if delay is None or not hedge_stats.may_hedge():
+        # No hedge can be sent: make the call on the caller's thread
+        try:
+            return _timed_post(url, payload, max_retries, lane, True)
+        finally:
+            hedge_stats.record_call(time.time() - started, False, False)
+
+    # The caller waits on the primary so it can return a hedge that answers first
+    primary = _start_thread(_timed_post, url, payload, max_retries, lane, True)
+    futures = [primary]
+    done, _ = wait(futures, timeout=delay)
+    if not done and hedge_stats.may_hedge():
+        futures.append(_hedge_pool.submit(_timed_post, url, payload, 0, lane, False))
+
+    # First successful answer wins; an error only counts if every request failed
+    pending = set(futures)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            for other in futures:
+                if other is not future:
+                    _discard(other)
+            hedged = len(futures) > 1
+            hedge_stats.record_call(time.time() - started, hedged, hedged and future is not primary)
+            return future.result()
+
+    hedge_stats.record_call(time.time() - started, len(futures) > 1, False)
+    raise error
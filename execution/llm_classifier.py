@@ -6,17 +6,34 @@ Analyzes social media posts for:
 - Sarcasm detection
 - Intent classification (complaint/question/praise/feature_request)
 - Urgency scoring
-- Response suggestions
+
+Reply drafts are not part of classification; they are generated on demand by
+`generate_reply` / `stream_reply` when a ticket is opened.
 """
 
 import os
 import json
+import logging
+import tempfile
+
 import requests
 
+import gemini_client
+import metrics
+from gemini_client import GeminiUnavailable, CHARS_PER_TOKEN, estimate_tokens
+from rate_limiter import INTERACTIVE
+
+logger = logging.getLogger("llm")
+
 # Configuration
 GEMINI_API_KEY = None
 GEMINI_MODEL = "gemini-2.0-flash"
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+# Overridable to point at a local stand-in API
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_API_URL = f"{GEMINI_API_BASE}/models"
+_api_root, _api_version = GEMINI_API_BASE.rsplit("/", 1)
+GEMINI_UPLOAD_URL = f"{_api_root}/upload/{_api_version}/files"
+GEMINI_DOWNLOAD_BASE = f"{_api_root}/download/{_api_version}"
 
 def get_api_key():
     global GEMINI_API_KEY
@@ -49,7 +66,105 @@ def get_api_key():
     return GEMINI_API_KEY
 
 
-def analyze_post(content: str, platform: str = "unknown", user_handle: str = "unknown", product_name: str = None, brand_voice: str = None) -> dict:
+# Structured output: Gemini returns JSON matching this schema, with one-letter
+# enum codes and short keys so the response is a few dozen tokens
+SENTIMENT_CODES = {"p": "positive", "n": "negative", "u": "neutral"}
+INTENT_CODES = {"c": "complaint", "q": "question", "p": "praise", "f": "feature_request", "g": "general"}
+URGENCY_CODES = {"h": "high", "m": "medium", "l": "low"}
+TICKET_TYPE_CODES = {"B": "BUG", "F": "FEATURE", "Q": "QUESTION", "X": "IRRELEVANT"}
+
+ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "s": {"type": "STRING", "enum": list(SENTIMENT_CODES)},
+        "x": {"type": "BOOLEAN"},
+        "i": {"type": "STRING", "enum": list(INTENT_CODES)},
+        "u": {"type": "STRING", "enum": list(URGENCY_CODES)},
+        "t": {"type": "STRING", "enum": list(TICKET_TYPE_CODES)},
+        "m": {"type": "STRING", "description": "One-sentence summary, at most 25 words"},
+        "c": {"type": "NUMBER"},
+    },
+    "required": ["s", "x", "i", "u", "t", "m", "c"],
+    "propertyOrdering": ["s", "x", "i", "u", "t", "m", "c"],
+}
+
+MAX_POST_TOKENS = int(os.environ.get("GEMINI_MAX_POST_TOKENS", "400"))
+# Fixed fields (~25 tokens) + a 25-word summary (~40 tokens), with headroom
+ANALYSIS_MAX_OUTPUT_TOKENS = 128
+
+
+def truncate_to_tokens(text: str, max_tokens: int = MAX_POST_TOKENS) -> str:
+    """
+    Cut text to roughly max_tokens, keeping the opening and the last few lines
+    (long posts tend to put the ask at the end).
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens * CHARS_PER_TOKEN
+    head = text[:budget * 3 // 4].rsplit(" ", 1)[0]
+    tail = text[-(budget // 4):].split(" ", 1)[-1]
+    return f"{head} [...] {tail}"
+
+
+def expand_analysis(compact: dict) -> dict:
+    """Map the compact structured output back to the analysis shape the rest of the pipeline uses."""
+    return {
+        "sentiment": SENTIMENT_CODES[compact["s"]],
+        "sarcasm": bool(compact["x"]),
+        "intent": INTENT_CODES[compact["i"]],
+        "urgency": URGENCY_CODES[compact["u"]],
+        "ticket_type": TICKET_TYPE_CODES[compact["t"]],
+        "summary": compact["m"],
+        "confidence": min(max(float(compact["c"]), 0.0), 1.0),
+    }
+
+
+def build_analysis_instructions(product_name: str = None) -> str:
+    """Classification instructions; identical for every post of a tenant, sent as the system instruction."""
+    context_instruction = ""
+    if product_name:
+        context_instruction = f"""
+The user is interested in the product "{product_name}". If the post is NOT about it (or its industry/competitors), use t=X and m="Irrelevant post".
+"""
+    
+    return f"""Classify the social media post you are given.{context_instruction}
+Fields:
+s sentiment: p=positive n=negative u=neutral
+x sarcasm: true/false
+i intent: c=complaint q=question p=praise f=feature_request g=general
+u urgency: h=high m=medium l=low
+t ticket type: B=bug F=feature Q=question X=irrelevant
+m one-sentence summary
+c confidence 0.0-1.0"""
+
+
+def build_analysis_request(content: str, platform: str = "unknown", user_handle: str = "unknown") -> dict:
+    """generateContent body for one post, without the instructions (see build_analysis_instructions)."""
+    post_prompt = (
+        f"Platform: {platform}\n"
+        f"User: {user_handle}\n"
+        f'Content: "{truncate_to_tokens(content)}"'
+    )
+    return {
+        "contents": [{
+            "parts": [{"text": post_prompt}]
+        }],
+        "generationConfig": {
+            "temperature": 0.3,
+            "maxOutputTokens": ANALYSIS_MAX_OUTPUT_TOKENS,
+            "responseMimeType": "application/json",
+            "responseSchema": ANALYSIS_SCHEMA,
+        }
+    }
+
+
+def parse_analysis_response(data: dict) -> dict:
+    """Structured output: the candidate's text is the compact JSON object itself."""
+    generated_text = data["candidates"][0]["content"]["parts"][0]["text"]
+    return expand_analysis(json.loads(generated_text))
+
+
+def analyze_post(content: str, platform: str = "unknown", user_handle: str = "unknown", product_name: str = None) -> dict:
     """
     Analyzes a social media post using Gemini.
     
@@ -60,7 +175,6 @@ def analyze_post(content: str, platform: str = "unknown", user_handle: str = "un
         "intent": "complaint",        # complaint/question/praise/feature_request/general
         "urgency": "high",            # high/medium/low
         "ticket_type": "BUG",         # BUG/FEATURE/QUESTION
-        "suggested_response": "...",  # AI-generated response
         "confidence": 0.85,           # 0-1 score
         "summary": "..."              # Brief summary for ticket
     }
@@ -69,88 +183,43 @@ def analyze_post(content: str, platform: str = "unknown", user_handle: str = "un
     if not api_key:
         raise ValueError("GEMINI_API_KEY not found in environment or .env")
     
-    # Construct Contextual Prompt
-    context_instruction = ""
-    if product_name:
-        context_instruction = f"""
-    CONTEXT CHECK:
-    The user is interested in the product "{product_name}".
-    If this post is NOT about "{product_name}" (or related industry/competitors), return strict JSON with "ticket_type": "IRRELEVANT" and "summary": "Irrelevant post".
-    """
-    
-    voice_instruction = ""
-    if brand_voice:
-        voice_instruction = f"""
-    BRAND VOICE:
-    Adopt the following persona for the 'suggested_response':
-    "{brand_voice}"
-    """
-
-    prompt = f"""Analyze this social media post and respond with ONLY a valid JSON object.
-{context_instruction}
-    
-POST:
-Platform: {platform}
-User: {user_handle}
-Content: "{content}"
-
-Analyze for:
-1. Sentiment: Is this positive, negative, or neutral?
-2. Sarcasm: Is the user being sarcastic? (true/false)
-3. Intent: What does the user want? (complaint, question, praise, feature_request, general)
-4. Urgency: How urgent is this? (high, medium, low)
-5. Ticket Type: What type of support ticket is this? (BUG, FEATURE, QUESTION, IRRELEVANT)
-6. Summary: A brief 1-sentence summary
-7. Suggested Response: Draft a helpful response.{voice_instruction}
-8. Confidence: [0.0-1.0]
-
-Respond with this exact JSON structure:
-{{"sentiment": "...", "sarcasm": true/false, "intent": "...", "urgency": "...", "ticket_type": "...", "summary": "...", "suggested_response": "...", "confidence": 0.0}}"""
-
     url = f"{GEMINI_API_URL}/{GEMINI_MODEL}:generateContent?key={api_key}"
-    
-    payload = {
-        "contents": [{
-            "parts": [{"text": prompt}]
-        }],
-        "generationConfig": {
-            "temperature": 0.3,
-            "maxOutputTokens": 1024,
-        }
-    }
+    payload = build_analysis_request(content, platform, user_handle)
+    payload["systemInstruction"] = {"parts": [{"text": build_analysis_instructions(product_name)}]}
     
     try:
-        response = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
+        response = gemini_client.post(url, payload)
         
         if response.status_code != 200:
-            print(f"Gemini API Error: {response.status_code} - {response.text}")
+            logger.warning("Gemini API error", extra={"status": response.status_code, "response": response.text[:500]})
             return get_fallback_analysis(content)
         
         data = response.json()
         
-        # Extract the generated text
         try:
-            generated_text = data["candidates"][0]["content"]["parts"][0]["text"]
-            # Clean up the response (remove markdown code blocks if present)
-            generated_text = generated_text.strip()
-            if generated_text.startswith("```"):
-                generated_text = generated_text.split("```")[1]
-                if generated_text.startswith("json"):
-                    generated_text = generated_text[4:]
-            generated_text = generated_text.strip()
-            
-            result = json.loads(generated_text)
-            return result
-        except (KeyError, IndexError, json.JSONDecodeError) as e:
-            print(f"Error parsing Gemini response: {e}")
-            print(f"Raw response: {data}")
+            return parse_analysis_response(data)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.warning(f"Error parsing Gemini response: {e}")
+            logger.debug("Unparseable Gemini response", extra={"response": data})
             return get_fallback_analysis(content)
             
+    except GeminiUnavailable as e:
+        logger.info(f"{e}; deferring post")
+        return get_deferred_analysis(content)
     except Exception as e:
-        print(f"Gemini API request failed: {e}")
+        logger.warning(f"Gemini API request failed: {e}")
         return get_fallback_analysis(content)
 
 
+def get_deferred_analysis(content: str) -> dict:
+    """
+    Fallback labels for a post that couldn't be classified because Gemini is
+    unavailable. The post is re-classified on a later run (see
+    run_user_pipeline.reclassify_deferred).
+    """
+    return {**get_fallback_analysis(content), "deferred": True}
+
+
 def get_fallback_analysis(content: str) -> dict:
     """
     Fallback keyword-based analysis when LLM fails.
@@ -200,8 +269,8 @@ def get_fallback_analysis(content: str) -> dict:
         "urgency": urgency,
         "ticket_type": ticket_type,
         "summary": content[:100] + "..." if len(content) > 100 else content,
-        "suggested_response": "Thank you for reaching out! We've received your message and will get back to you shortly.",
-        "confidence": 0.5
+        "confidence": 0.5,
+        "fallback": True
     }
 
 
@@ -224,6 +293,132 @@ def batch_analyze(posts: list) -> list:
     return results
 
 
+# --- Batch mode ---
+# Backlogs that don't need answers within seconds are classified through the
+# asynchronous Batch API: requests are written as JSONL, uploaded through the
+# Files API, submitted with batchGenerateContent and collected when done.
+
+BATCH_TIMEOUT = (10, 120)
+
+BATCH_SUCCEEDED = "BATCH_STATE_SUCCEEDED"
+BATCH_FAILED_STATES = {"BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED"}
+
+
+def write_analysis_batch(posts: list, product_name: str = None) -> str:
+    """
+    Write one JSONL line per post ({"key": post id, "request": generateContent body}).
+
+    Returns:
+        Path of the JSONL file
+    """
+    system_instruction = {"parts": [{"text": build_analysis_instructions(product_name)}]}
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+        for post in posts:
+            request = build_analysis_request(post.get("content", ""), post.get("platform", "unknown"), post.get("user_handle", "unknown"))
+            request["systemInstruction"] = system_instruction
+            f.write(json.dumps({"key": post["id"], "request": request}) + "\n")
+        return f.name
+
+
+def upload_batch_file(path: str, display_name: str) -> str:
+    """Resumable upload through the Files API. Returns the file name (files/...)."""
+    api_key = get_api_key()
+    size = os.path.getsize(path)
+    start = metrics.timed_request(
+        metrics.GEMINI, requests.post,
+        f"{GEMINI_UPLOAD_URL}?key={api_key}",
+        headers={
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": "application/jsonl",
+            "Content-Type": "application/json",
+        },
+        json={"file": {"display_name": display_name}},
+        timeout=BATCH_TIMEOUT
+    )
+    start.raise_for_status()
+    with open(path, "rb") as f:
+        upload = metrics.timed_request(
+            metrics.GEMINI, requests.post,
+            start.headers["X-Goog-Upload-URL"],
+            headers={
+                "X-Goog-Upload-Command": "upload, finalize",
+                "X-Goog-Upload-Offset": "0",
+                "Content-Length": str(size),
+            },
+            data=f,
+            timeout=BATCH_TIMEOUT
+        )
+    upload.raise_for_status()
+    return upload.json()["file"]["name"]
+
+
+def submit_analysis_batch(posts: list, product_name: str = None, display_name: str = "loop-closer-backlog") -> str:
+    """
+    Submit a classification batch job for `posts`.
+
+    Returns:
+        Batch name (batches/...)
+    """
+    path = write_analysis_batch(posts, product_name)
+    try:
+        file_name = upload_batch_file(path, display_name)
+    finally:
+        os.remove(path)
+
+    response = metrics.timed_request(
+        metrics.GEMINI, requests.post,
+        f"{GEMINI_API_URL}/{GEMINI_MODEL}:batchGenerateContent?key={get_api_key()}",
+        json={"batch": {"display_name": display_name, "input_config": {"file_name": file_name}}},
+        timeout=BATCH_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()["name"]
+
+
+def get_batch(name: str) -> dict:
+    """
+    Returns:
+        {"state": "BATCH_STATE_...", "responses_file": "files/..." or None}
+    """
+    response = metrics.timed_request(metrics.GEMINI, requests.get, f"{GEMINI_API_BASE}/{name}?key={get_api_key()}", timeout=BATCH_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    metadata = data.get("metadata", {})
+    result = data.get("response") or metadata.get("output") or {}
+    return {
+        "state": metadata.get("state") or data.get("state"),
+        "responses_file": result.get("responsesFile"),
+    }
+
+
+def fetch_batch_results(responses_file: str) -> dict:
+    """
+    Download a finished batch's output.
+
+    Returns:
+        {post id: analysis}; posts whose request failed map to None
+    """
+    response = metrics.timed_request(
+        metrics.GEMINI, requests.get,
+        f"{GEMINI_DOWNLOAD_BASE}/{responses_file}:download?alt=media&key={get_api_key()}",
+        timeout=BATCH_TIMEOUT
+    )
+    response.raise_for_status()
+
+    results = {}
+    for line in response.text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        try:
+            results[item["key"]] = parse_analysis_response(item["response"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            results[item.get("key")] = None
+    return results
+
+
 if __name__ == "__main__":
     import argparse
     
@@ -264,15 +459,8 @@ if __name__ == "__main__":
             print(f"  Confidence: {result['confidence']}")
             print()
 
-def generate_reply(content: str, tone: str = "Specific", context: str = None) -> dict:
-    """
-    Generates a reply for a social media post using Gemini.
-    """
-    api_key = get_api_key()
-    if not api_key:
-        return {"reply": "Error: API Key missing", "error": True}
-    
-    prompt = f"""You are a customer service agent for a brand.
+def build_reply_prompt(content: str, tone: str = "Specific", context: str = None) -> str:
+    return f"""You are a customer service agent for a brand.
 POST CONTENT: "{content}"
 
 INSTRUCTIONS:
@@ -283,20 +471,35 @@ INSTRUCTIONS:
 
 REPLY:"""
 
+
+REPLY_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "maxOutputTokens": 300,
+}
+
+
+def generate_reply(content: str, tone: str = "Specific", context: str = None) -> dict:
+    """
+    Generates a reply for a social media post using Gemini.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        return {"reply": "Error: API Key missing", "error": True}
+    
+    prompt = build_reply_prompt(content, tone, context)
+
     url = f"{GEMINI_API_URL}/{GEMINI_MODEL}:generateContent?key={api_key}"
     
     payload = {
         "contents": [{
             "parts": [{"text": prompt}]
         }],
-        "generationConfig": {
-            "temperature": 0.7,
-            "maxOutputTokens": 300,
-        }
+        "generationConfig": REPLY_GENERATION_CONFIG
     }
     
     try:
-        response = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
+        # Interactive: one retry at most, and hedged against Gemini's latency tail
+        response = gemini_client.post_hedged(url, payload, max_retries=1, lane=INTERACTIVE)
         if response.status_code != 200:
             return {"reply": "Failed to generate reply.", "error": True}
         
@@ -305,5 +508,103 @@ REPLY:"""
         return {"reply": reply_text, "error": False}
         
     except Exception as e:
-        print(f"Gemini Reply Error: {e}")
+        logger.warning(f"Gemini reply failed: {e}")
         return {"reply": "Failed to generate reply due to error.", "error": True}
+
+
+DEFAULT_REPLY_TONES = ["Specific", "Empathetic", "Brief"]
+MAX_REPLY_VARIANTS = 8
+
+
+def generate_reply_variants(content: str, tones: list = None, context: str = None) -> dict:
+    """
+    Generates one reply per tone in a single Gemini call (structured output,
+    one field per tone), so switching tones in the UI needs no further calls.
+    
+    Returns:
+        {"replies": {tone: reply}, "error": False}
+    """
+    tones = list(dict.fromkeys(tones or DEFAULT_REPLY_TONES))[:MAX_REPLY_VARIANTS]
+    api_key = get_api_key()
+    if not api_key:
+        return {"replies": {}, "error": True}
+    
+    # Fields are keyed by index; tone names can be whole brand-voice descriptions
+    fields = {f"r{i}": tone for i, tone in enumerate(tones)}
+    tone_lines = "\n".join(f'{key}: reply in a "{tone}" tone' for key, tone in fields.items())
+    prompt = f"""You are a customer service agent for a brand.
+POST CONTENT: "{truncate_to_tokens(content)}"
+
+INSTRUCTIONS:
+1. Write one reply per field below, each in the given tone.
+2. {f"Context details: {context}" if context else "Keep it helpful and concise."}
+3. Each reply should be ready to send (no quotes, no "Here is a reply:", just the text).
+4. Keep each under 280 characters if possible, unless the complexity requires more.
+
+{tone_lines}"""
+
+    url = f"{GEMINI_API_URL}/{GEMINI_MODEL}:generateContent?key={api_key}"
+    payload = {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }],
+        "generationConfig": {
+            **REPLY_GENERATION_CONFIG,
+            "maxOutputTokens": REPLY_GENERATION_CONFIG["maxOutputTokens"] * len(fields),
+            "responseMimeType": "application/json",
+            "responseSchema": {
+                "type": "OBJECT",
+                "properties": {key: {"type": "STRING"} for key in fields},
+                "required": list(fields),
+                "propertyOrdering": list(fields),
+            },
+        }
+    }
+    
+    try:
+        response = gemini_client.post_hedged(url, payload, max_retries=1, lane=INTERACTIVE)
+        if response.status_code != 200:
+            return {"replies": {}, "error": True}
+        
+        generated = json.loads(response.json()["candidates"][0]["content"]["parts"][0]["text"])
+        replies = {tone: generated[key].strip() for key, tone in fields.items() if generated.get(key)}
+        return {"replies": replies, "error": False}
+        
+    except Exception as e:
+        logger.warning(f"Gemini reply variants failed: {e}")
+        return {"replies": {}, "error": True}
+
+
+def stream_reply(content: str, tone: str = "Specific", context: str = None):
+    """
+    Streams a reply from Gemini's streamGenerateContent (SSE) as text chunks.
+    
+    Closing the generator closes the upstream connection, which cancels generation.
+    """
+    api_key = get_api_key()
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in environment or .env")
+    
+    url = f"{GEMINI_API_URL}/{GEMINI_MODEL}:streamGenerateContent?alt=sse&key={api_key}"
+    payload = {
+        "contents": [{
+            "parts": [{"text": build_reply_prompt(content, tone, context)}]
+        }],
+        "generationConfig": REPLY_GENERATION_CONFIG
+    }
+    
+    response = gemini_client.post(url, payload, max_retries=1, stream=True, timeout=(gemini_client.CONNECT_TIMEOUT, 60), lane=INTERACTIVE)
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f"Gemini API Error: {response.status_code} - {response.text}")
+        
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = json.loads(line[len("data:"):])
+            candidates = data.get("candidates") or [{}]
+            for part in candidates[0].get("content", {}).get("parts", []):
+                if part.get("text"):
+                    yield part["text"]
+    finally:
+        response.close()
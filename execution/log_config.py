@@ -0,0 +1,175 @@
+"""
+Structured Logging
+
+One logging setup for the API server, the pipeline and the scheduler:
+- Records are handed to a queue; a background thread formats and writes them,
+  so log I/O never blocks a request or a pipeline step
+- One JSON object per line: ts, level, logger, service, msg, plus any
+  `extra={...}` fields (LOG_FORMAT=text for a readable console while developing)
+- Levels: LOG_LEVEL for everything (default INFO), LOG_LEVELS for single
+  loggers, e.g. LOG_LEVELS="pipeline=DEBUG,pesapal=WARNING,uvicorn.access=WARNING"
+- DEBUG lines are rate-limited per call site (LOG_DEBUG_RATE per second,
+  0 = unlimited) and sampled (LOG_DEBUG_SAMPLE, 0..1); the next line let
+  through from a call site carries `suppressed`, the count dropped before it
+
+Loggers used across the repo: api, jobs, pipeline, llm, tickets, twitter,
+apify, db, tracing, pesapal, scheduler, profiling, stream.
+
+Usage:
+    import log_config
+    log_config.setup("pipeline")
+    logger = logging.getLogger("pipeline")
+    logger.info("Tickets updated", extra={"user": email, "tickets_created": 3})
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+DEBUG_RATE = float(os.environ.get("LOG_DEBUG_RATE", "10"))
+DEBUG_SAMPLE = float(os.environ.get("LOG_DEBUG_SAMPLE", "1"))
+
+# Chatty third-party loggers, unless LOG_LEVELS says otherwise
+DEFAULT_LEVELS = {"urllib3": "WARNING", "httpx": "WARNING"}
+
+# Attributes every LogRecord has; anything else on a record came from `extra` (which may not reuse them)
+RESERVED_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+
+def extra_fields(record: logging.LogRecord) -> Dict:
+    return {k: v for k, v in vars(record).items() if k not in RESERVED_FIELDS and not k.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "service": self.service,
+            "msg": record.getMessage(),
+            **extra_fields(record),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class DebugRateLimit(logging.Filter):
+    """Caps DEBUG records per call site (`rate` per second) and keeps a `sample` fraction of them."""
+
+    def __init__(self, rate: float = DEBUG_RATE, sample: float = DEBUG_SAMPLE):
+        super().__init__()
+        self.rate = rate
+        self.sample = sample
+        self.sites = {}  # (pathname, lineno) -> [window start, passed, dropped]
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        if self.sample < 1 and random.random() >= self.sample:
+            return False
+        if not self.rate:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= 1.0:
+                self.sites[key] = [now, 1, 0]
+                if site and site[2]:
+                    record.suppressed = site[2]
+                return True
+            if site[1] < self.rate:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render the traceback now (they may not survive the thread hop);
+        # the writer thread does the rest of the formatting
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup(service: str, log_file: Optional[str] = None):
+    """Route all logging through the background writer. Idempotent; replaces handlers set up by basicConfig."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+
+        formatter = TextFormatter() if LOG_FORMAT == "text" else JsonFormatter(service)
+        handlers = [logging.StreamHandler(sys.stdout)]
+        log_file = log_file or os.environ.get("LOG_FILE")
+        if log_file:
+            handlers.append(logging.FileHandler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(DebugRateLimit())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(LOG_LEVEL)
+        for name, level in {**DEFAULT_LEVELS, **parse_levels(LOG_LEVELS)}.items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = QueueListener(log_queue, *handlers)
+        _listener.start()
+        # Flush what's queued on exit
+        atexit.register(_listener.stop)
@@ -0,0 +1,268 @@
+"""
+Prometheus Metrics
+
+In-process counters, gauges and histograms, rendered in the Prometheus text
+exposition format by the API at /metrics. There is no client library: an
+observation is a dict lookup, a bisect and a few additions under a lock,
+cheap enough to stay on in production.
+
+What is recorded:
+- API requests: latency histogram per method/route/status, requests in flight
+- DB pool: checkout wait histogram, connections in use / pool size / overflow
+- DB statements (query_stats.py): latency, queries per API request by route,
+  slow statements, repeated query shapes
+- Outbound calls per integration (gemini, apify, twitter, pesapal): latency
+  histogram and a request counter per outcome (ok, rate_limited,
+  client_error, server_error, network_error)
+- Pipeline: posts per stage (fetched, filtered, classified, deferred,
+  batched) and tickets created/linked
+
+Metrics are per process. The API's /metrics covers the calls the API makes
+itself and the pipeline runs it executes (dashboard-triggered scans), not
+separate scheduler processes.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Outbound APIs are slower and have a long tail (LLM calls, actor runs)
+INTEGRATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+GEMINI = "gemini"
+APIFY = "apify"
+TWITTER = "twitter"
+PESAPAL = "pesapal"
+
+_registry: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        return lines + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in values]
+
+
+class Gauge(Metric):
+    """A settable value, or one read from `function` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels=(), function: Callable[[], float] = None):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[tuple, float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            try:
+                return [f"{self.name} {_format_value(self.function())}"]
+            except Exception:
+                return []
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last), sum, count]
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self.series.items()]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- API ---
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "API request latency by route template and status",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "API requests currently being handled")
+
+# --- DB pool ---
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time to get a connection from the pool (including connecting)"
+)
+
+
+def instrument_engine(engine):
+    """
+    Record checkout wait and expose in-use/size/overflow gauges for the engine's pool.
+    Wraps the pool's public connect(); a pool recreated by engine.dispose() isn't instrumented.
+    """
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    Gauge("db_pool_connections_in_use", "Connections checked out of the pool", function=lambda: engine.pool.checkedout())
+    Gauge("db_pool_size", "Configured pool size", function=lambda: engine.pool.size())
+    Gauge("db_pool_overflow", "Connections open beyond the pool size", function=lambda: max(engine.pool.overflow(), 0))
+
+
+# --- DB statements ---
+
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "SQL statement latency (cursor execute)")
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements issued while handling one API request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+DB_SLOW_QUERIES = Counter("db_slow_queries_total", "SQL statements slower than DB_SLOW_QUERY_MS")
+DB_REPEATED_QUERY_SHAPES = Counter(
+    "db_repeated_query_shapes_total", "Query shapes repeated DB_REPEAT_THRESHOLD+ times in one unit of work (possible N+1)"
+)
+
+
+# --- Integrations ---
+
+INTEGRATION_REQUEST_DURATION = Histogram(
+    "integration_request_duration_seconds", "Outbound API call latency (until response headers)",
+    ["integration"], buckets=INTEGRATION_BUCKETS
+)
+INTEGRATION_REQUESTS = Counter(
+    "integration_requests_total", "Outbound API calls by outcome",
+    ["integration", "outcome"]
+)
+
+
+def call_outcome(status_code: int) -> str:
+    if status_code < 400:
+        return "ok"
+    if status_code == 429:
+        return "rate_limited"
+    if status_code < 500:
+        return "client_error"
+    return "server_error"
+
+
+def timed_request(integration: str, send, *args, **kwargs):
+    """
+    Call send(*args, **kwargs) (requests.post, session.get, ...) and record its latency and outcome.
+    Exceptions are recorded as network_error and re-raised.
+    """
+    started = time.perf_counter()
+    outcome = "network_error"
+    try:
+        response = send(*args, **kwargs)
+        outcome = call_outcome(response.status_code)
+        return response
+    finally:
+        INTEGRATION_REQUEST_DURATION.observe(time.perf_counter() - started, integration=integration)
+        INTEGRATION_REQUESTS.inc(integration=integration, outcome=outcome)
+
+
+# --- Pipeline ---
+
+PIPELINE_POSTS = Counter(
+    "pipeline_posts_total", "Posts by pipeline stage (fetched, filtered, classified, deferred, batched)",
+    ["stage"]
+)
+PIPELINE_TICKETS = Counter("pipeline_tickets_total", "Tickets created or linked by the pipeline", ["action"])
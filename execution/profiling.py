@@ -0,0 +1,153 @@
+"""
+On-demand Profiling
+
+cProfile call stats and tracemalloc allocation stats for one pipeline run
+(`--profile` on run_user_pipeline.py / run_pipeline.py) or one API request
+(admin-gated `X-Profile: 1` header or `?profile=1`, see server/main.py).
+
+Each profile writes two files to PROFILE_DIR (default execution/profiles/):
+    <name>-<timestamp>-<id>.pstats  standard pstats dump, for
+                                    `python -m pstats`, snakeviz, gprof2dot...
+    <name>-<timestamp>-<id>.txt     summary: top functions by cumulative and
+                                    own time, top allocation sites by growth
+                                    over the run, peak traced memory
+
+cProfile only sees the thread it was enabled on, so work that runs on other
+threads is added to the profile through `Profile.thread()` (the API uses it
+for sync endpoints, which run in the threadpool). tracemalloc is process-wide:
+allocations made by anything else running at the same time are included.
+"""
+
+import contextvars
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 1  # Allocation sites are reported per line; more frames only cost memory
+
+logger = logging.getLogger("profiling")
+
+# Profile of the current request, visible to the worker threads it hands work to
+_active = contextvars.ContextVar("active_profile", default=None)
+
+
+class Profile:
+    def __init__(self, name: str, directory: Optional[str] = None):
+        self.id = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.directory = directory or PROFILE_DIR
+        self.lock = threading.Lock()
+        self.stats: Optional[pstats.Stats] = None
+        self.started = None
+        self.started_tracemalloc = False
+        self.baseline = None
+        self.paths = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self.baseline = tracemalloc.take_snapshot()
+
+    @contextmanager
+    def thread(self):
+        """Profile the calling thread for the duration of the block and merge it into this profile."""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+
+    def stop(self):
+        """Write the .pstats dump and the text summary; returns their paths."""
+        elapsed = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+
+        # Don't count tracemalloc's own bookkeeping as allocation sites
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        growth = snapshot.filter_traces(filters).compare_to(self.baseline.filter_traces(filters), "lineno")
+
+        os.makedirs(self.directory, exist_ok=True)
+        stats_path = os.path.join(self.directory, f"{self.id}.pstats")
+        summary_path = os.path.join(self.directory, f"{self.id}.txt")
+
+        summary = io.StringIO()
+        summary.write(f"Profile {self.id}\n")
+        summary.write(f"Wall time: {elapsed:.3f}s, peak traced memory: {peak / 1024 / 1024:.1f} MiB\n\n")
+        with self.lock:
+            if self.stats is not None:
+                self.stats.dump_stats(stats_path)
+                self.stats.stream = summary
+                summary.write("=== Top functions by cumulative time ===\n")
+                self.stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+                summary.write("=== Top functions by own time ===\n")
+                self.stats.sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+            else:
+                stats_path = None
+
+        summary.write(f"=== Top {TOP_ALLOCATIONS} allocation sites (growth over the run) ===\n")
+        for stat in growth[:TOP_ALLOCATIONS]:
+            summary.write(f"{stat}\n")
+
+        with open(summary_path, "w") as f:
+            f.write(summary.getvalue())
+
+        self.paths = (stats_path, summary_path)
+        return self.paths
+
+
+@contextmanager
+def activate(run: Profile):
+    """Make `run` the active profile for this context (and threadpool calls made from it)."""
+    token = _active.set(run)
+    try:
+        yield run
+    finally:
+        _active.reset(token)
+
+
+def threaded(func):
+    """Wrap a function that runs in a worker thread so its calls join the caller's active profile."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = _active.get()
+        if run is None:
+            return func(*args, **kwargs)
+        with run.thread():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def profile(name: str, directory: Optional[str] = None):
+    """Profile the calling thread (and its allocations) for the block, then write the results."""
+    run = Profile(name, directory)
+    run.start()
+    try:
+        with activate(run), run.thread():
+            yield run
+    finally:
+        stats_path, summary_path = run.stop()
+        logger.info("Profile written", extra={"stats": stats_path, "summary": summary_path})
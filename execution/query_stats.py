@@ -0,0 +1,208 @@
+"""
+Query Instrumentation
+
+Hooks on SQLAlchemy's engine events that account for every SQL statement:
+- per unit of work (an API request, one tenant's pipeline run): statement
+  count and time, and query shapes repeated DB_REPEAT_THRESHOLD+ times,
+  reported when the unit ends as possible N+1 patterns
+- per pipeline stage: `queries.<span>` counts in the run's trace (tracing.py)
+- statements slower than DB_SLOW_QUERY_MS are logged with their EXPLAIN plan
+- metrics: statement latency, queries per API request by route, slow
+  statements and repeated shapes (metrics.py)
+
+A query shape is the statement text with bound parameters (and IN lists of
+any length) collapsed to `?`. The current unit lives in a context variable,
+so an API request's unit follows it into the threadpool.
+
+In tests, `assert_max_queries(n)` fails a block that issues more than n
+statements:
+    with query_stats.assert_max_queries(3):
+        client.get("/api/tickets?email=a@b.c")
+"""
+
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+import tracing
+
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", "500"))  # 0 disables slow-query logging
+REPEAT_THRESHOLD = int(os.environ.get("DB_REPEAT_THRESHOLD", "5"))
+EXPLAIN_SLOW = os.environ.get("DB_EXPLAIN_SLOW", "1") != "0"
+EXPLAIN_INTERVAL = 300  # At most one EXPLAIN per query shape per 5 minutes
+SHAPE_PREVIEW = 300
+
+EXPLAIN_PREFIXES = {"postgresql": "EXPLAIN ", "sqlite": "EXPLAIN QUERY PLAN "}
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+_PARAMS = re.compile(r"%\(\w+\)s|%s|\?")
+_PARAM_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+logger = logging.getLogger("db")
+
+_current = contextvars.ContextVar("query_unit", default=None)
+_installed = False
+_install_lock = threading.Lock()
+_explained: Dict[str, float] = {}
+
+
+def shape(statement: str) -> str:
+    """The statement with parameters collapsed, so repeats with different values compare equal."""
+    collapsed = _PARAM_LISTS.sub("?", _PARAMS.sub("?", statement))
+    return _WHITESPACE.sub(" ", collapsed).strip()
+
+
+class Unit:
+    """Statements issued within one unit of work (and the units nested in it)."""
+
+    def __init__(self, name: str, parent: Optional["Unit"] = None):
+        self.name = name
+        self.parent = parent
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def record(self, statement_shape: str, seconds: float):
+        unit = self
+        while unit is not None:
+            with unit.lock:
+                unit.count += 1
+                unit.seconds += seconds
+                unit.shapes[statement_shape] = unit.shapes.get(statement_shape, 0) + 1
+            unit = unit.parent
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        with self.lock:
+            repeats = [(s, n) for s, n in self.shapes.items() if n >= threshold]
+        return sorted(repeats, key=lambda r: r[1], reverse=True)
+
+    def describe(self) -> str:
+        with self.lock:
+            shapes = sorted(self.shapes.items(), key=lambda r: r[1], reverse=True)
+        return "\n".join(f"  {n}× {s[:SHAPE_PREVIEW]}" for s, n in shapes)
+
+
+def current() -> Optional[Unit]:
+    return _current.get()
+
+
+@contextmanager
+def unit(name: str):
+    """Count the statements issued in the block; repeated shapes are reported when it ends."""
+    work = Unit(name, parent=_current.get())
+    token = _current.set(work)
+    try:
+        yield work
+    finally:
+        _current.reset(token)
+        if REPEAT_THRESHOLD:
+            for statement_shape, n in work.repeated():
+                metrics.DB_REPEATED_QUERY_SHAPES.inc()
+                logger.warning("Same query repeated in one unit of work (possible N+1)", extra={
+                    "unit": work.name, "count": n, "query": statement_shape[:SHAPE_PREVIEW]
+                })
+
+
+@contextmanager
+def assert_max_queries(limit: int, name: str = "assert_max_queries"):
+    """Test guard: raise AssertionError if the block issues more than `limit` statements."""
+    install()
+    work = Unit(name, parent=_current.get())
+    token = _current.set(work)
+    try:
+        yield work
+    finally:
+        _current.reset(token)
+    if work.count > limit:
+        raise AssertionError(f"{name}: {work.count} queries, expected at most {limit}:\n{work.describe()}")
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    """The plan for a statement, run on the same connection (EXPLAIN doesn't execute it)."""
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if not prefix or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+
+    postgres = conn.dialect.name == "postgresql"
+    cursor = conn.connection.cursor()
+    try:
+        # A failed statement would abort the caller's Postgres transaction; isolate it
+        if postgres:
+            cursor.execute("SAVEPOINT query_stats_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as e:
+            if postgres:
+                cursor.execute("ROLLBACK TO SAVEPOINT query_stats_explain")
+            return f"(EXPLAIN failed: {e})"
+        finally:
+            if postgres:
+                cursor.execute("RELEASE SAVEPOINT query_stats_explain")
+    except Exception as e:
+        return f"(EXPLAIN failed: {e})"
+    finally:
+        cursor.close()
+    return "\n".join(" | ".join(str(col) for col in row) for row in rows)
+
+
+def _explain_due(statement_shape: str) -> bool:
+    now = time.monotonic()
+    with _install_lock:
+        if now - _explained.get(statement_shape, -EXPLAIN_INTERVAL) < EXPLAIN_INTERVAL:
+            return False
+        _explained[statement_shape] = now
+        return True
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_stats_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    metrics.DB_QUERY_DURATION.observe(elapsed)
+
+    statement_shape = shape(statement)
+    work = _current.get()
+    if work is not None:
+        work.record(statement_shape, elapsed)
+    stage = tracing.current_span()
+    if stage:
+        tracing.count(f"queries.{stage}")
+
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        metrics.DB_SLOW_QUERIES.inc()
+        plan = None
+        if EXPLAIN_SLOW and not executemany and _explain_due(statement_shape):
+            plan = _explain(conn, statement, parameters)
+        logger.warning("Slow query", extra={
+            "duration_ms": round(elapsed * 1000, 1), "unit": work.name if work is not None else None,
+            "query": statement_shape[:SHAPE_PREVIEW], "plan": plan,
+        })
+
+
+def install():
+    """Listen on every engine in the process (both `database` and `server.database` copies). Idempotent."""
+    global _installed
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with _install_lock:
+        if _installed:
+            return
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _installed = True
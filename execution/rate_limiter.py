@@ -0,0 +1,135 @@
+"""
+Gemini Rate Limiter
+
+Token buckets for requests/min and tokens/min, shared by every process that
+calls Gemini on this host (API server, scheduler runs, legacy run_pipeline).
+Bucket state lives in a small JSON file guarded by an fcntl lock, so all
+processes draw from the same quota.
+
+Two lanes:
+- interactive (reply generation): may drain the buckets completely
+- batch (classification): must leave INTERACTIVE_RESERVE of each bucket
+  untouched, so an ingest burst can't starve replies a user is waiting on
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+LIMITER_FILE = os.environ.get("GEMINI_LIMITER_FILE", os.path.join(os.path.dirname(__file__), "gemini_limiter.json"))
+
+# Defaults are gemini-2.0-flash paid Tier 1, which the Batch API and hedging already assume;
+# a free-tier key needs GEMINI_RPM=15
+REQUESTS_PER_MINUTE = int(os.environ.get("GEMINI_RPM", "2000"))
+TOKENS_PER_MINUTE = int(os.environ.get("GEMINI_TPM", "4000000"))
+# Share of each bucket only interactive calls may use
+INTERACTIVE_RESERVE = float(os.environ.get("GEMINI_INTERACTIVE_RESERVE", "0.2"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# How long a caller waits for capacity before giving up
+MAX_WAIT = {
+    INTERACTIVE: 10,
+    BATCH: 300,
+}
+POLL_SECONDS = 1.0
+
+logger = logging.getLogger("llm")
+
+
+class RateLimitTimeout(Exception):
+    """No capacity became available within the lane's wait limit."""
+
+
+class RateLimiter:
+    def __init__(self, path: str = LIMITER_FILE, rpm: int = REQUESTS_PER_MINUTE, tpm: int = TOKENS_PER_MINUTE,
+                 reserve: float = INTERACTIVE_RESERVE):
+        self.path = path
+        self.capacity = {"requests": float(rpm), "tokens": float(tpm)}
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.announced = False
+
+    def _update(self, fn):
+        """Run fn(buckets) on the refilled shared state under the cross-process lock, then write it back."""
+        with self.lock, open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.path, "r") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+
+            now = time.time()
+            elapsed = max(now - state.get("updated", now), 0.0)
+            buckets = {}
+            for name, capacity in self.capacity.items():
+                level = state.get(name, capacity)
+                buckets[name] = min(capacity, level + elapsed * capacity / 60)
+
+            result = fn(buckets)
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({**buckets, "updated": now}, f)
+            os.replace(tmp_path, self.path)
+            return result
+
+    def _try_take(self, tokens: int, lane: str):
+        """Take one request and `tokens` tokens if the lane's share allows it. Returns seconds to wait otherwise (0 = taken)."""
+        need = {"requests": 1.0, "tokens": float(min(tokens, self.capacity["tokens"]))}
+        floor = 0.0 if lane == INTERACTIVE else self.reserve
+
+        def take(buckets):
+            wait = 0.0
+            for name, amount in need.items():
+                capacity = self.capacity[name]
+                missing = amount + floor * capacity - buckets[name]
+                if missing > 0:
+                    wait = max(wait, missing * 60 / capacity)
+            if wait == 0.0:
+                for name, amount in need.items():
+                    buckets[name] -= amount
+            return wait
+
+        return self._update(take)
+
+    def acquire(self, tokens: int, lane: str = BATCH):
+        """
+        Block until the call fits in the shared quota.
+
+        Raises:
+            RateLimitTimeout: Capacity didn't free up within MAX_WAIT for the lane
+        """
+        if not self.announced:
+            # On first use rather than at import, so it goes through the process's logging setup
+            self.announced = True
+            logger.info("Gemini rate limits", extra={
+                "rpm": int(self.capacity["requests"]), "tpm": int(self.capacity["tokens"]),
+                "interactive_reserve": self.reserve, "from_env": "GEMINI_RPM" in os.environ or "GEMINI_TPM" in os.environ,
+            })
+        deadline = time.time() + MAX_WAIT.get(lane, MAX_WAIT[BATCH])
+        while True:
+            wait = self._try_take(tokens, lane)
+            if wait == 0.0:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimitTimeout(f"Gemini {lane} quota exhausted (need ~{wait:.0f}s)")
+            time.sleep(min(wait, POLL_SECONDS))
+
+    def settle(self, estimated: int, actual: int):
+        """Correct the token bucket once the real usage is known."""
+        if actual is None or actual == estimated:
+            return
+
+        def adjust(buckets):
+            buckets["tokens"] = min(self.capacity["tokens"], buckets["tokens"] + estimated - actual)
+
+        self._update(adjust)
+
+
+limiter = RateLimiter()
@@ -0,0 +1,156 @@
+"""
+Local Relevance Pre-Filter
+
+Cheap heuristic stage that runs before `analyze_post` so obviously irrelevant
+posts (broad subreddit scrapes, spam, other languages, one-word replies) never
+reach Gemini. Each post gets a 0-1 score from:
+- Product-name / keyword mentions
+- Language (Twitter's `lang` field, else a stopword/script heuristic)
+- Length
+- Spam signals (link/hashtag stuffing, promo phrases, shouting, repeated chars)
+
+Posts scoring below the threshold (RELEVANCE_THRESHOLD env, or the tenant's
+`relevance_threshold` config) are logged and dropped.
+"""
+
+import os
+import re
+from typing import Dict, List, Tuple
+
+RELEVANCE_THRESHOLD = float(os.environ.get("RELEVANCE_THRESHOLD", "0.35"))
+ALLOWED_LANGUAGES = {l.strip() for l in os.environ.get("RELEVANCE_LANGUAGES", "en").split(",") if l.strip()}
+
+BASE_SCORE = 0.5
+PRODUCT_MATCH = 0.4
+KEYWORD_MATCH = 0.2
+NO_MATCH = -0.3
+WRONG_LANGUAGE = -0.4
+TOO_SHORT = -0.3
+SPAM_SIGNAL = -0.15
+
+MIN_LENGTH = 15
+MAX_URLS = 2
+MAX_HASHTAGS = 5
+CAPS_RATIO = 0.7
+
+SPAM_PHRASES = [
+    "giveaway", "promo code", "discount code", "use code", "airdrop", "follow me",
+    "follow back", "dm me", "click here", "link in bio", "onlyfans", "free followers",
+    "crypto signals", "earn $", "make money",
+]
+
+# Frequent English function words; real English text almost always contains a few
+ENGLISH_STOPWORDS = {
+    "the", "a", "an", "and", "or", "but", "is", "are", "was", "were", "be", "to", "of",
+    "in", "on", "for", "with", "it", "this", "that", "i", "you", "my", "your", "we",
+    "not", "no", "do", "does", "can", "have", "has", "just", "so", "at", "me", "how",
+    "what", "why", "when", "app", "any", "anyone",
+}
+
+URL_RE = re.compile(r"https?://\S+")
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+REPEAT_RE = re.compile(r"(.)\1{5,}")
+
+
+def split_terms(value: str) -> List[str]:
+    return [t.strip().lower() for t in (value or "").split(",") if t.strip()]
+
+
+def mentions(text: str, term: str) -> bool:
+    """Whole-word match, so a keyword like "app" doesn't match "happy"."""
+    return re.search(r"(?<!\w)" + re.escape(term) + r"(?!\w)", text) is not None
+
+
+def looks_english(text: str, words: List[str]) -> bool:
+    letters = [c for c in text if c.isalpha()]
+    if letters and sum(1 for c in letters if c.isascii()) / len(letters) < 0.7:
+        return False
+    if len(words) < 6:
+        return True  # Too little text to judge
+    return sum(1 for w in words if w in ENGLISH_STOPWORDS) / len(words) >= 0.08
+
+
+def relevance_score(post: Dict, config: Dict) -> Tuple[float, List[str]]:
+    """
+    Score how likely a post is worth an LLM call for this tenant.
+
+    Returns:
+        (score in [0, 1], list of reasons that moved the score)
+    """
+    content = post.get("content", "") or ""
+    text = content.lower()
+    words = WORD_RE.findall(text)
+    score = BASE_SCORE
+    reasons = []
+
+    # Mentions
+    product_name = (config.get("product_name") or "").strip().lower()
+    keywords = split_terms(config.get("keywords")) + split_terms(config.get("twitter_keywords"))
+    if product_name and mentions(text, product_name):
+        score += PRODUCT_MATCH
+        reasons.append("product")
+    elif any(mentions(text, k) for k in keywords):
+        score += KEYWORD_MATCH
+        reasons.append("keyword")
+    elif product_name or keywords:
+        score += NO_MATCH
+        reasons.append("no-mention")
+
+    # Language
+    lang = post.get("lang")
+    if ALLOWED_LANGUAGES:
+        if lang and lang not in ("und", "zxx"):
+            wrong_language = lang not in ALLOWED_LANGUAGES
+        else:
+            wrong_language = "en" in ALLOWED_LANGUAGES and not looks_english(content, words)
+        if wrong_language:
+            score += WRONG_LANGUAGE
+            reasons.append(f"lang:{lang or '?'}")
+
+    # Length
+    if len(content.strip()) < MIN_LENGTH:
+        score += TOO_SHORT
+        reasons.append("short")
+
+    # Spam
+    if len(URL_RE.findall(content)) > MAX_URLS:
+        score += SPAM_SIGNAL
+        reasons.append("links")
+    if content.count("#") > MAX_HASHTAGS:
+        score += SPAM_SIGNAL
+        reasons.append("hashtags")
+    if any(p in text for p in SPAM_PHRASES):
+        score += SPAM_SIGNAL
+        reasons.append("promo")
+    letters = [c for c in content if c.isalpha()]
+    if len(letters) >= 20 and sum(1 for c in letters if c.isupper()) / len(letters) > CAPS_RATIO:
+        score += SPAM_SIGNAL
+        reasons.append("caps")
+    if REPEAT_RE.search(content):
+        score += SPAM_SIGNAL
+        reasons.append("repeats")
+
+    return min(max(score, 0.0), 1.0), reasons
+
+
+def get_threshold(config: Dict) -> float:
+    try:
+        return float(config.get("relevance_threshold", RELEVANCE_THRESHOLD))
+    except (TypeError, ValueError):
+        return RELEVANCE_THRESHOLD
+
+
+def prefiltered_analysis(score: float, reasons: List[str]) -> Dict:
+    """Analysis stub recorded for dropped posts, in the same shape as `analyze_post` output."""
+    return {
+        "sentiment": "neutral",
+        "sarcasm": False,
+        "intent": "general",
+        "urgency": "low",
+        "ticket_type": "IRRELEVANT",
+        "summary": "Irrelevant post",
+        "confidence": round(1 - score, 2),
+        "prefiltered": True,
+        "relevance_score": round(score, 2),
+        "relevance_reasons": reasons,
+    }
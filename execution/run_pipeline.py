@@ -19,6 +19,9 @@ from datetime import datetime
 # Import our modules
 from llm_classifier import analyze_post, batch_analyze
 from ticket_manager import find_similar_ticket, create_ticket, link_user, load_db, save_db
+import metrics
+import profiling
+import query_stats
 
 # Try to import apify_manager, but allow running without it
 try:
@@ -28,6 +31,8 @@ except ImportError:
     APIFY_AVAILABLE = False
     print("Warning: apify_manager not available, using mock data")
 
+query_stats.install()
+
 
 ANALYZED_POSTS_FILE = "analyzed_posts.json"
 
@@ -126,6 +131,7 @@ def run_pipeline(query: str = None, use_mock: bool = False, max_items: int = 5):
     if not posts:
         print("   ⚠️ No posts found. Exiting.")
         return
+    metrics.PIPELINE_POSTS.inc(len(posts), stage="fetched")
     
     # Step 2: Filter already processed
     print("\n🔍 Step 2: Filtering already processed posts...")
@@ -154,6 +160,7 @@ def run_pipeline(query: str = None, use_mock: bool = False, max_items: int = 5):
         
         enriched = {**post, "analysis": analysis, "processed_at": time.time()}
         analyzed_posts.append(enriched)
+        metrics.PIPELINE_POSTS.inc(stage="deferred" if analysis.get("deferred") else "classified")
         
         print(f"         Sentiment: {analysis['sentiment']}, Sarcasm: {analysis['sarcasm']}, Intent: {analysis['intent']}")
         
@@ -165,27 +172,30 @@ def run_pipeline(query: str = None, use_mock: bool = False, max_items: int = 5):
     tickets_created = 0
     tickets_linked = 0
     
-    for post in analyzed_posts:
-        analysis = post["analysis"]
+    with query_stats.unit("run_pipeline tickets"):
+        for post in analyzed_posts:
+            analysis = post["analysis"]
         
-        # Skip positive/neutral praise unless it's a question
-        if analysis["sentiment"] == "positive" and analysis["intent"] == "praise":
-            print(f"   ✓ Skipping praise post (no ticket needed)")
-            continue
+            # Skip positive/neutral praise unless it's a question
+            if analysis["sentiment"] == "positive" and analysis["intent"] == "praise":
+                print(f"   ✓ Skipping praise post (no ticket needed)")
+                continue
         
-        # Check for similar existing ticket
-        existing_id = find_similar_ticket(analysis["summary"])
+            # Check for similar existing ticket
+            existing_id = find_similar_ticket(analysis["summary"])
         
-        if existing_id:
-            # Link user to existing ticket
-            link_user(existing_id, post["user_handle"])
-            post["ticket_id"] = existing_id
-            tickets_linked += 1
-        else:
-            # Create new ticket
-            ticket_id = create_ticket(analysis["summary"], post["user_handle"])
-            post["ticket_id"] = ticket_id
-            tickets_created += 1
+            if existing_id:
+                # Link user to existing ticket
+                link_user(existing_id, post["user_handle"])
+                post["ticket_id"] = existing_id
+                tickets_linked += 1
+                metrics.PIPELINE_TICKETS.inc(action="linked")
+            else:
+                # Create new ticket
+                ticket_id = create_ticket(analysis["summary"], post["user_handle"])
+                post["ticket_id"] = ticket_id
+                tickets_created += 1
+                metrics.PIPELINE_TICKETS.inc(action="created")
     
     print(f"   Created: {tickets_created} new tickets")
     print(f"   Linked: {tickets_linked} users to existing tickets")
@@ -230,7 +240,12 @@ if __name__ == "__main__":
     parser.add_argument("--query", help="Search query for social media", required=False)
     parser.add_argument("--mock", action="store_true", help="Use mock data instead of real scraping")
     parser.add_argument("--max", type=int, default=5, help="Max items to fetch per platform")
+    parser.add_argument("--profile", action="store_true", help="Write cProfile and tracemalloc stats for this run")
     
     args = parser.parse_args()
     
-    run_pipeline(args.query, args.mock, args.max)
+    if args.profile:
+        with profiling.profile("run_pipeline"):
+            run_pipeline(args.query, args.mock, args.max)
+    else:
+        run_pipeline(args.query, args.mock, args.max)
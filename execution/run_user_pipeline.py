@@ -6,11 +6,18 @@ Each user's keywords, subreddits, and Twitter terms are used to fetch and analyz
 
 Usage:
     python3 execution/run_user_pipeline.py
+    python3 execution/run_user_pipeline.py --user_id user@example.com
 """
 
+import argparse
+import fcntl
 import json
+import logging
+import re
 import sys
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -20,14 +27,93 @@ load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file_
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from llm_classifier import analyze_post
+from llm_classifier import (
+    analyze_post,
+    get_deferred_analysis,
+    get_fallback_analysis,
+    submit_analysis_batch,
+    get_batch,
+    fetch_batch_results,
+    BATCH_SUCCEEDED,
+    BATCH_FAILED_STATES,
+)
+from gemini_client import breaker as gemini_breaker
 from ticket_manager import find_similar_ticket, create_ticket, link_user
 from twitter_scraper import search_twitter_for_user
+from source_rates import SourceRates, source_key
+from relevance_filter import relevance_score, get_threshold, prefiltered_analysis
+import batch_jobs
+import metrics
+import tracing
+import profiling
+import query_stats
+import log_config
+
+logger = logging.getLogger("pipeline")
+
+# Optional distilled local classifier (needs numpy and a trained model)
+try:
+    import distilled_classifier
+    DISTILLED_MODEL = distilled_classifier.load_default_classifier()
+except ImportError:
+    DISTILLED_MODEL = None
+except Exception:
+    # A truncated or incompatible model file must not stop the pipeline (or the API, which imports this module)
+    logger.exception("Could not load distilled model, classifying with Gemini only")
+    DISTILLED_MODEL = None
+
+# Per-tenant query counts, N+1 and slow-query warnings for every run (idempotent; the API installs it too)
+query_stats.install()
 
 # Database paths
 USERS_DB_PATH = os.path.join(os.path.dirname(__file__), "../server/users_db.json")
 ANALYZED_POSTS_FILE = os.path.join(os.path.dirname(__file__), "analyzed_posts.json")
 
+# When the filtered-stream ingester (twitter_stream.py) is running it owns Twitter
+# ingestion, so the polling pipeline skips per-user Twitter searches.
+TWITTER_STREAM_ENABLED = os.environ.get("TWITTER_STREAM_ENABLED", "").lower() in ("1", "true", "yes")
+
+# Max results per Reddit source poll
+REDDIT_MAX_ITEMS = 5
+
+# Max deferred posts re-classified per user per run
+DEFERRED_BATCH = 50
+
+# One lock file per tenant; held for the tenant's whole run (see tenant_lease)
+LEASE_DIR = os.environ.get("TENANT_LEASE_DIR", os.path.join(os.path.dirname(__file__), "leases"))
+
+# Serialize read-modify-write of the JSON stores between threads; file_lock() extends it across processes
+_analyzed_posts_lock = threading.Lock()
+_users_db_lock = threading.Lock()
+
+
+@contextmanager
+def file_lock(path, thread_lock):
+    """Hold `thread_lock` and an fcntl lock on `path`.lock, so threads and processes take turns on a store."""
+    with thread_lock, open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+@contextmanager
+def tenant_lease(email):
+    """
+    Lease on one tenant's pipeline run, shared by every process on this host
+    (scheduler runs and dashboard scans alike), so runs for a tenant never overlap.
+
+    Yields True if acquired, False if a run for the tenant is already in progress (doesn't wait).
+    The lock is released when the block ends, or by the kernel if the process dies.
+    """
+    os.makedirs(LEASE_DIR, exist_ok=True)
+    path = os.path.join(LEASE_DIR, re.sub(r"[^A-Za-z0-9@._-]", "_", email) + ".lock")
+    with open(path, "w") as lease:
+        try:
+            fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
 
 def load_users_db():
     """Load users database."""
@@ -41,6 +127,17 @@ def save_users_db(db):
         json.dump(db, f, indent=2)
 
 
+def update_users_db(users):
+    """Write back only the given users, re-reading the store under a lock so concurrent runs don't clobber each other."""
+    if not users:
+        return
+    updated = {u["email"]: u for u in users}
+    with file_lock(USERS_DB_PATH, _users_db_lock):
+        db = load_users_db()
+        db["users"] = [updated.get(u["email"], u) for u in db.get("users", [])]
+        save_users_db(db)
+
+
 def load_analyzed_posts():
     """Load previously analyzed posts."""
     if os.path.exists(ANALYZED_POSTS_FILE):
@@ -60,6 +157,270 @@ def get_analyzed_ids(data):
     return set(p.get("id") for p in data.get("posts", []))
 
 
+def record_analyzed_posts(posts):
+    """Append analyzed posts to the store, re-reading it under a lock so concurrent writers don't clobber each other."""
+    if not posts:
+        return
+    with file_lock(ANALYZED_POSTS_FILE, _analyzed_posts_lock):
+        data = load_analyzed_posts()
+        data["posts"].extend(posts)
+        data["last_run"] = datetime.now().isoformat()
+        save_analyzed_posts(data)
+
+
+def replace_analyzed_posts(posts):
+    """Swap stored records for re-analyzed posts (matched by id and user), re-reading the store under a lock."""
+    if not posts:
+        return
+    updated = {(p.get("id"), p.get("for_user")): p for p in posts}
+    with file_lock(ANALYZED_POSTS_FILE, _analyzed_posts_lock):
+        data = load_analyzed_posts()
+        data["posts"] = [updated.get((p.get("id"), p.get("for_user")), p) for p in data["posts"]]
+        data["last_run"] = datetime.now().isoformat()
+        save_analyzed_posts(data)
+
+
+def reclassify_deferred(user):
+    """
+    Re-run posts that were deferred while Gemini was unavailable, once it is reachable again.
+
+    Returns:
+        The re-analyzed posts (still deferred if Gemini failed again)
+    """
+    if not gemini_breaker.is_available():
+        return []
+    
+    deferred = [
+        p for p in load_analyzed_posts().get("posts", [])
+        if p.get("for_user") == user["email"] and p.get("analysis", {}).get("deferred")
+    ][:DEFERRED_BATCH]
+    if not deferred:
+        return []
+    
+    logger.info("Re-classifying deferred posts", extra={"user": user["email"], "posts": len(deferred)})
+    posts = [{k: v for k, v in p.items() if k not in ("analysis", "processed_at", "for_user", "ticket_id")} for p in deferred]
+    reanalyzed = process_new_posts(user, posts)
+    replace_analyzed_posts(reanalyzed)
+    return reanalyzed
+
+
+def submit_batch(user, posts):
+    """
+    Classify posts through a Gemini batch job; the distilled model still answers what it can locally.
+    
+    Returns:
+        Records for the posts (pending ones carry the batch name), or None if submission failed
+    """
+    config = user.get("config", {})
+    records, to_submit = [], []
+    for post in posts:
+        analysis = DISTILLED_MODEL.classify(post["content"], config.get("product_name")) if DISTILLED_MODEL else None
+        if analysis:
+            records.append({**post, "analysis": analysis, "processed_at": datetime.now().isoformat(), "for_user": user["email"]})
+        else:
+            to_submit.append(post)
+    
+    if to_submit:
+        try:
+            name = submit_analysis_batch(to_submit, config.get("product_name"), display_name=f"loop-closer {user['email']}")
+        except Exception as e:
+            logger.warning(f"Batch submission failed ({e}); classifying interactively", extra={"user": user["email"]})
+            return None
+        batch_jobs.add_job(name, user["email"], [p["id"] for p in to_submit])
+        logger.info("Submitted backlog posts as batch job", extra={"user": user["email"], "batch": name, "posts": len(to_submit)})
+        for post in to_submit:
+            records.append({
+                **post,
+                "analysis": {**get_fallback_analysis(post["content"]), "pending_batch": name},
+                "processed_at": datetime.now().isoformat(),
+                "for_user": user["email"]
+            })
+    return records
+
+
+def apply_batch_results(user):
+    """
+    Poll this user's batch jobs; apply finished ones to the post store and tickets.
+    Posts of failed or abandoned jobs (see batch_jobs.should_give_up), or whose request failed,
+    are marked deferred so they're re-classified interactively.
+    """
+    for name, job in batch_jobs.jobs_for(user["email"]).items():
+        try:
+            batch = get_batch(name)
+            if batch["state"] == BATCH_SUCCEEDED:
+                results = fetch_batch_results(batch["responses_file"])
+            elif batch["state"] in BATCH_FAILED_STATES:
+                logger.warning("Batch job failed", extra={"user": user["email"], "batch": name, "state": batch["state"]})
+                results = {}
+            elif batch_jobs.should_give_up(job):
+                logger.warning("Batch job unfinished past max age; giving up", extra={"user": user["email"], "batch": name, "state": batch["state"]})
+                results = {}
+            else:
+                continue
+        except Exception as e:
+            failures = batch_jobs.record_poll_failure(name)
+            if not batch_jobs.should_give_up(job, failures):
+                logger.warning(f"Could not check batch job: {e}", extra={"user": user["email"], "batch": name, "failures": failures})
+                continue
+            logger.warning(f"Could not check batch job: {e}; giving up", extra={"user": user["email"], "batch": name, "failures": failures})
+            results = {}
+        
+        posts = [
+            p for p in load_analyzed_posts().get("posts", [])
+            if p.get("for_user") == user["email"] and p.get("analysis", {}).get("pending_batch") == name
+        ]
+        logger.info("Applying batch job", extra={"user": user["email"], "batch": name, "posts": len(posts),
+                                            "classified": sum(1 for p in posts if results.get(p["id"]))})
+        for post in posts:
+            post["analysis"] = results.get(post["id"]) or get_deferred_analysis(post["content"])
+            post["processed_at"] = datetime.now().isoformat()
+        
+        create_tickets_for_posts(user, posts)
+        replace_analyzed_posts(posts)
+        batch_jobs.remove_job(name)
+
+
+def process_new_posts(user, new_posts):
+    """
+    Analyze new posts for a user and create/link tickets.
+
+    Shared by the polling pipeline and the Twitter stream ingester.
+
+    Returns:
+        List of newly analyzed posts
+    """
+    analyzed_posts = []
+    config = user.get("config", {})
+    
+    # Cheap local relevance stage: drop obvious noise before paying for Gemini
+    threshold = get_threshold(config)
+    candidates = []
+    with tracing.span("filter"):
+        for post in new_posts:
+            score, reasons = relevance_score(post, config)
+            if score < threshold:
+                logger.debug("Dropped by pre-filter", extra={"user": user["email"], "post_id": post.get("id"),
+                                                       "score": round(score, 2), "reasons": reasons})
+                analyzed_posts.append({
+                    **post,
+                    "analysis": prefiltered_analysis(score, reasons),
+                    "processed_at": datetime.now().isoformat(),
+                    "for_user": user["email"]
+                })
+            else:
+                candidates.append(post)
+    
+    if len(candidates) < len(new_posts):
+        logger.info("Pre-filter dropped posts", extra={"user": user["email"], "dropped": len(new_posts) - len(candidates), "posts": len(new_posts)})
+        metrics.PIPELINE_POSTS.inc(len(new_posts) - len(candidates), stage="filtered")
+        tracing.count("filtered", len(new_posts) - len(candidates))
+    
+    # Old, non-urgent backlog goes to the Batch API rather than interactive calls
+    candidates, batched = batch_jobs.route_posts(candidates)
+    if batched:
+        pending = submit_batch(user, batched)
+        if pending is None:
+            candidates += batched
+        else:
+            analyzed_posts.extend(pending)
+            metrics.PIPELINE_POSTS.inc(len(batched), stage="batched")
+            tracing.count("batched", len(batched))
+    
+    logger.info("Analyzing new posts", extra={"user": user["email"], "posts": len(candidates)})
+    
+    # Analyze posts
+    with tracing.span("classify"):
+        for i, post in enumerate(candidates, 1):
+            
+            # Answer locally when the distilled model is confident, else ask Gemini
+            with tracing.item("classify.post", post_id=post.get("id")):
+                analysis = None
+                if DISTILLED_MODEL:
+                    analysis = DISTILLED_MODEL.classify(post["content"], config.get("product_name"))
+                if analysis is None:
+                    analysis = analyze_post(
+                        post["content"],
+                        post.get("platform", "unknown"),
+                        post.get("user_handle", "unknown"),
+                        product_name=config.get("product_name")
+                    )
+            
+            enriched = {
+                **post,
+                "analysis": analysis,
+                "processed_at": datetime.now().isoformat(),
+                "for_user": user["email"]
+            }
+            analyzed_posts.append(enriched)
+            stage = "deferred" if analysis.get("deferred") else "classified"
+            metrics.PIPELINE_POSTS.inc(stage=stage)
+            tracing.count(stage)
+            
+            logger.debug("Classified post", extra={"user": user["email"], "post_id": post.get("id"), "n": i, "of": len(candidates),
+                                             "sentiment": analysis["sentiment"], "intent": analysis["intent"],
+                                             "sarcasm": analysis["sarcasm"]})
+    
+    if DISTILLED_MODEL and candidates:
+        answered = sum(1 for p in analyzed_posts if p["analysis"].get("distilled"))
+        logger.info("Distilled classifier answered posts locally", extra={"user": user["email"], "answered": answered, "posts": len(candidates)})
+    
+    create_tickets_for_posts(user, analyzed_posts)
+    
+    return analyzed_posts
+
+
+def create_tickets_for_posts(user, analyzed_posts):
+    """Create or link a ticket for every analyzed post that warrants one."""
+    tickets_created = 0
+    tickets_linked = 0
+    tickets_deferred = 0
+    
+    with tracing.span("tickets"):
+        for post in analyzed_posts:
+            analysis = post["analysis"]
+            
+            # Skip positive praise
+            if analysis["sentiment"] == "positive" and analysis["intent"] == "praise":
+                continue
+
+            # Skip irrelevant posts (Strict Filtering)
+            if analysis.get("ticket_type") == "IRRELEVANT":
+                continue
+            
+            # Fallback labels while Gemini was down or a batch job is running; the ticket
+            # is created once the real classification arrives
+            if analysis.get("deferred") or analysis.get("pending_batch"):
+                tickets_deferred += 1
+                continue
+            
+            # Check for similar ticket
+            with tracing.item("dedup.post", post_id=post.get("id")):
+                existing_id = find_similar_ticket(analysis["summary"], owner_email=user["email"])
+            
+            with tracing.item("persist.post", post_id=post.get("id")):
+                if existing_id:
+                    link_user(existing_id, post["user_handle"])
+                    post["ticket_id"] = existing_id
+                    tickets_linked += 1
+                    metrics.PIPELINE_TICKETS.inc(action="linked")
+                else:
+                    ticket_id = create_ticket(
+                        analysis["summary"],
+                        post["user_handle"],
+                        owner_email=user["email"],
+                        source_id=post.get("id"),
+                        analysis=analysis
+                    )
+                    post["ticket_id"] = ticket_id
+                    tickets_created += 1
+                    metrics.PIPELINE_TICKETS.inc(action="created")
+    
+    tracing.count("tickets_created", tickets_created)
+    tracing.count("tickets_linked", tickets_linked)
+    logger.info("Tickets updated", extra={"user": user["email"], "tickets_created": tickets_created,
+                                          "tickets_linked": tickets_linked, "tickets_deferred": tickets_deferred})
+
+
 def run_pipeline_for_user(user, analyzed_ids):
     """
     Run pipeline for a single user.
@@ -67,20 +428,22 @@ def run_pipeline_for_user(user, analyzed_ids):
     Returns:
         List of newly analyzed posts
     """
-    print(f"\n{'='*60}")
-    print(f"👤 Processing user: {user['email']}")
-    print(f"   Plan: {user['plan']}")
-    print(f"   Connected: {', '.join(user.get('connected_platforms', []))}")
-    print(f"{'='*60}\n")
+    logger.info("Processing user", extra={"user": user["email"], "plan": user["plan"],
+                                          "connected": user.get("connected_platforms", [])})
+    
+    # Collect finished batch jobs, then catch up on posts deferred during a Gemini outage
+    apply_batch_results(user)
+    reclassify_deferred(user)
     
     all_posts = []
+    rates = SourceRates()
     
-    # 1. Twitter scraping (if connected)
-    if "twitter" in user.get("connected_platforms", []):
-        print("🐦 Fetching Twitter posts...")
-        tweets = search_twitter_for_user(user, max_tweets_per_search=10)
+    # 1. Twitter scraping (if connected and not covered by the stream ingester)
+    if "twitter" in user.get("connected_platforms", []) and not TWITTER_STREAM_ENABLED:
+        with tracing.item("fetch", source="twitter"):
+            tweets = search_twitter_for_user(user, max_tweets_per_search=10, rates=rates, seen_ids=analyzed_ids)
         all_posts.extend(tweets)
-        print(f"   Found {len(tweets)} tweets\n")
+        logger.info("Fetched tweets", extra={"user": user["email"], "posts": len(tweets)})
     
     # 2. Reddit scraping (Config-based, no OAuth required)
     config = user.get("config", {})
@@ -89,8 +452,6 @@ def run_pipeline_for_user(user, analyzed_ids):
     has_reddit_config = any(s.strip() for s in subreddits)
     
     if has_reddit_config or "reddit" in user.get("connected_platforms", []):
-        print("🔴 Fetching Reddit posts...")
-        
         # Import Reddit scraper
         try:
             from apify_manager import scrape_reddit
@@ -104,147 +465,138 @@ def run_pipeline_for_user(user, analyzed_ids):
             subreddits = [s.strip() for s in subreddits if s.strip()]
             product_name = config.get("product_name", "").strip()
             
+            # Build the candidate sources (Inject Product Name into keyword searches if configured).
+            # For subreddits we search broadly and let the LLM filter (Option 3, Hybrid).
+            keyword_sources = {}
+            for keyword in keywords:
+                query = keyword
+                if product_name:
+                    query = f'"{product_name}" {keyword}'
+                keyword_sources[source_key(user["email"], "reddit", query)] = query
+            
+            subreddit_sources = {}
+            for subreddit in subreddits:
+                # Remove r/ prefix if present
+                query = f"subreddit:{subreddit.replace('r/', '')}"
+                subreddit_sources[source_key(user["email"], "reddit", query)] = query
+            
+            # Poll only due sources, busiest first, within the per-run Apify budget
+            due_sources = (
+                rates.due(keyword_sources)[:3] +  # Limit to 3 keywords to avoid quota
+                rates.due(subreddit_sources)[:2]  # Limit to 2 subreddits
+            )
+            sources = {**keyword_sources, **subreddit_sources}
+            
             reddit_posts = []
+            for key in due_sources:
+                query = sources[key]
+                with tracing.item("fetch", source="reddit", query=query):
+                    posts = scrape_reddit(query, max_items=REDDIT_MAX_ITEMS)
+                logger.debug("Searched Reddit", extra={"user": user["email"], "query": query, "posts": len(posts)})
+                new_count = sum(1 for p in posts if p.get("id") not in analyzed_ids)
+                rates.record(key, new_count, saturated=len(posts) >= REDDIT_MAX_ITEMS)
+                reddit_posts.extend(posts)
             
-            # Search by keywords (Inject Product Name if configured)
-            for keyword in keywords[:3]:  # Limit to 3 keywords to avoid quota
-                if keyword:
-                    query = keyword
-                    if product_name:
-                        query = f'"{product_name}" {keyword}'
-                    
-                    print(f"   🔎 Searching Reddit for: {query}")
-                    posts = scrape_reddit(query, max_items=5)
-                    reddit_posts.extend(posts)
-            
-            # Search by subreddits
-            for subreddit in subreddits[:2]:  # Limit to 2 subreddits
-                if subreddit:
-                    # Remove r/ prefix if present
-                    subreddit = subreddit.replace("r/", "")
-                    # For subreddits, we search generally unless product_name is very specific, 
-                    # but usually subreddit implies context. 
-                    # Option 3 (Hybrid) implies we grab everything in the subreddit and let LLM filter.
-                    # So we leave subreddit search broad.
-                    posts = scrape_reddit(f"subreddit:{subreddit}", max_items=5)
-                    reddit_posts.extend(posts)
+            if not due_sources:
+                logger.info("No Reddit sources due", extra={"user": user["email"]})
             
             all_posts.extend(reddit_posts)
-            print(f"   Found {len(reddit_posts)} Reddit posts\n")
+            logger.info("Fetched Reddit posts", extra={"user": user["email"], "posts": len(reddit_posts), "sources": len(due_sources)})
             
         except Exception as e:
-            print(f"   ⚠️ Reddit scraping failed: {e}\n")
+            logger.warning(f"Reddit scraping failed: {e}", extra={"user": user["email"]})
+    
+    # Persist the per-source rates observed in this run
+    rates.save()
+    metrics.PIPELINE_POSTS.inc(len(all_posts), stage="fetched")
+    tracing.count("fetched", len(all_posts))
     
     # Filter already processed posts
     new_posts = [p for p in all_posts if p.get("id") not in analyzed_ids]
     
     if not new_posts:
-        print(f"✅ No new posts for {user['email']}\n")
+        logger.info("No new posts", extra={"user": user["email"]})
         return []
     
-    print(f"📊 Analyzing {len(new_posts)} new posts...\n")
-    
-    # Analyze posts
-    analyzed_posts = []
-    config = user.get("config", {}) # Ensure config is available
-    
-    for i, post in enumerate(new_posts, 1):
-        print(f"   [{i}/{len(new_posts)}] {post['content'][:50]}...")
-        
-        analysis = analyze_post(
-            post["content"],
-            post.get("platform", "unknown"),
-            post.get("user_handle", "unknown"),
-            product_name=config.get("product_name"),
-            brand_voice=config.get("brand_voice")
-        )
-        
-        enriched = {
-            **post,
-            "analysis": analysis,
-            "processed_at": datetime.now().isoformat(),
-            "for_user": user["email"]
-        }
-        analyzed_posts.append(enriched)
-        
-        print(f"         → {analysis['sentiment']}, {analysis['intent']}, Sarcasm: {analysis['sarcasm']}")
+    return process_new_posts(user, new_posts)
+
+
+def run_pipeline_for_all_users(user_id=None):
+    """
+    Run pipeline for all users, or only for `user_id` (email) if given.
     
-    # Create tickets
-    print(f"\n🎫 Creating tickets...")
-    tickets_created = 0
-    tickets_linked = 0
+    Returns:
+        List of newly analyzed posts
+    """
+    logger.info("Pipeline run started", extra={"user": user_id})
     
-    for post in analyzed_posts:
-        analysis = post["analysis"]
+    trace = tracing.start("run_user_pipeline", owner=user_id)
+    try:
+        # Load databases
+        db = load_users_db()
+        analyzed_data = load_analyzed_posts()
+        analyzed_ids = get_analyzed_ids(analyzed_data)
         
-        # Skip positive praise
-        if analysis["sentiment"] == "positive" and analysis["intent"] == "praise":
-            continue
-
-        # Skip irrelevant posts (Strict Filtering)
-        if analysis.get("ticket_type") == "IRRELEVANT":
-            continue
+        all_analyzed_posts = []
+        users = db.get("users", [])
+        if user_id:
+            users = [u for u in users if u.get("email") == user_id]
+            if not users:
+                logger.warning("User not found in users database", extra={"user": user_id})
         
-        # Check for similar ticket
-        existing_id = find_similar_ticket(analysis["summary"], owner_email=user["email"])
+        # Process each user
+        for user in users:
+            try:
+                with tenant_lease(user["email"]) as acquired:
+                    if not acquired:
+                        logger.info("Run for tenant already in progress, skipping", extra={"user": user["email"]})
+                        tracing.count("skipped_tenants")
+                        continue
+                    try:
+                        with tracing.span("tenant", tenant=user["email"]), query_stats.unit(f"pipeline {user['email']}"):
+                            analyzed_posts = run_pipeline_for_user(user, analyzed_ids)
+                    finally:
+                        # Save this tenant's quota snapshot while still holding its lease, so it can't
+                        # overwrite a newer one; tenants skipped above are never written back
+                        with tracing.span("persist"):
+                            update_users_db([user])
+                all_analyzed_posts.extend(analyzed_posts)
+            except Exception:
+                logger.exception("Error processing user", extra={"user": user["email"]})
+                tracing.count("failed_tenants")
+                continue
         
-        if existing_id:
-            link_user(existing_id, post["user_handle"])
-            post["ticket_id"] = existing_id
-            tickets_linked += 1
-        else:
-            ticket_id = create_ticket(analysis["summary"], post["user_handle"], owner_email=user["email"])
-            post["ticket_id"] = ticket_id
-            tickets_created += 1
-    
-    print(f"   Created: {tickets_created} new tickets")
-    print(f"   Linked: {tickets_linked} to existing tickets\n")
-    
-    return analyzed_posts
-
-
-def run_pipeline_for_all_users():
-    """Run pipeline for all users."""
-    print("=" * 60)
-    print("🚀 LOOP CLOSER USER PIPELINE")
-    print("=" * 60)
-    print(f"Timestamp: {datetime.now().isoformat()}\n")
-    
-    # Load databases
-    db = load_users_db()
-    analyzed_data = load_analyzed_posts()
-    analyzed_ids = get_analyzed_ids(analyzed_data)
-    
-    all_analyzed_posts = []
-    
-    # Process each user
-    for user in db.get("users", []):
-        try:
-            analyzed_posts = run_pipeline_for_user(user, analyzed_ids)
-            all_analyzed_posts.extend(analyzed_posts)
-        except Exception as e:
-            print(f"❌ Error processing {user['email']}: {e}\n")
-            continue
-    
-    # Save results
-    if all_analyzed_posts:
-        analyzed_data["posts"].extend(all_analyzed_posts)
-        analyzed_data["last_run"] = datetime.now().isoformat()
-        save_analyzed_posts(analyzed_data)
-        print(f"💾 Saved {len(all_analyzed_posts)} analyzed posts\n")
-    
-    # Save updated quotas
-    save_users_db(db)
+        with tracing.span("persist"):
+            # Save results
+            if all_analyzed_posts:
+                record_analyzed_posts(all_analyzed_posts)
+                logger.info("Saved analyzed posts", extra={"posts": len(all_analyzed_posts)})
+    except Exception:
+        tracing.finish("failed")
+        tracing.save(trace)
+        raise
+    tracing.count("users", len(users))
+    tracing.finish("success")
+    tracing.save(trace)
     
     # Summary
-    print("=" * 60)
-    print("✅ PIPELINE COMPLETE")
-    print("=" * 60)
-    print(f"Users processed: {len(db.get('users', []))}")
-    print(f"Posts analyzed: {len(all_analyzed_posts)}")
+    logger.info("Pipeline run complete", extra={
+        "user": user_id, "users": len(users), "posts": len(all_analyzed_posts), "duration_s": round(trace.duration, 3)
+    })
     
     return all_analyzed_posts
 
 
 if __name__ == "__main__":
-    run_pipeline_for_all_users()
+    parser = argparse.ArgumentParser(description="Run the monitoring pipeline for users")
+    parser.add_argument("--user_id", help="Only process this user (email)", required=False)
+    parser.add_argument("--profile", action="store_true", help="Write cProfile and tracemalloc stats for this run")
+    
+    args = parser.parse_args()
+    log_config.setup("pipeline")
+    
+    if args.profile:
+        with profiling.profile("run_user_pipeline"):
+            run_pipeline_for_all_users(user_id=args.user_id)
+    else:
+        run_pipeline_for_all_users(user_id=args.user_id)
@@ -1,57 +1,202 @@
-import time
+"""
+Per-Tenant Pipeline Scheduler
+
+Keeps a next-due time per tenant and runs `run_user_pipeline.py --user_id <email>`
+for each tenant when it falls due:
+- Interval depends on plan (Teams more often than Free)
+- Jitter spreads runs out so Apify/Gemini load doesn't arrive in bursts
+- Due tenants are started in plan priority order, up to MAX_CONCURRENT_RUNS
+- A lease per tenant guarantees runs for the same tenant never overlap;
+  a run holding its lease past LEASE_TIMEOUT_SECONDS is killed. The run itself
+  also takes the tenant's cross-process lease (run_user_pipeline.tenant_lease),
+  so a dashboard scan in progress makes it skip the tenant
+- Child output is streamed line by line into the log instead of buffered;
+  the child's JSON log lines are re-emitted with their fields and the tenant
+
+Usage:
+    python3 execution/scheduler.py
+"""
+
+import json
+import os
+import random
 import subprocess
 import sys
+import threading
+import time
 import logging
-from datetime import datetime
+
+import log_config
 
 # Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("scheduler.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-
-PIPELINE_SCRIPT = "execution/run_user_pipeline.py"
-INTERVAL_SECONDS = 3600  # Run every hour
-
-def run_pipeline():
-    logging.info("Starting scheduled pipeline run...")
+log_config.setup("scheduler", log_file=os.environ.get("LOG_FILE", "scheduler.log"))
+logger = logging.getLogger("scheduler")
+
+EXECUTION_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_SCRIPT = os.path.join(EXECUTION_DIR, "run_user_pipeline.py")
+USERS_DB_PATH = os.path.join(EXECUTION_DIR, "../server/users_db.json")
+
+# Seconds between runs per plan
+PLAN_INTERVALS = {
+    "Teams": 900,
+    "Pro": 1800,
+    "Free": 3600,
+}
+# Lower runs first when several tenants are due at once
+PLAN_PRIORITY = {
+    "Teams": 0,
+    "Pro": 1,
+    "Free": 2,
+}
+JITTER_FRACTION = 0.1
+MAX_CONCURRENT_RUNS = int(os.environ.get("SCHEDULER_MAX_CONCURRENT_RUNS", "2"))
+LEASE_TIMEOUT_SECONDS = int(os.environ.get("SCHEDULER_LEASE_TIMEOUT", "2700"))
+TICK_SECONDS = 15
+USERS_REFRESH_SECONDS = 300
+
+
+def plan_interval(plan):
+    return PLAN_INTERVALS.get(plan, PLAN_INTERVALS["Free"])
+
+
+def jittered(seconds):
+    """Spread a delay by +/- JITTER_FRACTION."""
+    return seconds * random.uniform(1 - JITTER_FRACTION, 1 + JITTER_FRACTION)
+
+
+def load_users_db():
+    """Same store run_user_pipeline reads; loaded directly to keep the scheduler free of DB imports."""
+    with open(USERS_DB_PATH, "r") as f:
+        return json.load(f)
+
+
+def forward_child_line(email, line):
+    """Re-emit a child's JSON log line under its own logger and level; anything else is logged as text."""
     try:
-        # Run the pipeline script
-        result = subprocess.run(
-            [sys.executable, PIPELINE_SCRIPT],
-            capture_output=True,
-            text=True
+        entry = json.loads(line)
+    except ValueError:
+        entry = None
+    if not isinstance(entry, dict) or "msg" not in entry:
+        logger.info(line, extra={"tenant": email})
+        return
+
+    fields = {k: v for k, v in entry.items() if k not in ("ts", "level", "logger", "msg") and k not in log_config.RESERVED_FIELDS}
+    level = logging.getLevelName(entry.get("level", "INFO"))
+    logging.getLogger(entry.get("logger", "pipeline")).log(
+        level if isinstance(level, int) else logging.INFO, entry["msg"], extra={**fields, "tenant": email}
+    )
+
+
+def stream_output(email, pipe):
+    """Forward a child's output to the log as it is produced."""
+    for line in pipe:
+        line = line.rstrip()
+        if line:
+            forward_child_line(email, line)
+    pipe.close()
+
+
+class TenantScheduler:
+    def __init__(self):
+        self.tenants = {}     # email -> user dict
+        self.next_due = {}    # email -> unix time
+        self.leases = {}      # email -> {"process", "started_at"}
+        self.last_refresh = 0.0
+
+    def refresh_tenants(self):
+        """Reload tenants; new ones get a random first slot within their jitter window."""
+        db = load_users_db()
+        self.tenants = {u["email"]: u for u in db.get("users", [])}
+        now = time.time()
+        for email, user in self.tenants.items():
+            if email not in self.next_due:
+                self.next_due[email] = now + random.uniform(0, plan_interval(user.get("plan")) * JITTER_FRACTION)
+        for email in list(self.next_due):
+            if email not in self.tenants:
+                del self.next_due[email]
+        self.last_refresh = now
+
+    def due_tenants(self, now):
+        """Tenants past their due time without an active lease, highest priority first."""
+        due = [email for email, at in self.next_due.items() if at <= now and email not in self.leases]
+        return sorted(due, key=lambda e: (PLAN_PRIORITY.get(self.tenants[e].get("plan"), len(PLAN_PRIORITY)), self.next_due[e]))
+
+    def start_run(self, email):
+        logger.info(f"Starting pipeline run for {email} ({self.tenants[email].get('plan', 'Free')})")
+        env = dict(os.environ)
+        # server/ must be importable for ticket_manager's models
+        server_dir = os.path.join(os.path.dirname(EXECUTION_DIR), "server")
+        env["PYTHONPATH"] = os.pathsep.join(p for p in [EXECUTION_DIR, server_dir, env.get("PYTHONPATH")] if p)
+        # Line-buffer the child's stdout so its logs stream as they happen
+        env["PYTHONUNBUFFERED"] = "1"
+        # The child logs JSON to stdout only; we re-emit it (and write the file)
+        env["LOG_FORMAT"] = "json"
+        env.pop("LOG_FILE", None)
+        process = subprocess.Popen(
+            [sys.executable, PIPELINE_SCRIPT, "--user_id", email],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            env=env
         )
-        
-        if result.returncode == 0:
-            logging.info("Pipeline run completed successfully.")
-            logging.info(result.stdout)
-        else:
-            logging.error(f"Pipeline run failed with return code {result.returncode}")
-            logging.error(result.stderr)
-            
-    except Exception as e:
-        logging.error(f"Error running pipeline: {str(e)}")
+        threading.Thread(target=stream_output, args=(email, process.stdout), daemon=True).start()
+        self.leases[email] = {"process": process, "started_at": time.time()}
+
+    def reap(self, now):
+        """Release leases of finished runs and schedule their next slot; kill runs past the lease timeout."""
+        for email, lease in list(self.leases.items()):
+            process = lease["process"]
+            returncode = process.poll()
+
+            if returncode is None:
+                if now - lease["started_at"] > LEASE_TIMEOUT_SECONDS:
+                    logger.error(f"Pipeline run for {email} exceeded lease ({LEASE_TIMEOUT_SECONDS}s). Killing.")
+                    process.kill()
+                    process.wait()
+                else:
+                    continue
+            elif returncode == 0:
+                logger.info(f"Pipeline run for {email} completed in {now - lease['started_at']:.0f}s.")
+            else:
+                logger.error(f"Pipeline run for {email} failed with return code {returncode}")
+
+            del self.leases[email]
+            if email in self.tenants:
+                interval = plan_interval(self.tenants[email].get("plan"))
+                # Next slot counts from the start of this run, but never before it finished
+                self.next_due[email] = max(lease["started_at"] + jittered(interval), now)
+
+    def tick(self):
+        now = time.time()
+        if now - self.last_refresh > USERS_REFRESH_SECONDS:
+            self.refresh_tenants()
+        self.reap(now)
+        for email in self.due_tenants(now):
+            if len(self.leases) >= MAX_CONCURRENT_RUNS:
+                break
+            self.start_run(email)
+
+    def shutdown(self):
+        for email, lease in self.leases.items():
+            logger.info(f"Terminating pipeline run for {email}")
+            lease["process"].terminate()
+
 
 def main():
-    logging.info(f"Scheduler started. Running pipeline every {INTERVAL_SECONDS} seconds.")
-    
-    # Run immediately on start
-    run_pipeline()
-    
+    logger.info(f"Scheduler started. Intervals per plan: {PLAN_INTERVALS}, max {MAX_CONCURRENT_RUNS} concurrent runs.")
+    scheduler = TenantScheduler()
+
     while True:
         try:
-            time.sleep(INTERVAL_SECONDS)
-            run_pipeline()
+            scheduler.tick()
+            time.sleep(TICK_SECONDS)
         except KeyboardInterrupt:
-            logging.info("Scheduler stopped by user.")
+            logger.info("Scheduler stopped by user.")
+            scheduler.shutdown()
             break
         except Exception as e:
-            logging.error(f"Scheduler crashed: {str(e)}")
+            logger.error(f"Scheduler crashed: {str(e)}")
             time.sleep(60) # Wait a bit before retrying
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+"""
+Adaptive Per-Source Polling
+
+Keeps an exponentially weighted rate of NEW posts per hour for every source a
+tenant polls (Reddit keyword, subreddit, Twitter query) and derives that
+source's next poll time from it. Busy sources are polled at up to every
+MIN_POLL_INTERVAL; dead ones back off to the MAX_POLL_INTERVAL floor rate.
+Fetchers poll due sources busiest-first, so the Apify/Twitter budget goes to
+where the mentions actually are.
+
+State is kept in source_rates.json next to this file.
+"""
+
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List
+
+SOURCE_RATES_FILE = os.path.join(os.path.dirname(__file__), "source_rates.json")
+
+MIN_POLL_INTERVAL = int(os.environ.get("SOURCE_MIN_POLL_INTERVAL", "900"))      # 15 min
+MAX_POLL_INTERVAL = int(os.environ.get("SOURCE_MAX_POLL_INTERVAL", "21600"))    # 6 h floor rate
+# Aim for roughly this many new posts per poll
+TARGET_POSTS_PER_POLL = 5
+# Time constant of the EWMA; older observations fade with exp(-dt / tau)
+RATE_TIME_CONSTANT = 2 * 3600
+# Elapsed time assumed for a source's first poll
+FIRST_POLL_WINDOW = 3600
+
+_file_lock = threading.Lock()
+
+
+def source_key(email: str, kind: str, query: str) -> str:
+    """Sources are tracked per tenant so tenants sharing a keyword don't skew each other."""
+    return f"{email}|{kind}:{query.strip().lower()}"
+
+
+class SourceRates:
+    def __init__(self, path: str = SOURCE_RATES_FILE):
+        self.path = path
+        self.sources: Dict[str, Dict] = self._load()
+        self.touched = set()
+
+    def _load(self) -> Dict[str, Dict]:
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                return json.load(f)
+        return {}
+
+    def is_due(self, key: str, now: float = None) -> bool:
+        state = self.sources.get(key)
+        return state is None or state["next_poll"] <= (now or time.time())
+
+    def rate(self, key: str) -> float:
+        """New posts per hour (EWMA). Unknown sources rank first so they get measured."""
+        state = self.sources.get(key)
+        return state["rate"] if state else math.inf
+
+    def due(self, keys: Iterable[str], now: float = None) -> List[str]:
+        """Due sources, busiest first."""
+        now = now or time.time()
+        return sorted((k for k in keys if self.is_due(k, now)), key=self.rate, reverse=True)
+
+    def record(self, key: str, new_posts: int, saturated: bool = False, now: float = None) -> float:
+        """
+        Fold one poll's result into the source's rate and schedule its next poll.
+
+        Args:
+            new_posts: Posts returned by this poll that had not been seen before
+            saturated: The poll hit its result cap, so the true rate is at least this high
+
+        Returns:
+            Next poll time (unix seconds)
+        """
+        now = now or time.time()
+        state = self.sources.get(key)
+        elapsed = now - state["last_poll"] if state else FIRST_POLL_WINDOW
+        elapsed = max(elapsed, 1.0)
+        observed = new_posts * 3600 / elapsed
+
+        if state:
+            alpha = 1 - math.exp(-elapsed / RATE_TIME_CONSTANT)
+            rate = alpha * observed + (1 - alpha) * state["rate"]
+        else:
+            rate = observed
+
+        if saturated:
+            interval = MIN_POLL_INTERVAL
+        elif rate <= 0:
+            interval = MAX_POLL_INTERVAL
+        else:
+            interval = TARGET_POSTS_PER_POLL / rate * 3600
+            interval = min(max(interval, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+        self.sources[key] = {
+            "rate": rate,
+            "last_poll": now,
+            "next_poll": now + interval,
+            "last_new_posts": new_posts,
+        }
+        self.touched.add(key)
+        return now + interval
+
+    def save(self):
+        """Merge the sources touched by this run into the file under a lock, then replace it atomically."""
+        if not self.touched:
+            return
+        with _file_lock, open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            current = self._load()
+            for key in self.touched:
+                current[key] = self.sources[key]
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(current, f, indent=2)
+            os.replace(tmp_path, self.path)
+        self.touched.clear()
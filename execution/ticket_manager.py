@@ -1,5 +1,6 @@
 import argparse
 import json
+import logging
 import os
 import sys
 import time
@@ -11,6 +12,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from server.database import SessionLocal
 from server.models import Ticket
 
+logger = logging.getLogger("tickets")
+
 def get_db():
     return SessionLocal()
 
@@ -34,7 +37,7 @@ def find_similar_ticket(text, owner_email=None):
                     best_match = ticket
         
         if best_match:
-            print(f"Found existing ticket: {best_match.id} (Match: {int(highest_ratio*100)}%)")
+            logger.debug("Found similar ticket", extra={"ticket_id": best_match.id, "match": round(highest_ratio, 2)})
             return best_match.id
         return None
     finally:
@@ -48,7 +51,16 @@ def classify_ticket(text):
         return "FEATURE"
     return "QUESTION"
 
-def create_ticket(summary, user, owner_email=None, source_id=None):
+TICKET_TYPES = {"BUG", "FEATURE", "QUESTION"}
+URGENCIES = {"high", "medium", "low"}
+
+def create_ticket(summary, user, owner_email=None, source_id=None, analysis=None):
+    """
+    Args:
+        analysis: Classifier output for the post that opened the ticket. Its
+            labels are stored as typed columns (for filtering) and in full as JSONB.
+    """
+    analysis = analysis or {}
     db = get_db()
     try:
         # Generate ID - simpler to use UUID or just count? 
@@ -58,13 +70,26 @@ def create_ticket(summary, user, owner_email=None, source_id=None):
         count = db.query(Ticket).count()
         new_id = f"TICKET-{count + 101 + int(time.time() % 1000)}" # Randomize slightly to avoid collision in simple counter
         
+        # Prefer the classifier's labels; keyword heuristic only when they're missing
+        ticket_type = analysis.get("ticket_type")
+        if ticket_type not in TICKET_TYPES:
+            ticket_type = classify_ticket(summary)
+        urgency = analysis.get("urgency")
+        if urgency not in URGENCIES:
+            urgency = "low"
+        
         new_ticket = Ticket(
             id=new_id,
             source_id=source_id,
             summary=summary,
             status="OPEN",
-            type=classify_ticket(summary),
-            urgency="low",
+            type=ticket_type,
+            urgency=urgency,
+            sentiment=analysis.get("sentiment"),
+            intent=analysis.get("intent"),
+            sarcasm=analysis.get("sarcasm"),
+            confidence=analysis.get("confidence"),
+            analysis=analysis,
             linked_users=[user],
             created_at=time.time(),
             notified=False,
@@ -73,11 +98,11 @@ def create_ticket(summary, user, owner_email=None, source_id=None):
         
         db.add(new_ticket)
         db.commit()
-        print(f"Created new ticket: {new_id} (Owner: {owner_email})")
+        logger.debug("Created ticket", extra={"ticket_id": new_id, "owner": owner_email})
         return new_id
     except Exception as e:
         db.rollback()
-        print(f"Error creating ticket: {e}")
+        logger.error(f"Error creating ticket: {e}", extra={"owner": owner_email})
         return None
     finally:
         db.close()
@@ -96,14 +121,45 @@ def link_user(ticket_id, user):
                 current_users.append(user)
                 ticket.linked_users = current_users
                 db.commit()
-                print(f"Linked {user} to {ticket_id}")
-            else:
-                print(f"User {user} already linked to {ticket_id}")
+                logger.debug("Linked user to ticket", extra={"ticket_id": ticket_id, "handle": user})
         else:
-            print("Ticket not found")
+            logger.warning("Ticket not found", extra={"ticket_id": ticket_id})
+    finally:
+        db.close()
+
+def get_drafts(ticket_id):
+    """All stored reply drafts for a ticket, keyed by tone."""
+    db = get_db()
+    try:
+        ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+        return dict(ticket.drafts or {}) if ticket else {}
+    finally:
+        db.close()
+
+def get_draft(ticket_id, tone):
+    """Stored reply draft for a ticket in the given tone, or None."""
+    return get_drafts(ticket_id).get(tone)
+
+def save_drafts(ticket_id, drafts):
+    """Merge {tone: reply} drafts into the ticket's stored drafts."""
+    if not drafts:
+        return
+    db = get_db()
+    try:
+        ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+        if ticket:
+            # Reassign so SQLAlchemy sees the JSONB change
+            ticket.drafts = {**(ticket.drafts or {}), **drafts}
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error saving drafts: {e}", extra={"ticket_id": ticket_id})
     finally:
         db.close()
 
+def save_draft(ticket_id, tone, reply):
+    save_drafts(ticket_id, {tone: reply})
+
 def get_resolved_tickets():
     db = get_db()
     try:
@@ -148,11 +204,11 @@ def mark_notified(ticket_id):
 # Stub for load_db/save_db to keep compatibility if other modules import them
 # but they shouldn't run logic anymore.
 def load_db():
-    print("WARNING: load_db() is deprecated, use DB connection")
+    logger.warning("load_db() is deprecated, use DB connection")
     return {"tickets": []}
 
 def save_db(db):
-    print("WARNING: save_db() is deprecated, use DB connection")
+    logger.warning("save_db() is deprecated, use DB connection")
     pass
 
 if __name__ == "__main__":
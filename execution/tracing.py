@@ -0,0 +1,194 @@
+"""
+Pipeline Tracing
+
+Spans for one pipeline run, aggregated into a compact report that is stored
+in the `pipeline_runs` table and served by the API.
+
+A run is traced on the thread that calls `start()`; spans opened on that
+thread nest under it:
+    tenant   one per tenant (span named "tenant" with tenant=<email>)
+    fetch    a Twitter search or Reddit query (item)
+    filter   the relevance pre-filter
+    classify the classification loop; classify.post per post (item)
+    tickets  dedup.post (similar-ticket lookup) and persist.post (create/link) per post (items)
+    persist  writing the analyzed posts store
+
+Spans aren't kept individually: each one updates per-name totals (overall and
+per tenant) as it ends, and items also compete for the SLOWEST_ITEMS slowest
+list, so memory stays flat however many posts a run handles. Outside a traced
+run every call is a no-op.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+SLOWEST_ITEMS = 10
+
+logger = logging.getLogger("tracing")
+
+_local = threading.local()
+
+
+class Trace:
+    def __init__(self, kind: str, owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.started_at = time.time()
+        self.duration = None
+        self.status = "running"
+        self.lock = threading.Lock()
+        self.spans: Dict[str, list] = {}  # name -> [count, total seconds, max seconds]
+        self.tenants: Dict[str, Dict] = {}
+        self.counts: Dict[str, int] = {}
+        self.slowest = []  # min-heap of (seconds, seq, item)
+        self._seq = itertools.count()
+
+    def _tenant(self, email: str) -> Dict:
+        return self.tenants.setdefault(email, {"duration_s": None, "spans": {}, "counts": {}})
+
+    def record(self, name: str, seconds: float, tenant: Optional[str], item: Optional[Dict] = None):
+        with self.lock:
+            stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            if tenant:
+                if name == "tenant":
+                    self._tenant(tenant)["duration_s"] = round(seconds, 3)
+                else:
+                    spans = self._tenant(tenant)["spans"]
+                    spans[name] = spans.get(name, 0.0) + seconds
+            if item is not None:
+                entry = (seconds, next(self._seq), {"span": name, "tenant": tenant, **item})
+                if len(self.slowest) < SLOWEST_ITEMS:
+                    heapq.heappush(self.slowest, entry)
+                elif seconds > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, entry)
+
+    def count(self, name: str, n: int, tenant: Optional[str]):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+            if tenant:
+                counts = self._tenant(tenant)["counts"]
+                counts[name] = counts.get(name, 0) + n
+
+    def report(self) -> Dict:
+        with self.lock:
+            return {
+                "duration_s": round(self.duration, 3) if self.duration is not None else None,
+                "spans": {
+                    name: {"count": count, "total_s": round(total, 3), "max_ms": round(longest * 1000, 1)}
+                    for name, (count, total, longest) in self.spans.items()
+                },
+                "counts": dict(self.counts),
+                "tenants": {
+                    email: {**t, "spans": {name: round(s, 3) for name, s in t["spans"].items()}}
+                    for email, t in self.tenants.items()
+                },
+                "slowest": [
+                    {**item, "duration_ms": round(seconds * 1000, 1)}
+                    for seconds, _, item in sorted(self.slowest, reverse=True)
+                ],
+            }
+
+
+def current() -> Optional[Trace]:
+    return getattr(_local, "trace", None)
+
+
+def start(kind: str, owner: Optional[str] = None) -> Trace:
+    """Begin tracing a run on this thread."""
+    trace = Trace(kind, owner)
+    _local.trace = trace
+    _local.tenant = None
+    _local.span = None
+    return trace
+
+
+def finish(status: str = "success") -> Optional[Trace]:
+    """End the run traced on this thread."""
+    trace = current()
+    if trace is not None:
+        trace.duration = time.time() - trace.started_at
+        trace.status = status
+    _local.trace = None
+    _local.tenant = None
+    _local.span = None
+    return trace
+
+
+@contextmanager
+def span(name: str, tenant: Optional[str] = None, _item: Optional[Dict] = None):
+    """Time a block. Passing tenant= attributes it and everything nested in it to that tenant."""
+    trace = current()
+    if trace is None:
+        yield
+        return
+
+    outer_tenant, outer_span = _local.tenant, getattr(_local, "span", None)
+    if tenant:
+        _local.tenant = tenant
+    _local.span = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.record(name, time.perf_counter() - started, _local.tenant, _item)
+        _local.tenant, _local.span = outer_tenant, outer_span
+
+
+def item(name: str, **attrs):
+    """A span for one unit of work (post, query); also a candidate for the report's slowest list."""
+    return span(name, _item=attrs)
+
+
+def current_span() -> Optional[str]:
+    """Name of the innermost open span on this thread, if a run is being traced."""
+    if current() is None:
+        return None
+    return getattr(_local, "span", None)
+
+
+def count(name: str, n: int = 1):
+    trace = current()
+    if trace is not None and n:
+        trace.count(name, n, _local.tenant)
+
+
+def save(trace: Trace):
+    """Store the run's report in pipeline_runs. Failures are logged, never raised."""
+    # Add parent directory to path to import from server
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        from server.database import SessionLocal
+        from server.models import PipelineRun
+    except Exception as e:
+        logger.warning(f"Could not store pipeline run report: {e}", extra={"run_id": trace.id})
+        return
+
+    db = SessionLocal()
+    try:
+        db.add(PipelineRun(
+            id=trace.id,
+            kind=trace.kind,
+            owner=trace.owner,
+            started_at=trace.started_at,
+            duration=trace.duration,
+            status=trace.status,
+            report=trace.report(),
+        ))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not store pipeline run report: {e}", extra={"run_id": trace.id})
+    finally:
+        db.close()
@@ -10,31 +10,63 @@ Rate Limits (per user):
 - Our usage: 10 searches per day (Pro), 20 per day (Teams)
 """
 
+import logging
+import os
 import requests
 from datetime import datetime
 from typing import List, Dict, Optional
 
+import metrics
+
+logger = logging.getLogger("twitter")
+
+# Overridable so the client can be pointed at a local stand-in server
+TWITTER_API_URL = os.environ.get("TWITTER_API_URL", "https://api.twitter.com/2")
+
+
+def tweet_to_post(tweet: Dict, users: Dict[str, Dict]) -> Dict:
+    """
+    Transform a Twitter API v2 tweet object into our standard post format.
+    
+    Args:
+        tweet: Tweet object from the "data" field of an API response
+        users: Author objects from "includes.users", keyed by user ID
+    """
+    author = users.get(tweet.get("author_id"), {})
+    return {
+        "id": f"twitter_{tweet['id']}",
+        "platform": "twitter",
+        "user_handle": f"@{author.get('username', 'unknown')}",
+        "content": tweet["text"],
+        "url": f"https://twitter.com/{author.get('username', 'i')}/status/{tweet['id']}",
+        "timestamp": tweet.get("created_at", datetime.now().isoformat()),
+        "lang": tweet.get("lang"),
+        "metrics": tweet.get("public_metrics", {})
+    }
+
 
 class TwitterAPIClient:
     """Client for Twitter API v2 using OAuth 2.0 user tokens."""
     
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, base_url: Optional[str] = None):
         """
         Initialize Twitter API client.
         
         Args:
-            access_token: OAuth 2.0 access token for the user
+            access_token: OAuth 2.0 access token for the user (or app bearer token)
+            base_url: API root, defaults to TWITTER_API_URL
         """
         self.access_token = access_token
-        self.base_url = "https://api.twitter.com/2"
+        self.base_url = base_url or TWITTER_API_URL
     
-    def search_recent_tweets(self, query: str, max_results: int = 10) -> List[Dict]:
+    def search_recent_tweets(self, query: str, max_results: int = 10, since_id: Optional[str] = None) -> List[Dict]:
         """
         Search recent tweets using user's OAuth token.
         
         Args:
             query: Search query (e.g., "customer support")
             max_results: Maximum number of tweets to return (max 100)
+            since_id: Only return tweets newer than this tweet ID (optional)
         
         Returns:
             List of tweet dictionaries in our standard format
@@ -55,44 +87,34 @@ class TwitterAPIClient:
             "expansions": "author_id",
             "user.fields": "username,name,verified"
         }
+        if since_id:
+            params["since_id"] = since_id.replace("twitter_", "")
         
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            response = metrics.timed_request(metrics.TWITTER, requests.get, url, headers=headers, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
             
             # Transform to our standard format
-            tweets = []
             users = {u["id"]: u for u in data.get("includes", {}).get("users", [])}
+            tweets = [tweet_to_post(tweet, users) for tweet in data.get("data", [])]
             
-            for tweet in data.get("data", []):
-                author = users.get(tweet["author_id"], {})
-                tweets.append({
-                    "id": f"twitter_{tweet['id']}",
-                    "platform": "twitter",
-                    "user_handle": f"@{author.get('username', 'unknown')}",
-                    "content": tweet["text"],
-                    "url": f"https://twitter.com/{author.get('username', 'i')}/status/{tweet['id']}",
-                    "timestamp": tweet.get("created_at", datetime.now().isoformat()),
-                    "metrics": tweet.get("public_metrics", {})
-                })
-            
-            print(f"✅ Found {len(tweets)} tweets for query: {query}")
+            logger.debug("Found tweets", extra={"query": query, "tweets": len(tweets)})
             return tweets
         
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 429:
-                print(f"⚠️ Rate limit hit for query: {query}")
+                logger.warning("Rate limit hit", extra={"query": query})
                 return []
             elif e.response.status_code == 401:
-                print(f"⚠️ Invalid or expired token for query: {query}")
+                logger.warning("Invalid or expired token", extra={"query": query})
                 return []
             else:
-                print(f"❌ HTTP error {e.response.status_code}: {e}")
+                logger.error(f"Twitter search failed: {e}", extra={"query": query, "status": e.response.status_code})
                 return []
         
         except Exception as e:
-            print(f"❌ Error searching Twitter: {e}")
+            logger.error(f"Error searching Twitter: {e}", extra={"query": query})
             return []
     
     def create_tweet(self, text: str, reply_to_id: Optional[str] = None) -> Optional[Dict]:
@@ -122,18 +144,19 @@ class TwitterAPIClient:
             payload["reply"] = {"in_reply_to_tweet_id": clean_id}
             
         try:
-            print(f"🚀 Posting tweet: {payload}")
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
+            logger.debug("Posting tweet", extra={"reply_to": payload.get("reply", {}).get("in_reply_to_tweet_id"), "chars": len(text)})
+            response = metrics.timed_request(metrics.TWITTER, requests.post, url, headers=headers, json=payload, timeout=10)
             
             if response.status_code in [200, 201]:
-                print(f"✅ Tweet successfully posted!")
+                logger.info("Tweet posted", extra={"reply_to": payload.get("reply", {}).get("in_reply_to_tweet_id")})
                 return response.json().get("data", {})
             else:
-                print(f"❌ Failed to post tweet ({response.status_code}): {response.text}")
+                logger.warning("Failed to post tweet", extra={"status": response.status_code})
+                logger.debug("Tweet rejected", extra={"status": response.status_code, "body": response.text[:500]})
                 return None
                 
         except Exception as e:
-            print(f"❌ Error posting tweet: {e}")
+            logger.error(f"Error posting tweet: {e}")
             return None
 
     def test_connection(self) -> bool:
@@ -148,7 +171,7 @@ class TwitterAPIClient:
         params = {"query": "test", "max_results": 10}
         
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=5)
+            response = metrics.timed_request(metrics.TWITTER, requests.get, url, headers=headers, params=params, timeout=5)
             return response.status_code == 200
         except:
             return False
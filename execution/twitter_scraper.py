@@ -2,9 +2,11 @@
 Twitter Scraper Module for Pipeline
 
 This module handles Twitter scraping using user OAuth tokens with quota enforcement.
-Each user gets 10 searches/day (Pro) or 20 searches/day (Teams).
+Each user gets 10 searches/day (Pro) or 20 searches/day (Teams), tracked in the
+atomic usage_counters table (see usage_counters.py).
 """
 
+import logging
 import sys
 import os
 from datetime import datetime
@@ -14,6 +16,14 @@ from typing import List, Dict
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from twitter_api_client import TwitterAPIClient
+from source_rates import SourceRates, source_key
+import usage_counters
+
+logger = logging.getLogger("twitter")
+
+# Resource names in the usage_counters table
+SEARCHES = "twitter_searches"
+TWEETS = "twitter_tweets"
 
 
 def get_twitter_quota_limits(plan: str) -> Dict[str, int]:
@@ -26,22 +36,22 @@ def get_twitter_quota_limits(plan: str) -> Dict[str, int]:
     return limits.get(plan, limits["Free"])
 
 
-def reset_quota_if_needed(user: Dict) -> Dict:
-    """Reset quota if it's a new day."""
-    today = datetime.now().date().isoformat()
-    quota = user.get("twitter_quota", {})
-    
+def get_twitter_quota(email: str, plan: str, db=None) -> Dict:
+    """
+    Current day's Twitter quota for a user, read from the atomic usage counters.
     
-    if quota.get("last_reset") != today or "tweets_limit" not in quota:
-        limits = get_twitter_quota_limits(user["plan"])
-        user["twitter_quota"] = {
-            "searches_today": 0,
-            "tweets_today": 0,
-            "last_reset": today,
-            "searches_limit": limits["searches"],
-            "tweets_limit": limits["tweets"]
-        }
-    return user
+    Same shape as the legacy `users.twitter_quota` blob. Counters are keyed by day,
+    so there is nothing to reset.
+    """
+    limits = get_twitter_quota_limits(plan)
+    usage = usage_counters.get_usage(email, db=db)
+    return {
+        "searches_today": usage.get(SEARCHES, 0),
+        "tweets_today": usage.get(TWEETS, 0),
+        "searches_limit": limits["searches"],
+        "tweets_limit": limits["tweets"],
+        "last_reset": datetime.now().date().isoformat()
+    }
 
 
 def can_search_twitter(user: Dict) -> tuple[bool, str]:
@@ -56,34 +66,31 @@ def can_search_twitter(user: Dict) -> tuple[bool, str]:
     if not oauth or not oauth.get("access_token"):
         return False, "No Twitter OAuth token found"
     
-    quota = user.get("twitter_quota", {})
-    searches_today = quota.get("searches_today", 0)
-    searches_limit = quota.get("searches_limit", 0)
-    
-    if searches_today >= searches_limit:
-        return False, f"Daily limit reached ({searches_limit} searches/day)"
+    quota = get_twitter_quota(user["email"], user["plan"])
+    if quota["searches_today"] >= quota["searches_limit"]:
+        return False, f"Daily limit reached ({quota['searches_limit']} searches/day)"
     
     return True, "OK"
 
 
-def search_twitter_for_user(user: Dict, max_tweets_per_search: int = 10) -> List[Dict]:
+def search_twitter_for_user(user: Dict, max_tweets_per_search: int = 10, rates: SourceRates = None, seen_ids=()) -> List[Dict]:
     """
     Search Twitter using user's OAuth token with quota enforcement.
     
     Args:
         user: User dictionary from database
         max_tweets_per_search: Max tweets to fetch per search query
+        rates: Adaptive polling state. If given, only due queries are searched,
+            busiest first, and each result is recorded against its query.
+        seen_ids: Already analyzed post IDs, used to count new posts per query
     
     Returns:
         List of tweet dictionaries
     """
-    # Reset quota if needed
-    user = reset_quota_if_needed(user)
-    
     # Check if user can search
     can_search, message = can_search_twitter(user)
     if not can_search:
-        print(f"⚠️ Skipping Twitter for {user['email']}: {message}")
+        logger.info(f"Skipping Twitter: {message}", extra={"user": user["email"]})
         return []
     
     # Get search terms from config
@@ -92,50 +99,64 @@ def search_twitter_for_user(user: Dict, max_tweets_per_search: int = 10) -> List
     twitter_keywords = [k.strip() for k in twitter_keywords if k.strip()]
     
     if not twitter_keywords:
-        print(f"⚠️ No Twitter keywords configured for {user['email']}")
+        logger.info("No Twitter keywords configured", extra={"user": user["email"]})
         return []
     
     # Initialize Twitter client with user's token
     oauth = user["twitter_oauth"]
     client = TwitterAPIClient(oauth["access_token"])
     
-    # Search for each keyword
     all_tweets = []
-    quota = user["twitter_quota"]
+    email = user["email"]
+    limits = get_twitter_quota_limits(user["plan"])
+    product_name = config.get("product_name", "").strip()
     
+    # Inject Product Name if configured (Strict Source Filtering)
+    queries = {}
     for keyword in twitter_keywords:
-        # Check quota before each search
-        if quota["searches_today"] >= quota["searches_limit"]:
-            print(f"⚠️ Daily search quota exhausted for {user['email']}")
-            break
-        
-        # Check tweet quota
-        tweets_remaining = quota["tweets_limit"] - quota.get("tweets_today", 0)
-        if tweets_remaining <= 0:
-            print(f"⚠️ Daily tweet quota exhausted for {user['email']}")
-            break
-        
-        max_results = min(max_tweets_per_search, tweets_remaining)
-        
-        # Inject Product Name if configured (Strict Source Filtering)
-        product_name = config.get("product_name", "").strip()
         search_query = keyword
         if product_name:
             search_query = f'"{product_name}" {keyword}'
+        queries[source_key(email, "twitter", search_query)] = search_query
+    
+    keys = list(queries)
+    if rates is not None:
+        keys = rates.due(keys)
+        if not keys:
+            logger.info("No Twitter queries due", extra={"user": email})
+    
+    # Search each query. The search and its tweet allowance are taken from the
+    # counters atomically up front, so parallel workers can't overshoot the limits.
+    for key in keys:
+        search_query = queries[key]
+        if usage_counters.consume(email, SEARCHES, 1, limits["searches"]) is None:
+            logger.warning("Daily search quota exhausted", extra={"user": email})
+            break
+        
+        max_results = usage_counters.reserve(email, TWEETS, max_tweets_per_search, limits["tweets"])
+        if max_results <= 0:
+            usage_counters.release(email, SEARCHES, 1)
+            logger.warning("Daily tweet quota exhausted", extra={"user": email})
+            break
         
-        print(f"🐦 Searching Twitter for: '{search_query}' (max {max_results} tweets)")
         tweets = client.search_recent_tweets(search_query, max_results=max_results)
         
-        # Update quota
-        quota["searches_today"] += 1
-        quota["tweets_today"] = quota.get("tweets_today", 0) + len(tweets)
+        # Return the unused part of the tweet reservation
+        if len(tweets) < max_results:
+            usage_counters.release(email, TWEETS, max_results - len(tweets))
         
-        all_tweets.extend(tweets)
+        if rates is not None:
+            new_count = sum(1 for t in tweets if t["id"] not in seen_ids)
+            rates.record(key, new_count, saturated=len(tweets) >= max_results)
         
-        print(f"   Found {len(tweets)} tweets. Quota: {quota['searches_today']}/{quota['searches_limit']} searches, {quota['tweets_today']}/{quota['tweets_limit']} tweets")
+        all_tweets.extend(tweets)
+        logger.debug("Searched Twitter", extra={"user": email, "query": search_query, "max_results": max_results,
+                                                "posts": len(tweets)})
     
-    # Save updated quota back to user
-    user["twitter_quota"] = quota
+    # Keep a snapshot on the user dict for display; the counters are authoritative
+    user["twitter_quota"] = get_twitter_quota(email, user["plan"])
+    quota = user["twitter_quota"]
+    logger.info("Twitter quota", extra={"user": email, **{k: quota[k] for k in ("searches_today", "searches_limit", "tweets_today", "tweets_limit")}})
     
     return all_tweets
 
@@ -151,12 +172,6 @@ if __name__ == "__main__":
         },
         "twitter_oauth": {
             "access_token": "YOUR_TOKEN_HERE"
-        },
-        "twitter_quota": {
-            "searches_today": 0,
-            "tweets_today": 0,
-            "searches_limit": 10,
-            "last_reset": datetime.now().date().isoformat()
         }
     }
     
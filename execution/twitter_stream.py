@@ -0,0 +1,327 @@
+"""
+Twitter Filtered-Stream Ingester
+
+Long-lived alternative to hourly Twitter polling for Pro/Teams tenants.
+Keeps ONE filtered-stream connection for the whole app (app bearer token),
+manages stream rules built from every tenant's `twitter_keywords`/`product_name`,
+routes each matched tweet to the tenants whose rules it matched and pushes it
+straight into classification and ticket creation.
+
+On disconnect it reconnects with exponential backoff and backfills the gap
+with a recent search (since the last tweet seen) for every active rule.
+
+Set TWITTER_API_URL to point at a local stand-in stream server for testing.
+Set TWITTER_STREAM_ENABLED=1 for the polling pipeline so it stops searching
+Twitter for users the stream already covers.
+
+Usage:
+    python3 execution/twitter_stream.py
+    python3 execution/twitter_stream.py --sync-rules-only
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import requests
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_config
+import metrics
+from twitter_api_client import TwitterAPIClient, TWITTER_API_URL, tweet_to_post
+from run_user_pipeline import (
+    load_users_db,
+    load_analyzed_posts,
+    get_analyzed_ids,
+    process_new_posts,
+    record_analyzed_posts,
+)
+
+STREAM_PLANS = ("Pro", "Teams")
+RULE_TAG_PREFIX = "lc:"
+RULE_MAX_LENGTH = 512
+RULES_REFRESH_SECONDS = int(os.environ.get("TWITTER_STREAM_RULES_REFRESH", "300"))
+STREAM_WORKERS = int(os.environ.get("TWITTER_STREAM_WORKERS", "4"))
+BACKFILL_MAX_RESULTS = 100
+
+# Backoff (seconds) following Twitter's reconnect guidance
+NETWORK_BACKOFF_START = 0.25
+NETWORK_BACKOFF_MAX = 16
+HTTP_BACKOFF_START = 5
+HTTP_BACKOFF_MAX = 320
+RATE_LIMIT_BACKOFF_START = 60
+
+logger = logging.getLogger("stream")
+
+
+def get_bearer_token():
+    """App-level bearer token (filtered stream does not accept user tokens)."""
+    return os.environ.get("TWITTER_BEARER_TOKEN")
+
+
+def is_stream_tenant(user: Dict) -> bool:
+    """Tenants eligible for streaming: paid plan with Twitter connected and keywords set."""
+    if user.get("plan") not in STREAM_PLANS:
+        return False
+    if "twitter" not in user.get("connected_platforms", []):
+        return False
+    return bool(get_twitter_keywords(user))
+
+
+def get_twitter_keywords(user: Dict) -> List[str]:
+    config = user.get("config", {})
+    keywords = config.get("twitter_keywords", "").split(",")
+    return [k.strip() for k in keywords if k.strip()]
+
+
+def build_rule_value(keyword: str, product_name: str = "") -> str:
+    """Same query shape as search_twitter_for_user, minus retweets."""
+    value = keyword
+    if product_name:
+        value = f'"{product_name}" {keyword}'
+    return f"{value} -is:retweet"
+
+
+def rule_tag(value: str) -> str:
+    return RULE_TAG_PREFIX + hashlib.sha1(value.encode("utf-8")).hexdigest()[:16]
+
+
+def build_rules(users: List[Dict]) -> Dict[str, Dict]:
+    """
+    Build the desired rule set from all tenants.
+
+    Tenants with identical queries share one rule, so the result is keyed by
+    tag and each entry lists every tenant email routed through it.
+
+    Returns:
+        {tag: {"value": str, "emails": set}}
+    """
+    rules = {}
+    for user in users:
+        if not is_stream_tenant(user):
+            continue
+        product_name = user.get("config", {}).get("product_name", "").strip()
+        for keyword in get_twitter_keywords(user):
+            value = build_rule_value(keyword, product_name)
+            if len(value) > RULE_MAX_LENGTH:
+                logger.warning("Skipping rule: query too long", extra={"user": user["email"], "max_length": RULE_MAX_LENGTH})
+                continue
+            tag = rule_tag(value)
+            rules.setdefault(tag, {"value": value, "emails": set()})["emails"].add(user["email"])
+    return rules
+
+
+class TwitterStreamIngester:
+    """Owns the app's filtered-stream connection and its rule set."""
+
+    def __init__(self, bearer_token: str, base_url: Optional[str] = None):
+        self.bearer_token = bearer_token
+        self.base_url = base_url or TWITTER_API_URL
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {bearer_token}",
+            "User-Agent": "LoopCloser/1.0"
+        })
+        self.users: Dict[str, Dict] = {}
+        self.rules: Dict[str, Dict] = {}
+        self.analyzed_ids: Set[str] = set()
+        self.last_tweet_id: Optional[str] = None
+        self.last_rules_sync = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream-classify")
+
+    # --- Rules ---
+
+    def refresh_tenants(self):
+        """Reload tenants and rebuild the desired rule set."""
+        db = load_users_db()
+        self.users = {u["email"]: u for u in db.get("users", [])}
+        self.rules = build_rules(list(self.users.values()))
+        # Merge rather than replace: ids routed but not yet recorded by their classify job must stay seen
+        self.analyzed_ids |= get_analyzed_ids(load_analyzed_posts())
+
+    def get_remote_rules(self) -> List[Dict]:
+        response = metrics.timed_request(metrics.TWITTER, self.session.get, f"{self.base_url}/tweets/search/stream/rules", timeout=10)
+        response.raise_for_status()
+        return response.json().get("data", [])
+
+    def sync_rules(self):
+        """Diff remote rules against the desired set and apply adds/deletes."""
+        self.refresh_tenants()
+        remote = self.get_remote_rules()
+
+        # Only touch rules we own, identified by tag prefix
+        ours = {r.get("tag"): r for r in remote if (r.get("tag") or "").startswith(RULE_TAG_PREFIX)}
+        stale_ids = [r["id"] for tag, r in ours.items() if tag not in self.rules]
+        missing = [{"value": r["value"], "tag": tag} for tag, r in self.rules.items() if tag not in ours]
+
+        url = f"{self.base_url}/tweets/search/stream/rules"
+        if stale_ids:
+            response = metrics.timed_request(metrics.TWITTER, self.session.post, url, json={"delete": {"ids": stale_ids}}, timeout=10)
+            response.raise_for_status()
+            logger.info("Deleted stale stream rules", extra={"rules": len(stale_ids)})
+        if missing:
+            response = metrics.timed_request(metrics.TWITTER, self.session.post, url, json={"add": missing}, timeout=10)
+            response.raise_for_status()
+            for error in response.json().get("errors", []):
+                logger.warning("Stream rule rejected", extra={"rule": error.get("value"), "error": error.get("title")})
+            logger.info("Added stream rules", extra={"rules": len(missing)})
+
+        self.last_rules_sync = time.time()
+        logger.info("Stream rules in sync", extra={
+            "rules": len(self.rules), "tenants": len({e for r in self.rules.values() for e in r["emails"]})
+        })
+
+    # --- Routing ---
+
+    def route(self, post: Dict, tags: List[str]):
+        """Push a matched post into classification for each tenant behind the matched rules."""
+        if post["id"] in self.analyzed_ids:
+            return
+        self.analyzed_ids.add(post["id"])
+
+        emails = set()
+        for tag in tags:
+            emails.update(self.rules.get(tag, {}).get("emails", ()))
+
+        for email in emails:
+            user = self.users.get(email)
+            if user:
+                self.executor.submit(self.classify_for_user, user, post)
+
+    def classify_for_user(self, user: Dict, post: Dict):
+        try:
+            analyzed = process_new_posts(user, [post])
+            record_analyzed_posts(analyzed)
+        except Exception:
+            logger.exception("Stream classification failed", extra={"user": user["email"], "post_id": post["id"]})
+
+    def handle_line(self, line: bytes):
+        """Parse one line of the stream. Blank lines are keep-alive heartbeats."""
+        if not line or not line.strip():
+            return
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning("Unparseable stream line", extra={"line": repr(line[:200])})
+            return
+
+        if "errors" in message and "data" not in message:
+            logger.warning("Stream error", extra={"errors": message["errors"]})
+            return
+
+        tweet = message.get("data")
+        if not tweet:
+            return
+        users = {u["id"]: u for u in message.get("includes", {}).get("users", [])}
+        tags = [r.get("tag") for r in message.get("matching_rules", [])]
+
+        self.last_tweet_id = tweet["id"]
+        self.route(tweet_to_post(tweet, users), tags)
+
+    # --- Backfill ---
+
+    def backfill(self):
+        """Recover tweets missed while disconnected via recent search since the last seen tweet."""
+        if not self.last_tweet_id:
+            return
+        logger.info("Backfilling missed tweets", extra={"since_id": self.last_tweet_id})
+        client = TwitterAPIClient(self.bearer_token, base_url=self.base_url)
+        newest = self.last_tweet_id
+        # Collect every rule a missed tweet matches first: route() drops ids it has already seen,
+        # so routing per rule would give a tweet only to the tenants of the first rule it matched
+        matched: Dict[str, Tuple[Dict, Set[str]]] = {}
+        for tag, rule in self.rules.items():
+            tweets = client.search_recent_tweets(rule["value"], max_results=BACKFILL_MAX_RESULTS, since_id=self.last_tweet_id)
+            for post in tweets:
+                matched.setdefault(post["id"], (post, set()))[1].add(tag)
+                tweet_id = post["id"].replace("twitter_", "")
+                if int(tweet_id) > int(newest):
+                    newest = tweet_id
+        for post, tags in matched.values():
+            self.route(post, list(tags))
+        self.last_tweet_id = newest
+
+    # --- Connection ---
+
+    def connect(self):
+        """Open the stream and consume it until the connection drops."""
+        params = {
+            "tweet.fields": "created_at,author_id,public_metrics,lang",
+            "expansions": "author_id",
+            "user.fields": "username,name,verified"
+        }
+        # Twitter sends a heartbeat every ~20s; treat 90s of silence as a stall
+        with metrics.timed_request(metrics.TWITTER, self.session.get, f"{self.base_url}/tweets/search/stream", params=params, stream=True, timeout=(10, 90)) as response:
+            response.raise_for_status()
+            logger.info("Connected to filtered stream")
+            for line in response.iter_lines():
+                self.handle_line(line)
+                if time.time() - self.last_rules_sync > RULES_REFRESH_SECONDS:
+                    self.sync_rules()
+
+    def run_forever(self):
+        """Maintain the connection, reconnecting with backoff and backfilling gaps."""
+        network_backoff = NETWORK_BACKOFF_START
+        http_backoff = HTTP_BACKOFF_START
+
+        while True:
+            try:
+                if time.time() - self.last_rules_sync > RULES_REFRESH_SECONDS:
+                    self.sync_rules()
+                if not self.rules:
+                    logger.info("No stream tenants", extra={"retry_in_s": RULES_REFRESH_SECONDS})
+                    time.sleep(RULES_REFRESH_SECONDS)
+                    continue
+
+                self.backfill()
+                self.connect()
+                # Server closed the stream cleanly; reconnect right away
+                network_backoff = NETWORK_BACKOFF_START
+                http_backoff = HTTP_BACKOFF_START
+
+            except KeyboardInterrupt:
+                logger.info("Stream ingester stopped by user")
+                break
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else 0
+                if status == 429:
+                    wait = max(http_backoff, RATE_LIMIT_BACKOFF_START)
+                else:
+                    wait = http_backoff
+                logger.warning("Stream HTTP error, reconnecting", extra={"status": status, "retry_in_s": wait})
+                time.sleep(wait)
+                http_backoff = min(wait * 2, HTTP_BACKOFF_MAX)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                logger.warning("Stream disconnected, reconnecting", extra={"error": e.__class__.__name__, "retry_in_s": network_backoff})
+                time.sleep(network_backoff)
+                network_backoff = min(network_backoff * 2, NETWORK_BACKOFF_MAX)
+            except Exception:
+                logger.exception("Stream ingester error, reconnecting", extra={"retry_in_s": http_backoff})
+                time.sleep(http_backoff)
+                http_backoff = min(http_backoff * 2, HTTP_BACKOFF_MAX)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Twitter filtered-stream ingester")
+    parser.add_argument("--sync-rules-only", action="store_true", help="Sync stream rules with tenant configs and exit")
+    args = parser.parse_args()
+    log_config.setup("stream")
+
+    token = get_bearer_token()
+    if not token:
+        logger.error("TWITTER_BEARER_TOKEN not set")
+        sys.exit(1)
+
+    ingester = TwitterStreamIngester(token)
+    if args.sync_rules_only:
+        ingester.sync_rules()
+    else:
+        ingester.run_forever()
@@ -0,0 +1,128 @@
+"""
+Atomic Usage Counters
+
+Per-day usage counters in the `usage_counters(email, resource, day, n)` table.
+Every change is a single upsert statement (INSERT ... ON CONFLICT DO UPDATE
+SET n = n + :amount ... RETURNING n) run in autocommit mode, so checking and
+consuming quota is one round-trip that stays correct when several pipeline
+workers or API requests hit the same counter at once. The daily reset is
+implicit: a new day is a new key.
+
+Resources in use:
+    twitter_searches, twitter_tweets
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+# Add parent directory to path to import from server
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.database import engine
+
+# Adds `amount` only if the new total stays within `limit`. When the limit would be
+# exceeded the conflict WHERE fails and no row is returned. The conflicting row is
+# locked for the duration of the statement, so concurrent callers serialize.
+CONSUME_SQL = text("""
+    INSERT INTO usage_counters (email, resource, day, n)
+    SELECT :email, :resource, :day, :amount
+    WHERE :amount <= :limit
+    ON CONFLICT (email, resource, day) DO UPDATE
+    SET n = usage_counters.n + EXCLUDED.n
+    WHERE usage_counters.n + EXCLUDED.n <= :limit
+    RETURNING n
+""")
+
+ADD_SQL = text("""
+    INSERT INTO usage_counters (email, resource, day, n)
+    VALUES (:email, :resource, :day, GREATEST(:amount, 0))
+    ON CONFLICT (email, resource, day) DO UPDATE
+    SET n = GREATEST(usage_counters.n + :amount, 0)
+    RETURNING n
+""")
+
+USAGE_SQL = text("""
+    SELECT resource, n FROM usage_counters
+    WHERE email = :email AND day = :day
+""")
+
+PRUNE_SQL = text("DELETE FROM usage_counters WHERE day < :before")
+
+
+def _today():
+    return date.today()
+
+
+def _execute(statement, params, db=None):
+    """Run a statement on the caller's session, or as a standalone autocommit round-trip."""
+    if db is not None:
+        result = db.execute(statement, params)
+        rows = result.fetchall() if result.returns_rows else []
+        db.commit()
+        return rows
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        result = conn.execute(statement, params)
+        return result.fetchall() if result.returns_rows else []
+
+
+def consume(email: str, resource: str, amount: int, limit: int, day: Optional[date] = None, db=None) -> Optional[int]:
+    """
+    Atomically consume `amount` units if that keeps the day's total within `limit`.
+
+    Returns:
+        The new total, or None if the limit would be exceeded (nothing is consumed).
+    """
+    rows = _execute(CONSUME_SQL, {
+        "email": email,
+        "resource": resource,
+        "day": day or _today(),
+        "amount": amount,
+        "limit": limit
+    }, db)
+    return rows[0][0] if rows else None
+
+
+def reserve(email: str, resource: str, amount: int, limit: int, day: Optional[date] = None, db=None) -> int:
+    """
+    Consume up to `amount` units, granting whatever is left if the full amount doesn't fit.
+
+    Returns:
+        Number of units granted (0 if the quota is exhausted).
+    """
+    day = day or _today()
+    if consume(email, resource, amount, limit, day, db) is not None:
+        return amount
+
+    remaining = limit - get_usage(email, day, db).get(resource, 0)
+    if remaining <= 0:
+        return 0
+    # Another worker may have taken the remainder in between; consume() never overshoots
+    if consume(email, resource, remaining, limit, day, db) is not None:
+        return remaining
+    return 0
+
+
+def release(email: str, resource: str, amount: int, day: Optional[date] = None, db=None) -> int:
+    """Give back units reserved but not used. Returns the new total."""
+    rows = _execute(ADD_SQL, {
+        "email": email,
+        "resource": resource,
+        "day": day or _today(),
+        "amount": -amount
+    }, db)
+    return rows[0][0]
+
+
+def get_usage(email: str, day: Optional[date] = None, db=None) -> Dict[str, int]:
+    """Return {resource: count} for a user on a given day (today by default)."""
+    rows = _execute(USAGE_SQL, {"email": email, "day": day or _today()}, db)
+    return {resource: n for resource, n in rows}
+
+
+def prune(keep_days: int = 30, db=None):
+    """Delete counters older than `keep_days`."""
+    _execute(PRUNE_SQL, {"before": _today() - timedelta(days=keep_days)}, db)
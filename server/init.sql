@@ -21,9 +21,19 @@ CREATE TABLE IF NOT EXISTS tickets (
     linked_users TEXT[],
     created_at FLOAT,
     notified BOOLEAN DEFAULT FALSE,
-    owner TEXT REFERENCES users(email)
+    owner TEXT REFERENCES users(email),
+    drafts JSONB DEFAULT '{}', -- reply drafts keyed by tone
+    sentiment TEXT, -- positive, negative, neutral
+    intent TEXT,    -- complaint, question, praise, feature_request, general
+    sarcasm BOOLEAN,
+    confidence FLOAT,
+    analysis JSONB DEFAULT '{}' -- full classifier output
 );
 
+CREATE INDEX IF NOT EXISTS ix_tickets_owner_created ON tickets (owner, created_at);
+CREATE INDEX IF NOT EXISTS ix_tickets_owner_open ON tickets (owner, created_at) WHERE status = 'OPEN';
+CREATE INDEX IF NOT EXISTS ix_tickets_owner_open_high ON tickets (owner, created_at) WHERE status = 'OPEN' AND urgency = 'high';
+
 -- Transactions Table
 CREATE TABLE IF NOT EXISTS transactions (
     tracking_id UUID PRIMARY KEY,
@@ -32,3 +42,25 @@ CREATE TABLE IF NOT EXISTS transactions (
     status TEXT,
     created_at FLOAT
 );
+
+-- Usage Counters Table (atomic per-day quota counters, reset implicitly by day)
+CREATE TABLE IF NOT EXISTS usage_counters (
+    email TEXT NOT NULL,
+    resource TEXT NOT NULL, -- twitter_searches, twitter_tweets
+    day DATE NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (email, resource, day)
+);
+
+-- Pipeline Runs Table (per-run tracing report)
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+    id TEXT PRIMARY KEY,
+    kind TEXT,        -- run_user_pipeline
+    owner TEXT,       -- tenant for single-tenant runs, NULL for all-tenant runs
+    started_at FLOAT,
+    duration FLOAT,
+    status TEXT,      -- success, failed
+    report JSONB DEFAULT '{}' -- stage timings, counts, slowest items
+);
+
+CREATE INDEX IF NOT EXISTS ix_pipeline_runs_owner_started ON pipeline_runs (owner, started_at);
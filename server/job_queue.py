@@ -0,0 +1,111 @@
+"""
+In-process background job queue for pipeline scans.
+
+"Scan Now" clicks are queued onto a fixed-size pool of warm worker threads
+instead of spawning a new interpreter per click. Triggers for a tenant that
+already has a queued or running scan are coalesced onto that job.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+JOB_RETENTION_SECONDS = int(os.getenv("PIPELINE_JOB_RETENTION", "3600"))
+
+logger = logging.getLogger("jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobQueue:
+    def __init__(self, runner: Callable[[str], object], max_workers: int = PIPELINE_WORKERS):
+        """
+        Args:
+            runner: Called with the tenant email in a worker thread. Its return
+                value is stored via `summarize` as the job result.
+            max_workers: Upper bound on concurrent scans
+        """
+        self.runner = runner
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-job")
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Dict] = {}
+        self.active: Dict[str, str] = {}  # tenant email -> job id (queued or running)
+
+    def submit(self, email: str) -> Dict:
+        """
+        Queue a scan for a tenant, or return the tenant's existing active job.
+
+        Returns:
+            Snapshot of the job, with "coalesced" set if an existing job was reused
+        """
+        with self.lock:
+            self._prune()
+            job_id = self.active.get(email)
+            if job_id:
+                return {**self.jobs[job_id], "coalesced": True}
+
+            job = {
+                "id": uuid.uuid4().hex,
+                "email": email,
+                "status": QUEUED,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+            self.jobs[job["id"]] = job
+            self.active[email] = job["id"]
+            snapshot = {**job, "coalesced": False}
+
+        self.executor.submit(self._run, job["id"])
+        return snapshot
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run(self, job_id: str):
+        with self.lock:
+            job = self.jobs[job_id]
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+
+        try:
+            result = self.runner(job["email"])
+            status, error = SUCCEEDED, None
+        except Exception as e:
+            result, status, error = None, FAILED, str(e)
+            logger.exception("Pipeline job failed", extra={"job_id": job_id, "user": job["email"]})
+
+        with self.lock:
+            job["status"] = status
+            job["error"] = error
+            job["result"] = self.summarize(result)
+            job["finished_at"] = time.time()
+            if self.active.get(job["email"]) == job_id:
+                del self.active[job["email"]]
+
+    @staticmethod
+    def summarize(result) -> Optional[Dict]:
+        """Keep only a small summary of the runner's output on the job record."""
+        if isinstance(result, list):
+            return {"posts_analyzed": len(result)}
+        return result
+
+    def _prune(self):
+        """Drop finished jobs past the retention window. Caller holds the lock."""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job["finished_at"] and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -1,28 +1,65 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.routing import APIRoute
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+import asyncio
 import json
+import logging
 import os
+import re
 import sys
-from typing import List, Optional, Dict
-from pydantic import BaseModel
+from typing import Any, List, Optional, Dict
+from uuid import UUID
+from pydantic import BaseModel, ConfigDict
+import threading
 import time
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, case, func
 
 # Add execution directory to path so we can import ticket_manager and others
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "execution"))
 
 # Import DB and Models
 from database import get_db, engine, Base
-from models import User as UserModel, Ticket as TicketModel, Transaction as TransactionModel
+from models import User as UserModel, Ticket as TicketModel, Transaction as TransactionModel, PipelineRun
 import ticket_manager 
 import llm_classifier
+from twitter_scraper import get_twitter_quota as get_twitter_quota_snapshot
+import run_user_pipeline
+from job_queue import JobQueue
+import metrics
+import profiling
+import query_stats
+import log_config
+
+log_config.setup("api")
+logger = logging.getLogger("api")
 
 # Create tables if they don't exist (redundant if migrate.py ran, but good for safety)
 Base.metadata.create_all(bind=engine)
+metrics.instrument_engine(engine)
+query_stats.install()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class ORJSONResponse(JSONResponse):
+    """JSON bodies encoded with orjson (falls back to the stdlib encoder if it isn't installed)."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# Endpoints declare a response_model: FastAPI validates and dumps through it, then orjson encodes the result
+app = FastAPI(title="The Loop Closer API", default_response_class=ORJSONResponse)
 
-app = FastAPI(title="The Loop Closer API")
+# Background scans triggered from the dashboard, scoped to the requesting tenant
+pipeline_jobs = JobQueue(lambda email: run_user_pipeline.run_pipeline_for_all_users(user_id=email))
 
 # Enable CORS for Next.js frontend
 app.add_middleware(
@@ -44,13 +81,71 @@ app.add_middleware(
 )
 
 @app.middleware("http")
-async def log_origin(request, call_next):
-    origin = request.headers.get("origin")
-    if origin:
-        print(f"DEBUG: Request Origin: {origin}")
-    response = await call_next(request)
+async def record_request_metrics(request: Request, call_next):
+    metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = 500
+    # One unit of work per request: statement count and repeated query shapes (N+1)
+    with query_stats.unit(f"{request.method} {request.url.path}") as queries:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+            # Label by route template, not raw path, to keep the series count bounded
+            route = request.scope.get("route")
+            route = route.path if route else "unmatched"
+            metrics.HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started, method=request.method, route=route, status=status
+            )
+            metrics.DB_QUERIES_PER_REQUEST.observe(queries.count, route=route)
+            logger.debug("Request handled", extra={
+                "method": request.method, "route": route, "status": status, "queries": queries.count,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "origin": request.headers.get("origin"),
+            })
+
+# cProfile can't run two profilers on the event loop thread, so one profiled request at a time
+profile_lock = threading.Lock()
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """`X-Profile: 1` or `?profile=1` with a matching `X-Admin-Token` profiles this request (see execution/profiling.py)."""
+    if request.headers.get("x-profile") != "1" and request.query_params.get("profile") != "1":
+        return await call_next(request)
+    token = os.getenv("ADMIN_TOKEN")
+    if not token or request.headers.get("x-admin-token") != token:
+        return JSONResponse(status_code=401, content={"detail": "Unauthorized"})
+    if not profile_lock.acquire(blocking=False):
+        return JSONResponse(status_code=409, content={"detail": "Another request is being profiled"})
+
+    try:
+        name = "api-" + request.method.lower() + "-" + re.sub(r"[^A-Za-z0-9]+", "_", request.url.path).strip("_")
+        run = profiling.Profile(name)
+        run.start()
+        # Async code is profiled on the event loop thread (including whatever else runs there meanwhile);
+        # sync endpoints join in from their worker thread, see profile_sync_endpoints()
+        try:
+            with profiling.activate(run), run.thread():
+                response = await call_next(request)
+        finally:
+            # Also when the request fails, or tracemalloc would stay on for the life of the process.
+            # A streamed body is produced after this point and isn't included
+            await run_in_threadpool(run.stop)
+    finally:
+        profile_lock.release()
+    response.headers["X-Profile-Id"] = run.id
     return response
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    # Optional bearer token so the endpoint can stay closed on the public API domain
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # --- Pydantic Models for Requests ---
 class UserDTO(BaseModel):
     email: str
@@ -99,17 +194,172 @@ class ReplyRequest(BaseModel):
     content: str
     tone: str
     context: Optional[str] = None
+    ticket_id: Optional[str] = None
+    refresh: bool = False  # Regenerate even if a stored draft exists
+
+    def draft_key(self) -> Optional[str]:
+        """Tone under which the draft is stored on the ticket. Replies with custom context aren't stored."""
+        if self.ticket_id and not self.context:
+            return self.tone
+        return None
+
+class ReplyVariantsRequest(BaseModel):
+    content: str
+    tones: Optional[List[str]] = None
+    context: Optional[str] = None
+    ticket_id: Optional[str] = None
+    refresh: bool = False
+
+# --- Pydantic Models for Responses ---
+# What each endpoint returns; ORM objects are read through these, so columns not listed
+# (OAuth tokens, quota counters, ticket drafts and raw analysis) never leave the server.
+class UserOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    email: str
+    name: Optional[str] = None
+    plan: Optional[str] = None
+    joined_at: Optional[float] = None
+    config: Optional[Dict[str, Any]] = None
+    connected_platforms: Optional[List[str]] = None
+
+class TransactionOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    tracking_id: UUID
+    merchant_reference: Optional[UUID] = None
+    email: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[float] = None
+
+class TicketOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    source_id: Optional[str] = None
+    summary: Optional[str] = None
+    status: Optional[str] = None
+    type: Optional[str] = None
+    urgency: Optional[str] = None
+    sentiment: Optional[str] = None
+    intent: Optional[str] = None
+    sarcasm: Optional[bool] = None
+    confidence: Optional[float] = None
+    linked_users: Optional[List[str]] = None
+    created_at: Optional[float] = None
+    owner: Optional[str] = None
+
+class UsersResponse(BaseModel):
+    users: List[UserOut]
+    transactions: List[TransactionOut]
+
+class UserStatusResponse(BaseModel):
+    status: str
+    user: UserOut
+
+class ConfigResponse(BaseModel):
+    status: str
+    config: Optional[Dict[str, Any]] = None
+
+class QuotaResponse(BaseModel):
+    quota: Dict[str, Any]
+
+class QuotaStatusResponse(BaseModel):
+    status: str
+    quota: Dict[str, Any]
+
+class PaymentOrderResponse(BaseModel):
+    payment_url: Optional[str] = None
+    tracking_id: Optional[str] = None
+
+class PaymentStatusResponse(BaseModel):
+    status: str
+    payment_status: Optional[str] = None
+    plan: Optional[str] = None
+    message: Optional[str] = None
+
+class TicketStatusResponse(BaseModel):
+    status: str
+    ticket: TicketOut
+
+class ReplySentResponse(BaseModel):
+    status: str
+    data: Any = None
+
+class StatsResponse(BaseModel):
+    total: int
+    open: int
+    done: int
+
+class ReplyResponse(BaseModel):
+    reply: str
+    error: bool
+    cached: bool = False
+
+class ReplyVariantsResponse(BaseModel):
+    replies: Dict[str, str]
+    error: bool
+    cached: bool = False
+
+class PipelineTriggerResponse(BaseModel):
+    status: str
+    message: str
+    job_id: str
+    job_status: str
+
+class PipelineJobOut(BaseModel):
+    id: str
+    email: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class PipelineRunSummary(BaseModel):
+    id: str
+    kind: Optional[str] = None
+    owner: Optional[str] = None
+    started_at: Optional[float] = None
+    duration: Optional[float] = None
+    status: Optional[str] = None
+    counts: Dict[str, int] = {}
+
+class PipelineRunOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    kind: Optional[str] = None
+    owner: Optional[str] = None
+    started_at: Optional[float] = None
+    duration: Optional[float] = None
+    status: Optional[str] = None
+    report: Optional[Dict[str, Any]] = None
+
+def columns_for(model, dto) -> list:
+    """The ORM columns backing a DTO's fields, in field order, for `db.query(*columns)`."""
+    return [getattr(model, field) for field in dto.model_fields]
+
+def from_rows(dto, rows) -> list:
+    """Build DTOs straight from column tuples. Values come from typed columns, so validation is skipped."""
+    fields = list(dto.model_fields)
+    return [dto.model_construct(**dict(zip(fields, row))) for row in rows]
+
+USER_COLUMNS = columns_for(UserModel, UserOut)
+TRANSACTION_COLUMNS = columns_for(TransactionModel, TransactionOut)
+TICKET_COLUMNS = columns_for(TicketModel, TicketOut)
 
 # --- API Endpoints ---
 
-@app.get("/api/users")
+@app.get("/api/users", response_model=UsersResponse)
 def get_users(db: Session = Depends(get_db)):
-    # Mimic original behavior: return everything
-    users = db.query(UserModel).all()
-    transactions = db.query(TransactionModel).all()
-    return {"users": users, "transactions": transactions}
+    # Mimic original behavior: return everything (but only the columns the DTOs expose)
+    users = from_rows(UserOut, db.query(*USER_COLUMNS).all())
+    transactions = from_rows(TransactionOut, db.query(*TRANSACTION_COLUMNS).all())
+    return UsersResponse.model_construct(users=users, transactions=transactions)
 
-@app.post("/api/users/sync")
+@app.post("/api/users/sync", response_model=UserStatusResponse)
 def sync_user(user: UserDTO, db: Session = Depends(get_db)):
     # Check if user exists
     db_user = db.query(UserModel).filter(UserModel.email == user.email).first()
@@ -131,7 +381,7 @@ def sync_user(user: UserDTO, db: Session = Depends(get_db)):
     db.refresh(new_user)
     return {"status": "created", "user": new_user}
 
-@app.post("/api/users/config")
+@app.post("/api/users/config", response_model=ConfigResponse)
 def save_user_config(config: UserConfig, db: Session = Depends(get_db)):
     db_user = db.query(UserModel).filter(UserModel.email == config.email).first()
     if not db_user:
@@ -157,7 +407,7 @@ def save_user_config(config: UserConfig, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return {"status": "success", "config": db_user.config}
 
-@app.patch("/api/users/profile")
+@app.patch("/api/users/profile", response_model=UserStatusResponse)
 def update_profile(profile: ProfileUpdate, db: Session = Depends(get_db)):
     db_user = db.query(UserModel).filter(UserModel.email == profile.email).first()
     if not db_user:
@@ -167,7 +417,7 @@ def update_profile(profile: ProfileUpdate, db: Session = Depends(get_db)):
     db.commit()
     return {"status": "success", "user": db_user}
 
-@app.patch("/api/users/{email}/plan")
+@app.patch("/api/users/{email}/plan", response_model=UserStatusResponse)
 def update_user_plan(email: str, update: PlanUpdate, db: Session = Depends(get_db)):
     db_user = db.query(UserModel).filter(UserModel.email == email).first()
     if not db_user:
@@ -177,7 +427,7 @@ def update_user_plan(email: str, update: PlanUpdate, db: Session = Depends(get_d
     db.commit()
     return {"status": "success", "user": db_user}
 
-@app.post("/api/users/integrations")
+@app.post("/api/users/integrations", response_model=UserStatusResponse)
 def update_integration_status(update: IntegrationsUpdate, db: Session = Depends(get_db)):
     db_user = db.query(UserModel).filter(UserModel.email == update.email).first()
     if not db_user:
@@ -211,7 +461,7 @@ def update_integration_status(update: IntegrationsUpdate, db: Session = Depends(
     db.commit()
     return {"status": "success", "user": db_user}
 
-@app.post("/api/users/twitter-tokens")
+@app.post("/api/users/twitter-tokens", response_model=QuotaStatusResponse)
 def save_twitter_tokens(tokens: TwitterOAuthTokens, db: Session = Depends(get_db)):
     db_user = db.query(UserModel).filter(UserModel.email == tokens.email).first()
     if not db_user:
@@ -225,21 +475,6 @@ def save_twitter_tokens(tokens: TwitterOAuthTokens, db: Session = Depends(get_db
         "connected_at": time.time()
     }
     
-    # Initialize quota
-    searches_limit = 10 if db_user.plan == "Pro" else 0
-    tweets_limit = 100 if db_user.plan == "Pro" else 0
-    if db_user.plan == "Teams":
-        searches_limit = 20
-        tweets_limit = 200
-    
-    db_user.twitter_quota = {
-        "searches_today": 0,
-        "tweets_today": 0,
-        "searches_limit": searches_limit,
-        "tweets_limit": tweets_limit,
-        "last_reset": datetime.now().date().isoformat()
-    }
-    
     # Update connected_platforms
     platforms = list(db_user.connected_platforms or [])
     if "twitter" not in platforms:
@@ -247,41 +482,23 @@ def save_twitter_tokens(tokens: TwitterOAuthTokens, db: Session = Depends(get_db
         db_user.connected_platforms = platforms
         
     db.commit()
-    return {"status": "success", "quota": db_user.twitter_quota}
+    return {"status": "success", "quota": get_twitter_quota_snapshot(db_user.email, db_user.plan, db=db)}
 
-@app.post("/api/users/twitter-quota")
+@app.post("/api/users/twitter-quota", response_model=QuotaResponse)
 def get_twitter_quota(req: dict, db: Session = Depends(get_db)):
     email = req.get("email")
     db_user = db.query(UserModel).filter(UserModel.email == email).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
         
-    quota = dict(db_user.twitter_quota or {
-        "searches_today": 0,
-        "tweets_today": 0,
-        "searches_limit": 0,
-        "tweets_limit": 0,
-        "last_reset": datetime.now().date().isoformat()
-    })
-
-    # Check for reset
-    today = datetime.now().date().isoformat()
-    last_reset = quota.get("last_reset")
-    
-    if last_reset != today:
-        print(f"Resetting quota for {email} from {last_reset} to {today}")
-        quota["searches_today"] = 0
-        quota["tweets_today"] = 0
-        quota["last_reset"] = today
-        db_user.twitter_quota = quota
-        db.commit()
-    
+    # Counters are keyed by day, so reading them is all that's needed (no reset write)
+    quota = get_twitter_quota_snapshot(db_user.email, db_user.plan, db=db)
     return {"quota": quota}
 
 # --- PAYMENT ENDPOINTS ---
 from pesapal_manager import create_pesapal_order, get_transaction_status
 
-@app.post("/api/payment/upgrade")
+@app.post("/api/payment/upgrade", response_model=PaymentOrderResponse)
 def upgrade_user(req: UpgradeRequest, db: Session = Depends(get_db)):
     # 1. Create Recurring Details
     now = datetime.now()
@@ -370,7 +587,7 @@ def payment_callback(OrderTrackingId: str, OrderMerchantReference: str = None, d
 def payment_callback_public(OrderTrackingId: str, OrderMerchantReference: str = None, db: Session = Depends(get_db)):
     return payment_callback(OrderTrackingId, OrderMerchantReference, db)
 
-@app.get("/api/payment/verify")
+@app.get("/api/payment/verify", response_model=PaymentStatusResponse, response_model_exclude_none=True)
 def verify_payment(OrderTrackingId: str, db: Session = Depends(get_db)):
     status_data = get_transaction_status(OrderTrackingId)
     if not status_data:
@@ -404,7 +621,7 @@ def verify_payment(OrderTrackingId: str, db: Session = Depends(get_db)):
         "message": f"Payment status: {pesapal_status}"
     }
 
-@app.post("/api/payment/mock-success")
+@app.post("/api/payment/mock-success", response_model=PaymentStatusResponse, response_model_exclude_none=True)
 def mock_payment_success(req: UpgradeRequest, db: Session = Depends(get_db)):
     db_user = db.query(UserModel).filter(UserModel.email == req.email).first()
     if db_user:
@@ -415,18 +632,59 @@ def mock_payment_success(req: UpgradeRequest, db: Session = Depends(get_db)):
 
 # --- TICKET ENDPOINTS ---
 
-@app.get("/api/tickets")
-async def get_tickets(email: Optional[str] = None, db: Session = Depends(get_db)):
+# Sort keys accepted by /api/tickets; urgency sorts high -> low, then newest first
+TICKET_SORTS = {
+    "created_at": lambda desc: [TicketModel.created_at.desc() if desc else TicketModel.created_at.asc()],
+    "confidence": lambda desc: [TicketModel.confidence.desc().nulls_last() if desc else TicketModel.confidence.asc().nulls_last()],
+    "urgency": lambda desc: [
+        case({"high": 0, "medium": 1, "low": 2}, value=TicketModel.urgency, else_=2).asc() if desc
+        else case({"high": 0, "medium": 1, "low": 2}, value=TicketModel.urgency, else_=2).desc(),
+        TicketModel.created_at.desc(),
+    ],
+}
+
+@app.get("/api/tickets", response_model=List[TicketOut])
+async def get_tickets(
+    email: Optional[str] = None,
+    status: Optional[str] = None,
+    urgency: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    intent: Optional[str] = None,
+    type: Optional[str] = None,
+    sarcasm: Optional[bool] = None,
+    min_confidence: Optional[float] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    db: Session = Depends(get_db)
+):
+    if sort not in TICKET_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(TICKET_SORTS)}")
     try:
-        query = db.query(TicketModel)
+        # Plain column tuples: no ORM identity map or JSONB payloads for what can be thousands of rows
+        query = db.query(*TICKET_COLUMNS)
         if email:
             query = query.filter(TicketModel.owner == email)
-        tickets = query.all()
-        return tickets
+        # Equality filters on the typed analysis columns; owner + OPEN (+ high urgency) hit the partial indexes
+        if status:
+            query = query.filter(TicketModel.status == status.upper())
+        if urgency:
+            query = query.filter(TicketModel.urgency == urgency.lower())
+        if sentiment:
+            query = query.filter(TicketModel.sentiment == sentiment.lower())
+        if intent:
+            query = query.filter(TicketModel.intent == intent.lower())
+        if type:
+            query = query.filter(TicketModel.type == type.upper())
+        if sarcasm is not None:
+            query = query.filter(TicketModel.sarcasm == sarcasm)
+        if min_confidence is not None:
+            query = query.filter(TicketModel.confidence >= min_confidence)
+        rows = query.order_by(*TICKET_SORTS[sort](order != "asc")).all()
+        return from_rows(TicketOut, rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.patch("/api/tickets/{ticket_id}")
+@app.patch("/api/tickets/{ticket_id}", response_model=TicketStatusResponse)
 async def update_ticket(ticket_id: str, update: TicketUpdate, db: Session = Depends(get_db)):
     try:
         ticket = db.query(TicketModel).filter(TicketModel.id == ticket_id).first()
@@ -440,7 +698,7 @@ async def update_ticket(ticket_id: str, update: TicketUpdate, db: Session = Depe
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/tickets/{ticket_id}/reply")
+@app.post("/api/tickets/{ticket_id}/reply", response_model=ReplySentResponse)
 def send_reply(ticket_id: str, payload: ReplyPayload, db: Session = Depends(get_db)):
     try:
         # 1. Load Ticket
@@ -489,21 +747,17 @@ def send_reply(ticket_id: str, payload: ReplyPayload, db: Session = Depends(get_
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Reply Error: {e}")
+        logger.exception("Reply failed", extra={"ticket_id": ticket_id, "platform": payload.platform})
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/stats")
+@app.get("/api/stats", response_model=StatsResponse)
 async def get_stats(email: Optional[str] = None, db: Session = Depends(get_db)):
     try:
-        query = db.query(TicketModel)
+        query = db.query(func.count(TicketModel.id), func.count(TicketModel.id).filter(TicketModel.status == "DONE"))
         if email:
             query = query.filter(TicketModel.owner == email)
-            
-        # Optimization: use count queries instead of loading all objects
-        # But to be safe on logic match:
-        tickets = query.all()
-        total_count = len(tickets)
-        done_count = len([t for t in tickets if t.status == "DONE"])
+
+        total_count, done_count = query.one()
         open_count = total_count - done_count
         
         return {
@@ -514,14 +768,96 @@ async def get_stats(email: Optional[str] = None, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/generate-reply")
+@app.post("/api/generate-reply", response_model=ReplyResponse)
 def generate_reply_endpoint(req: ReplyRequest):
     try:
+        tone = req.draft_key()
+        if tone and not req.refresh:
+            draft = ticket_manager.get_draft(req.ticket_id, tone)
+            if draft:
+                return {"reply": draft, "error": False, "cached": True}
+
         result = llm_classifier.generate_reply(req.content, req.tone, req.context)
+        if tone and not result.get("error"):
+            ticket_manager.save_draft(req.ticket_id, tone, result["reply"])
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-@app.post("/api/pipeline/trigger")
+
+@app.post("/api/generate-reply/variants", response_model=ReplyVariantsResponse)
+def generate_reply_variants_endpoint(req: ReplyVariantsRequest):
+    """Replies in several tones from one Gemini call; tones already drafted for the ticket are served from it."""
+    try:
+        tones = list(dict.fromkeys(req.tones or llm_classifier.DEFAULT_REPLY_TONES))[:llm_classifier.MAX_REPLY_VARIANTS]
+        # Like single drafts, replies written for custom context aren't stored
+        use_drafts = bool(req.ticket_id and not req.context)
+
+        replies = {}
+        if use_drafts and not req.refresh:
+            drafts = ticket_manager.get_drafts(req.ticket_id)
+            replies = {tone: drafts[tone] for tone in tones if drafts.get(tone)}
+
+        missing = [tone for tone in tones if tone not in replies]
+        if not missing:
+            return {"replies": replies, "error": False, "cached": True}
+
+        result = llm_classifier.generate_reply_variants(req.content, missing, req.context)
+        if use_drafts:
+            ticket_manager.save_drafts(req.ticket_id, result["replies"])
+        return {"replies": {**replies, **result["replies"]}, "error": result["error"], "cached": False}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/generate-reply/hedging", response_model=Dict[str, Any])
+def get_reply_hedging_stats():
+    """Served vs. unhedged reply latency percentiles, and the extra Gemini calls hedging cost."""
+    return llm_classifier.gemini_client.hedge_stats.snapshot()
+
+@app.post("/api/generate-reply/stream")
+async def generate_reply_stream(req: ReplyRequest, request: Request):
+    """Relays Gemini's reply tokens over Server-Sent Events as they arrive."""
+    tone = req.draft_key()
+    draft = None
+    if tone and not req.refresh:
+        draft = await run_in_threadpool(ticket_manager.get_draft, req.ticket_id, tone)
+
+    if draft:
+        async def cached_events():
+            yield f"data: {json.dumps({'text': draft, 'cached': True})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    chunks = llm_classifier.stream_reply(req.content, req.tone, req.context)
+
+    async def events():
+        text = []
+        try:
+            async for chunk in iterate_in_threadpool(chunks):
+                if await request.is_disconnected():
+                    break
+                text.append(chunk)
+                yield f"data: {json.dumps({'text': chunk})}\n\n"
+            else:
+                # Only complete replies are stored; an abandoned stream is regenerated next time
+                if tone and text:
+                    await run_in_threadpool(ticket_manager.save_draft, req.ticket_id, tone, "".join(text).strip())
+                yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            # Client went away (or we finished): close the upstream Gemini request
+            try:
+                chunks.close()
+            except ValueError:
+                pass  # Still running in a worker thread; it closes when that read returns
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/pipeline/trigger", response_model=PipelineTriggerResponse)
 async def trigger_pipeline(payload: Dict[str, str], db: Session = Depends(get_db)):
     email = payload.get("email")
     if not email:
@@ -532,29 +868,54 @@ async def trigger_pipeline(payload: Dict[str, str], db: Session = Depends(get_db
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    import subprocess
-    import sys
-    
-    # Run the pipeline script in the background (or foreground for feedback)
-    # Using sys.executable to ensure we use the same python env
-    try:
-        # We run it detached or wait? For "Scan Now" user probably waits a bit or we return "Started"
-        # Let's run it synchronously for immediate feedback since it's a "Scan Now" action
-        # But for real prod, background task is better. 
-        # Given the scope, let's run it with a timeout or let it run.
-        # Actually, let's just trigger it and return success.
-        
-        # We need to find the script path.
-        script_path = os.path.join(os.path.dirname(__file__), "..", "execution", "run_user_pipeline.py")
-        
-        # We use Popen to run in background
-        subprocess.Popen([sys.executable, script_path, "--user_id", email])
-        
-        return {"status": "success", "message": "Pipeline started in background"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
+    # Queue onto the warm worker pool; repeat clicks while a scan is pending reuse it
+    job = pipeline_jobs.submit(email)
+    message = "Scan already in progress" if job["coalesced"] else "Pipeline started in background"
+    return {"status": "success", "message": message, "job_id": job["id"], "job_status": job["status"]}
+
+@app.get("/api/pipeline/jobs/{job_id}", response_model=PipelineJobOut)
+def get_pipeline_job(job_id: str):
+    job = pipeline_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/pipeline/runs", response_model=List[PipelineRunSummary])
+def list_pipeline_runs(email: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db)):
+    """Recent traced pipeline runs, newest first; `email` narrows to single-user scans."""
+    # Only the counts are read out of each report, not the whole JSONB document
+    query = db.query(
+        PipelineRun.id, PipelineRun.kind, PipelineRun.owner, PipelineRun.started_at,
+        PipelineRun.duration, PipelineRun.status, PipelineRun.report["counts"],
+    )
+    if email:
+        query = query.filter(PipelineRun.owner == email)
+    rows = query.order_by(PipelineRun.started_at.desc()).limit(min(max(limit, 1), 100)).all()
+    return [
+        PipelineRunSummary.model_construct(
+            id=run_id, kind=kind, owner=owner, started_at=started_at, duration=duration, status=status, counts=counts or {}
+        )
+        for run_id, kind, owner, started_at, duration, status, counts in rows
+    ]
+
+@app.get("/api/pipeline/runs/{run_id}", response_model=PipelineRunOut)
+def get_pipeline_run(run_id: str, db: Session = Depends(get_db)):
+    """Full report of one run: per-stage timings, per-tenant breakdown and the slowest items."""
+    run = db.query(PipelineRun).filter(PipelineRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+def profile_sync_endpoints():
+    """Sync endpoints run in the threadpool, out of the middleware's profiler; let them join a profiled request."""
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not asyncio.iscoroutinefunction(route.dependant.call):
+            route.dependant.call = profiling.threaded(route.dependant.call)
+
+profile_sync_endpoints()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # log_config=None: uvicorn's loggers go through our handlers instead of its own
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, ARRAY
+from sqlalchemy import Column, String, Integer, Float, Boolean, Date, ForeignKey, ARRAY, Index, text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from database import Base
 
@@ -17,7 +17,13 @@ class User(Base):
 
 class Ticket(Base):
     __tablename__ = "tickets"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        Index("ix_tickets_owner_created", "owner", "created_at"),
+        # The dashboard's default views: open tickets, and open high-urgency tickets
+        Index("ix_tickets_owner_open", "owner", "created_at", postgresql_where=text("status = 'OPEN'")),
+        Index("ix_tickets_owner_open_high", "owner", "created_at", postgresql_where=text("status = 'OPEN' AND urgency = 'high'")),
+        {"extend_existing": True},
+    )
     
     id = Column(String, primary_key=True, index=True)
     source_id = Column(String)
@@ -29,6 +35,13 @@ class Ticket(Base):
     created_at = Column(Float, default=0.0)
     notified = Column(Boolean, default=False)
     owner = Column(String, ForeignKey("users.email"))
+    drafts = Column(JSONB, default={})  # Reply drafts keyed by tone, generated on first open
+    # Classification of the post that opened the ticket
+    sentiment = Column(String)
+    intent = Column(String)
+    sarcasm = Column(Boolean)
+    confidence = Column(Float)
+    analysis = Column(JSONB, default={})
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -39,3 +52,28 @@ class Transaction(Base):
     email = Column(String, ForeignKey("users.email"))
     status = Column(String)
     created_at = Column(Float, default=0.0)
+
+class UsageCounter(Base):
+    __tablename__ = "usage_counters"
+    __table_args__ = {"extend_existing": True}
+    
+    # One row per user/resource/day; a new day is a new key, so quotas reset implicitly
+    email = Column(String, primary_key=True)
+    resource = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    n = Column(Integer, nullable=False, default=0)
+
+class PipelineRun(Base):
+    __tablename__ = "pipeline_runs"
+    __table_args__ = (
+        Index("ix_pipeline_runs_owner_started", "owner", "started_at"),
+        {"extend_existing": True},
+    )
+    
+    id = Column(String, primary_key=True)
+    kind = Column(String)  # run_user_pipeline
+    owner = Column(String)  # Tenant for single-tenant runs, NULL for all-tenant runs
+    started_at = Column(Float)
+    duration = Column(Float)
+    status = Column(String)  # success, failed
+    report = Column(JSONB, default={})  # tracing.Trace.report()
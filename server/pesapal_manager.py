@@ -4,9 +4,13 @@ import uuid
 import time
 import logging
 import os
+import sys
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Outbound call metrics are shared with the pipeline, in execution/
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "execution"))
+import metrics
+
+# Handlers and levels come from log_config.setup() in the API process
 logger = logging.getLogger("pesapal")
 
 # Configuration (loaded from environment variables)
@@ -47,7 +51,7 @@ class PesapalService:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = metrics.timed_request(metrics.PESAPAL, requests.post, url, json=payload, headers=headers)
             response.raise_for_status()
             data = response.json()
             
@@ -91,7 +95,7 @@ class PesapalService:
         try:
              # Check if we already have one cached/saved? 
              # For now, let's just log it. In production, save this ID.
-             response = requests.post(url, json=payload, headers=headers)
+             response = metrics.timed_request(metrics.PESAPAL, requests.post, url, json=payload, headers=headers)
              response.raise_for_status()
              data = response.json()
              return data.get("ipn_id")
@@ -151,23 +155,24 @@ class PesapalService:
         }
 
         try:
-            logger.info(f"Submitting order to: {url}")
-            logger.info(f"Payload: {payload}")
-            response = requests.post(url, json=payload, headers=headers)
-            logger.info(f"Response status: {response.status_code}")
-            logger.info(f"Response body: {response.text}")
+            response = metrics.timed_request(metrics.PESAPAL, requests.post, url, json=payload, headers=headers)
+            logger.info("Order submitted", extra={"merchant_reference": merchant_reference, "status": response.status_code})
+            # Full bodies carry billing details; only at DEBUG
+            logger.debug("Order payload", extra={"payload": payload, "response": response.text})
             response.raise_for_status()
             data = response.json()
-            logger.info(f"Parsed data: {data}")
             return {
                 "order_tracking_id": data.get("order_tracking_id"),
                 "merchant_reference": merchant_reference,
                 "redirect_url": data.get("redirect_url") 
             }
         except Exception as e:
-            logger.error(f"Error submitting order: {type(e).__name__}: {e}")
-            logger.error(f"Response status: {response.status_code if 'response' in locals() else 'N/A'}")
-            logger.error(f"Response text: {response.text if 'response' in locals() else 'N/A'}")
+            logger.error(f"Error submitting order: {type(e).__name__}: {e}", extra={
+                "merchant_reference": merchant_reference,
+                "status": response.status_code if 'response' in locals() else None,
+            })
+            if 'response' in locals():
+                logger.debug("Order error response", extra={"response": response.text})
             # FALBACK FOR DEV WITHOUT CREDENTIALS
             if CONSUMER_KEY == "your_consumer_key_here":
                 logger.info("Using MOCK implementation due to missing credentials")
@@ -194,7 +199,7 @@ class PesapalService:
         headers = {"Authorization": f"Bearer {token}"}
         
         try:
-            response = requests.get(url, headers=headers)
+            response = metrics.timed_request(metrics.PESAPAL, requests.get, url, headers=headers)
             return response.json()
         except Exception as e:
             logger.error(f"Error getting status: {e}")